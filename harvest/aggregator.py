@@ -0,0 +1,193 @@
+# Builtins
+import re
+from typing import Dict, List
+
+# External libraries
+import numpy as np
+import pandas as pd
+
+FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+def interval_to_ns(interval: str) -> int:
+    """Converts an interval string like '5MIN' or '1HR' into nanoseconds."""
+    val = int(re.sub("[^0-9]", "", interval))
+    if interval[-1] == 'N':
+        return val * 60 * 10**9
+    elif interval[-1] == 'R':
+        return val * 3600 * 10**9
+    else:
+        return val * 86400 * 10**9
+
+class _Bucket:
+    """Running candle of the bucket that is currently open.
+    The last bar is kept separately from the rest, so that it can be
+    replaced when the broker sends an updated version of it.
+    """
+
+    __slots__ = ['start', 'prefix', 'last', 'last_ts']
+
+    def __init__(self) -> None:
+        self.start = None     # Timestamp (ns) of the bucket
+        self.prefix = None    # Candle of all bars in the bucket except the last one
+        self.last = None      # The last bar, as [open, high, low, close, volume]
+        self.last_ts = None   # Timestamp (ns) of the last bar
+
+    def update(self, start: int, ts: int, bar: np.ndarray) -> bool:
+        """Folds bar into the bucket. Returns False if the bar is older than the
+        last bar seen, in which case it is ignored.
+        """
+        if start != self.start:
+            if self.start is not None and start < self.start:
+                return False
+            self.start = start
+            self.prefix = None
+        elif ts < self.last_ts:
+            return False
+        elif ts > self.last_ts:
+            self.prefix = self.candle()
+        self.last = bar
+        self.last_ts = ts
+        return True
+
+    def candle(self) -> List[float]:
+        last = self.last
+        if self.prefix is None:
+            return [last[0], last[1], last[2], last[3], last[4]]
+        prefix = self.prefix
+        return [prefix[0], max(prefix[1], last[1]), min(prefix[2], last[2]), last[3], prefix[4] + last[4]]
+
+class Aggregator:
+    """Aggregates candles as they arrive, and writes the results to the Queue.
+
+    For each symbol and target interval, the aggregator keeps the open, high, low,
+    close and volume of the bucket that is currently open. Each incoming candle
+    updates them in O(1), and the candle of the bucket is written into the Queue,
+    either overwriting the last candle or appending a new one.
+    The results are the same as Trader.aggregate_df, excluding empty buckets.
+    """
+
+    def __init__(self, queue) -> None:
+        self.queue = queue
+        self.buckets = {}   # symbol -> {interval -> _Bucket}
+        self.freq = {}      # interval -> length of the interval in ns
+
+    def init_symbol(self, symbol: str, interval: str, aggregations: List[str]) -> None:
+        """Starts aggregating symbol from interval into each interval in aggregations.
+        The state is seeded from the candles already in the queue.
+        """
+        self.buckets[symbol] = {}
+        for agg in aggregations:
+            self.freq[agg] = interval_to_ns(agg)
+            self.buckets[symbol][agg] = _Bucket()
+
+        buf = self.queue.queue[symbol][interval]
+        if len(buf) == 0:
+            return
+        index = buf.index[buf.start:buf.end].astype('int64')
+        data = buf.data[buf.start:buf.end][:, [buf.columns.index(f) for f in FIELDS]]
+        for agg, bucket in self.buckets[symbol].items():
+            freq = self.freq[agg]
+            start = index[-1] - index[-1] % freq
+            for i in range(np.searchsorted(index, start), len(index)):
+                bucket.update(start, index[i], data[i])
+
+    def update(self, symbol: str, df: pd.DataFrame) -> None:
+        """Folds the candles in df into the aggregated candles of symbol.
+
+        :df: A dataframe in the same format as returned by BaseBroker._handler()
+        """
+        if not symbol in self.buckets or df.empty:
+            return
+        index = df.index.values.astype('int64')
+        data = df[symbol][FIELDS].to_numpy(dtype=float)
+        for agg, bucket in self.buckets[symbol].items():
+            freq = self.freq[agg]
+            updated = False
+            for i in range(len(index)):
+                ts = index[i]
+                start = ts - ts % freq
+                if bucket.update(start, ts, data[i]):
+                    self._write(symbol, agg, bucket)
+                    updated = True
+            if updated:
+                self.queue.set_symbol_interval_update(symbol, agg, self.queue.get_last_symbol_interval_timestamp(symbol, agg))
+
+    def _write(self, symbol: str, interval: str, bucket: _Bucket) -> None:
+        buf = self.queue.queue[symbol][interval]
+        candle = bucket.candle()
+        if buf.columns is None:
+            # Nothing has been aggregated yet, so the layout of the buffer is unknown
+            df = pd.DataFrame([candle], columns=FIELDS, index=pd.to_datetime([bucket.start], utc=True))
+            df.columns = pd.MultiIndex.from_product([[symbol], FIELDS])
+            buf.set(df)
+            return
+        row = [candle[FIELDS.index(c)] for c in buf.columns]
+        buf.append_row(np.datetime64(int(bucket.start), 'ns'), row, True)
+
+def _sparse_table(arr: np.ndarray, levels: int, op) -> np.ndarray:
+    """Builds a table where row k holds op over the 2**k elements starting at each position."""
+    n = len(arr)
+    table = np.empty((levels + 1, n), dtype=arr.dtype)
+    table[0] = arr
+    for k in range(1, levels + 1):
+        half = 1 << (k - 1)
+        table[k] = table[k - 1]
+        table[k, :n - half] = op(table[k - 1, :n - half], table[k - 1, half:])
+    return table
+
+def _range_query(table: np.ndarray, first: np.ndarray, last: np.ndarray, op) -> np.ndarray:
+    """Applies op over arr[first[i]:last[i]+1] for every i, using a table from _sparse_table."""
+    k = np.floor(np.log2(last - first + 1)).astype(int)
+    return op(table[k, first], table[k, last - (1 << k) + 1])
+
+def rolling_candles(df: pd.DataFrame, interval: str, points: int) -> pd.DataFrame:
+    """For every candle in df, computes the candle of interval as of that candle.
+    In other words, the i-th row is the result of aggregating the last points rows
+    up to and including row i, and taking the last (possibly incomplete) candle.
+    This is done for all rows at once, with no Python-level loop over the rows.
+
+    :df: A dataframe in the same format as returned by BaseBroker._handler(), sorted by time
+    :interval: The interval to aggregate to
+    :points: The number of candles in df that make up one candle of interval
+    :returns: A dataframe with the same number of rows as df, indexed by the timestamp of each aggregated candle
+    """
+    sym = df.columns.get_level_values(0)[0]
+    n = len(df.index)
+    if n == 0:
+        return pd.DataFrame(columns=pd.MultiIndex.from_product([[sym], FIELDS]))
+    if points <= 0:
+        points = n
+
+    ts = df.index.values.astype('int64')
+    freq = interval_to_ns(interval)
+    bucket = ts - ts % freq
+
+    # Each candle is aggregated from the start of its bucket, or from 
+    # points candles back, whichever is later
+    pos = np.arange(n)
+    change = np.empty(n, dtype=bool)
+    change[0] = True
+    change[1:] = bucket[1:] != bucket[:-1]
+    first = np.maximum.accumulate(np.where(change, pos, 0))
+    first = np.maximum(first, pos - points + 1)
+
+    data = df[sym]
+    high = data['high'].to_numpy(dtype=float)
+    low = data['low'].to_numpy(dtype=float)
+    volume = np.nan_to_num(data['volume'].to_numpy(dtype=float))
+    levels = int(np.floor(np.log2(np.max(pos - first + 1))))
+    cum_volume = np.concatenate([[0.0], np.cumsum(volume)])
+
+    result = pd.DataFrame({
+        'open': data['open'].to_numpy(dtype=float)[first],
+        'high': _range_query(_sparse_table(high, levels, np.fmax), first, pos, np.fmax),
+        'low': _range_query(_sparse_table(low, levels, np.fmin), first, pos, np.fmin),
+        'close': data['close'].to_numpy(dtype=float),
+        'volume': cum_volume[pos + 1] - cum_volume[first],
+    })
+    index = pd.DatetimeIndex(bucket.astype('datetime64[ns]'))
+    if df.index.tz is not None:
+        index = index.tz_localize('UTC').tz_convert(df.index.tz)
+    result.index = index
+    result.columns = pd.MultiIndex.from_product([[sym], FIELDS])
+    return result
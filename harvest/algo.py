@@ -1,14 +1,18 @@
 # Builtins
 from datetime import timedelta
 import datetime as dt
+import inspect
 from logging import critical, error, info, warning, debug
-from typing import Any, List, Tuple 
+from typing import Any, Dict, List, Tuple 
 
 # External libraries
-from finta import TA
 import numpy as np
 import pandas as pd
 
+# Submodule imports
+import harvest.indicators as indicators
+import harvest.options as options
+
 class BaseAlgo:
     """The Algo class is where the algorithm resides. 
     It provides an interface to monitor stocks and place orders. 
@@ -18,9 +22,16 @@ class BaseAlgo:
     def __init__(self):
         self.watch = []
         self.trader = None # Allows algo to handle the case when runs without a trader
+        self.indicators = {} # Indicators that are being calculated incrementally
+        self.memo = {} # (symbol, interval) -> (queue version, results of indicator calls)
 
     def setup(self, trader) -> None:
+        # Indicators of a previous run are detached, so the queue stops updating them
+        for key, ind in self.indicators.items():
+            self.trader.queue.unsubscribe(key[1], key[2], ind)
         self.trader = trader
+        self.indicators = {}
+        self.memo = {}
 
     def algo_init(self):
         pass
@@ -169,90 +180,137 @@ class BaseAlgo:
             }
         """ 
         return self.trader.fetch_option_market_data(symbol)
+
+    def get_chain_greeks(self, symbol: str, sigma: Any=None, prices: Any=None, r: float=0.0, q: float=0.0) -> pd.DataFrame:
+        """Prices the option chain of symbol with the Black-Scholes model, using the latest
+        price of symbol in the trader's queue. This is calculated locally for the whole chain,
+        so contracts can be screened without fetching a quote for each of them.
+        See harvest.options.chain_greeks() for details.
+
+        :symbol: symbol of stock
+        :sigma: Volatility to price the options with
+        :prices: Market prices of the options, to calculate implied volatilities from instead
+        :returns: The dataframe returned by get_chain_data(), with the columns price, iv, 
+            delta, gamma, theta, and vega added
+        """
+        chain = self.get_chain_data(symbol)
+        return options.chain_greeks(chain, self.get_price(symbol), self.trader.timestamp, sigma, prices, r, q)
     
     ########## Technical Indicaters ###############
 
-    def use_trader_prices(func):
-        def wrap(*args, **kwargs):
-            self = args[0]
-            if self.trader is None:
-                return func(*args, **kwargs)
-            else:
-                prices = self.trader.queue.get_symbol_interval_prices(kwargs['symbol'], kwargs['interval'], kwargs['ref'])
-                return func(prices, *args, **kwargs)
-        return wrap
+    def use_trader_prices(indicator):
+        """Decorator for the technical indicator functions. 
 
+        If prices are not specified and the algo is run by a trader, the indicator is
+        calculated incrementally from the prices in the trader's queue instead. 
+        The first call for a given symbol, interval, ref, and set of parameters 
+        subscribes an indicator to the queue, which is then updated as each new candle 
+        arrives. 
+        
+        Results are memoized until the queue of the symbol and interval is next written to, 
+        so repeated calls within the same tick return the same arrays. The version of the 
+        queue is used instead of the timestamp of the last candle, since aggregated candles 
+        are overwritten under the same timestamp until they are complete.
 
-    @use_trader_prices 
-    def rsi(self, prices, symbol: str=None, period: int=14, interval: str='5MIN', ref: str='close') -> np.array:
+        :indicator: The class in harvest.indicators that calculates the indicator incrementally.
+        """
+        def decorator(func):
+            sig = inspect.signature(func)
+            def wrap(*args, **kwargs):
+                bound = sig.bind(*args, **kwargs)
+                bound.apply_defaults()
+                params = dict(bound.arguments)
+                self = params.pop('self')
+                prices = params.pop('prices')
+                if prices is not None or self.trader is None:
+                    return func(*args, **kwargs)
+
+                symbol = params.pop('symbol')
+                if symbol == None:
+                    symbol = self.watch[0]
+                interval = params.pop('interval')
+                ref = params.pop('ref')
+
+                queue = self.trader.queue
+                version = queue.get_symbol_interval_version(symbol, interval)
+                memo = self.memo.get((symbol, interval))
+                if memo is None or memo[0] != version:
+                    memo = (version, {})
+                    self.memo[(symbol, interval)] = memo
+
+                key = (indicator.__name__, ref) + tuple(params.items())
+                if not key in memo[1]:
+                    ind = self._get_indicator(indicator, symbol, interval, ref, **params)
+                    count = len(queue.get_symbol_interval_array(symbol, interval, ref))
+                    memo[1][key] = ind.values(count)
+                return memo[1][key]
+            wrap.__doc__ = func.__doc__
+            return wrap
+        return decorator
+
+    def _get_indicator(self, cls, symbol: str, interval: str, ref: str, **params) -> indicators.Indicator:
+        """Returns the indicator that is subscribed to the given queue, creating it if needed.
+        Indicators that an indicator is built from are created through this method as well,
+        so that they are shared, e.g. the SMA of bbands() is the same as the one of sma().
+        """
+        key = (cls.__name__, symbol, interval, ref, tuple(sorted(params.items())))
+        if not key in self.indicators:
+            get = lambda source, **p: self._get_indicator(source, symbol, interval, ref, **p)
+            # Sources are subscribed first, so the queue updates them before this indicator.
+            # Indicators keep as many values as the queue does.
+            ind = cls.create(get, maxlen=self.trader.queue.maxlen, **params)
+            self.trader.queue.subscribe(symbol, interval, ref, ind)
+            self.indicators[key] = ind
+        return self.indicators[key]
+
+    @use_trader_prices(indicators.RSI)
+    def rsi(self, prices: List[float]=None, symbol: str=None, period: int=14, interval: str='5MIN', ref: str='close') -> np.array:
         """Calculate RSI
 
+        :prices:    List of prices to perform calculation on. If not specified,
+                    prices in the trader's queue are used and the RSI is updated incrementally
         :symbol:    Symbol to perform calculation on 
         :period:    Period of RSI
         :interval:  Interval to perform the calculation
         :ref:       'close', 'open', 'high', or 'low'
         :returns: A list in numpy format, containing RSI values
         """
-        if symbol == None:
-            symbol = self.watch[0]
-
-        ohlc = pd.DataFrame({
-            'close': np.array(prices),
-            'open': np.zeros(len(prices)),
-            'high': np.zeros(len(prices)),
-            'low': np.zeros(len(prices)),
-        })
-        rsi = TA.RSI(ohlc, period=period).to_numpy()
-        return rsi
+        return indicators.rsi(prices, period)
     
-    @use_trader_prices 
-    def sma(self, prices, symbol: str=None, period: int=14, interval: str='5MIN', ref: str='close') -> np.array:
+    @use_trader_prices(indicators.SMA)
+    def sma(self, prices: List[float]=None, symbol: str=None, period: int=14, interval: str='5MIN', ref: str='close') -> np.array:
         """Calculate SMA
 
+        :prices:    List of prices to perform calculation on. If not specified,
+                    prices in the trader's queue are used and the SMA is updated incrementally
         :symbol:    Symbol to perform calculation on 
         :period:    Period of SMA
         :interval:  Interval to perform the calculation
         :ref:       'close', 'open', 'high', or 'low'
         :returns: A list in numpy format, containing SMA values
         """
-        if symbol == None:
-            symbol = self.watch[0]
-
-        ohlc = pd.DataFrame({
-            'close': np.array(prices),
-            'open': np.zeros(len(prices)),
-            'high': np.zeros(len(prices)),
-            'low': np.zeros(len(prices)),
-        })
-        sma = TA.SMA(ohlc, period=period).to_numpy()
-        return sma
+        return indicators.sma(prices, period)
     
-    @use_trader_prices 
-    def ema(self, prices, symbol: str=None, period: int=14, interval: str='5MIN', ref: str='close') -> np.array:
+    @use_trader_prices(indicators.EMA)
+    def ema(self, prices: List[float]=None, symbol: str=None, period: int=14, interval: str='5MIN', ref: str='close') -> np.array:
         """Calculate EMA
 
+        :prices:    List of prices to perform calculation on. If not specified,
+                    prices in the trader's queue are used and the EMA is updated incrementally
         :symbol:    Symbol to perform calculation on 
         :period:    Period of EMA
         :interval:  Interval to perform the calculation
         :ref:       'close', 'open', 'high', or 'low'
         :returns: A list in numpy format, containing EMA values
         """
-        if symbol == None:
-            symbol = self.watch[0]
-
-        ohlc = pd.DataFrame({
-            'close': np.array(prices),
-            'open': np.zeros(len(prices)),
-            'high': np.zeros(len(prices)),
-            'low': np.zeros(len(prices)),
-        })
-        ema = TA.EMA(ohlc, period=period).to_numpy()
-        return ema
+        return indicators.ema(prices, period)
     
-    @use_trader_prices 
-    def bbands(self, prices, symbol: str=None, period: int=14, interval: str='5MIN', ref: str='close', dev: float=1.0) -> Tuple[np.array, np.array, np.array]:
+    @use_trader_prices(indicators.BBands)
+    def bbands(self, prices: List[float]=None, symbol: str=None, period: int=14, interval: str='5MIN', ref: str='close', dev: float=1.0) -> Tuple[np.array, np.array, np.array]:
         """Calculate Bollinger Bands
 
+        :prices:    List of prices to perform calculation on. If not specified,
+                    prices in the trader's queue are used and the bands are updated incrementally
         :symbol:    Symbol to perform calculation on 
         :period:    Period of BBand
         :interval:  Interval to perform the calculation
@@ -260,18 +318,7 @@ class BaseAlgo:
         :dev:       Standard deviation of the bands
         :returns: A tuple of numpy lists, each a list of BBand top, average, and bottom values
         """
-        if symbol == None:
-            symbol = self.watch[0]
-
-        ohlc = pd.DataFrame({
-            'close': np.array(prices),
-            'open': np.zeros(len(prices)),
-            'high': np.zeros(len(prices)),
-            'low': np.zeros(len(prices)),
-        })
-
-        t, m, b = TA.BBANDS(ohlc, period=period, std_multiplier=dev, MA=TA.SMA(ohlc, period)).T.to_numpy()
-        return t, m, b
+        return indicators.bbands(prices, period, dev)
     
     def bbands_raw(self, arr: List[float]=[], period: int=14, dev: float=1.0) -> Tuple[np.array, np.array, np.array]:
         """Calculate Bollinger Bands using given data
@@ -284,14 +331,77 @@ class BaseAlgo:
         :dev:       Standard deviation of the bands
         :returns: A tuple of numpy lists, each a list of BBand top, average, and bottom values
         """
-        ohlc = pd.DataFrame({
-            'close': np.array(arr),
-            'open': np.zeros(len(arr)),
-            'high': np.zeros(len(arr)),
-            'low': np.zeros(len(arr)),
-        })
-        t, m, b = TA.BBANDS(ohlc, period=period, std_multiplier=dev, MA=TA.SMA(ohlc, period)).T.to_numpy()
-        return t, m, b
+        return indicators.bbands(arr, period, dev)
+
+    def get_price_matrix(self, interval: str='5MIN', ref: str='close') -> Tuple[List[str], np.ndarray]:
+        """Stacks the prices of every symbol in the watchlist into a single 2D array. 
+        Each row holds the prices of one symbol, aligned so that the latest prices are 
+        in the last column. Rows of symbols with less data are padded with NaN at the start.
+
+        :interval:  Interval of data
+        :ref:       'close', 'open', 'high', or 'low'
+        :returns: A tuple of the list of symbols and the array of prices
+        """
+        symbols = list(self.watch)
+        columns = [self.trader.queue.get_symbol_interval_array(s, interval, ref) for s in symbols]
+        length = max([len(c) for c in columns], default=0)
+        prices = np.full((len(symbols), length), np.nan)
+        for i, c in enumerate(columns):
+            prices[i, length - len(c):] = c
+        return symbols, prices
+
+    def _indicator_all(self, func, interval: str, ref: str, *args) -> Dict[str, Any]:
+        """Calculates an indicator for every symbol in the watchlist in one vectorized pass,
+        and splits the results back by symbol, removing the padding.
+        """
+        symbols, prices = self.get_price_matrix(interval, ref)
+        out = func(prices, *args)
+        length = prices.shape[1]
+        counts = [len(self.trader.queue.get_symbol_interval_array(s, interval, ref)) for s in symbols]
+        if isinstance(out, tuple):
+            return {s: tuple(o[i, length - n:] for o in out) for i, (s, n) in enumerate(zip(symbols, counts))}
+        return {s: out[i, length - n:] for i, (s, n) in enumerate(zip(symbols, counts))}
+
+    def rsi_all(self, period: int=14, interval: str='5MIN', ref: str='close') -> Dict[str, np.array]:
+        """Calculate RSI of every symbol in the watchlist at once
+
+        :period:    Period of RSI
+        :interval:  Interval to perform the calculation
+        :ref:       'close', 'open', 'high', or 'low'
+        :returns: A dictionary mapping each symbol to a list in numpy format, containing RSI values
+        """
+        return self._indicator_all(indicators.rsi, interval, ref, period)
+
+    def sma_all(self, period: int=14, interval: str='5MIN', ref: str='close') -> Dict[str, np.array]:
+        """Calculate SMA of every symbol in the watchlist at once
+
+        :period:    Period of SMA
+        :interval:  Interval to perform the calculation
+        :ref:       'close', 'open', 'high', or 'low'
+        :returns: A dictionary mapping each symbol to a list in numpy format, containing SMA values
+        """
+        return self._indicator_all(indicators.sma, interval, ref, period)
+
+    def ema_all(self, period: int=14, interval: str='5MIN', ref: str='close') -> Dict[str, np.array]:
+        """Calculate EMA of every symbol in the watchlist at once
+
+        :period:    Period of EMA
+        :interval:  Interval to perform the calculation
+        :ref:       'close', 'open', 'high', or 'low'
+        :returns: A dictionary mapping each symbol to a list in numpy format, containing EMA values
+        """
+        return self._indicator_all(indicators.ema, interval, ref, period)
+
+    def bbands_all(self, period: int=14, interval: str='5MIN', ref: str='close', dev: float=1.0) -> Dict[str, Tuple[np.array, np.array, np.array]]:
+        """Calculate Bollinger Bands of every symbol in the watchlist at once
+
+        :period:    Period of BBand
+        :interval:  Interval to perform the calculation
+        :ref:       'close', 'open', 'high', or 'low'
+        :dev:       Standard deviation of the bands
+        :returns: A dictionary mapping each symbol to a tuple of numpy lists, each a list of BBand top, average, and bottom values
+        """
+        return self._indicator_all(indicators.bbands, interval, ref, period, dev)
 
     ############### Getters for Trader properties #################
 
@@ -301,12 +411,10 @@ class BaseAlgo:
         :symbol:  Symbol of asset
         :returns: Quantity of asset. 0 if asset is not owned. 
         """
-        search = self.trader.stock_positions + self.trader.crypto_positions
-        if not any([p['symbol'] == symbol for p in search]):
+        pos = self.trader.book.get_position(symbol)
+        if pos is None:
             return None
-        for p in search:
-            if p['symbol'] == symbol:
-                return p['quantity']
+        return pos['quantity']
     
     def get_cost(self, symbol) -> float:
         """Returns the average cost of a specified asset. 
@@ -314,24 +422,18 @@ class BaseAlgo:
         :symbol:  Symbol of asset
         :returns: Average cost of asset. Returns None if asset is not being tracked.
         """
-        if len(symbol) <= 6:
-            search = self.trader.stock_positions + self.trader.crypto_positions
-            for p in search:
-                if p['symbol'] == symbol:
-                    return p['avg_price']
+        pos = self.trader.book.get_position(symbol)
+        if pos is None:
             return None
-        else:
-            for p in self.trader.option_positions:
-                if p['occ_symbol'] == symbol:
-                    return p['avg_price']
+        return pos['avg_price']
 
     def get_price(self, symbol: str) -> float:
         if len(symbol) <= 6:
             return self.trader.queue.get_last_symbol_interval_price(symbol, self.fetch_interval, 'close')
         else:
-            for p in self.trader.option_positions:
-                if p['occ_symbol'] == symbol:
-                    return p['current_price']
+            pos = self.trader.book.options.get(symbol)
+            if pos is not None:
+                return pos['current_price']
     
     def get_candle(self, symbol: str) -> pd.DataFrame():
         if len(symbol) <= 6:
@@ -340,9 +442,13 @@ class BaseAlgo:
             raise Exception("Candles not available for options")
     
     def get_candle_list(self, symbol, interval=None):
+        """Returns a dataframe of recent candles for an asset. 
+        The dataframe is a read-only view of the trader's queue, and is only valid 
+        until the queue is next updated. Use .copy() to keep it around. 
+        """
         if interval == None:
             interval = self.fetch_interval
-        return self.trader.queue.get_symbol_interval(symbol, interval)[symbol]
+        return self.trader.queue.get_symbol_interval(symbol, interval, copy=False)[symbol]
     
     def get_returns(self, symbol) -> float:
         """Returns the return of a specified asset. 
@@ -367,11 +473,12 @@ class BaseAlgo:
 
         :symbol:  Symbol of asset.
         :interval: Interval of data.
-        :returns: Average cost of asset. Returns None if asset is not being tracked.
+        :returns: A read-only numpy array of prices. It is a view of the trader's queue,
+            and is only valid until the queue is next updated. 
         """
         if interval == None:
             interval = self.fetch_interval
-        return self.trader.queue.get_symbol_interval_prices(symbol, interval, ref)
+        return self.trader.queue.get_symbol_interval_array(symbol, interval, ref)
     
     def get_time(self):
         return self.trader.timestamp.time()
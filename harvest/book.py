@@ -0,0 +1,162 @@
+# Builtins
+from typing import Any, Dict, Iterable, Iterator, List
+
+class Record:
+    """Base class for positions and orders.
+
+    The fields are stored in __slots__, which keeps each record small and makes
+    attribute access fast. Records can also be accessed like the dictionaries that
+    brokers return, e.g. position['quantity'], so they can be used interchangeably.
+    Keys that are not one of the fields are kept in a separate dictionary.
+    """
+
+    __slots__ = ['extra']
+    fields = frozenset()
+
+    def __init__(self, data: Dict[str, Any]=None, **kwargs) -> None:
+        self.extra = None   # Keys that are not in __slots__, created on demand
+        if data is not None:
+            kwargs = {**data, **kwargs}
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self.fields:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in self.fields:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
+
+    def get(self, key: str, default: Any=None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self) -> List[str]:
+        keys = [k for k in self.__slots__ if hasattr(self, k)]
+        if self.extra is not None:
+            keys.extend(self.extra)
+        return keys
+
+    def items(self) -> List[tuple]:
+        return [(k, self[k]) for k in self.keys()]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def copy(self):
+        return type(self)(self.to_dict())
+
+class Position(Record):
+    """A position in a stock, crypto, or option. See BaseBroker.fetch_stock_positions()
+    and similar for a description of the fields.
+    """
+
+    __slots__ = ['symbol', 'occ_symbol', 'avg_price', 'quantity', 'multiplier', 'exp_date',
+        'strike_price', 'type', 'current_price', 'market_value', 'cost_basis']
+    fields = frozenset(__slots__)
+
+class Order(Record):
+    """An order, as returned by BaseBroker.fetch_order_queue() and the order functions."""
+
+    __slots__ = ['type', 'id', 'symbol', 'occ_symbol', 'quantity', 'filled_qty', 'side',
+        'time_in_force', 'status']
+    fields = frozenset(__slots__)
+
+class Index:
+    """A collection of records indexed by one of their fields, e.g. positions
+    by symbol or orders by ID. Lookups, insertions, and removals are O(1), and
+    iterating returns the records in the order they were added.
+    """
+
+    def __init__(self, record: type, key: str) -> None:
+        self.record = record    # Class of the records, dictionaries are converted into it
+        self.key = key          # Name of the field the records are indexed by
+        self.records = {}
+
+    def __iter__(self) -> Iterator[Record]:
+        return iter(self.records.values())
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self.records
+
+    def __getitem__(self, key: Any) -> Record:
+        return self.records[key]
+
+    def __repr__(self) -> str:
+        return repr(list(self.records.values()))
+
+    def get(self, key: Any, default: Any=None) -> Record:
+        return self.records.get(key, default)
+
+    def add(self, record: Any) -> Record:
+        """Adds a record, replacing any record with the same key.
+
+        :record: A record, or a dictionary which is converted into one.
+        """
+        if not isinstance(record, self.record):
+            record = self.record(record)
+        self.records[record[self.key]] = record
+        return record
+
+    def remove(self, key: Any) -> Record:
+        """Removes the record with the given key, and returns it. Returns None if it does not exist."""
+        return self.records.pop(key, None)
+
+    def set(self, records: Iterable[Any]) -> None:
+        """Replaces all records."""
+        self.records = {}
+        for r in records:
+            self.add(r)
+
+class Book:
+    """The positions and pending orders of an account. This is used both by the
+    Trader to cache the state of the account, and by brokers that paper trade.
+    """
+
+    def __init__(self) -> None:
+        self.stocks = Index(Position, 'symbol')
+        self.cryptos = Index(Position, 'symbol')
+        self.options = Index(Position, 'occ_symbol')
+        self.orders = Index(Order, 'id')
+
+    def get_position(self, symbol: str) -> Position:
+        """Returns the position of a stock, crypto, or option, or None if it is not owned.
+
+        :symbol: Symbol of the asset. Options should be in OCC format, and cryptos prepended with '@'.
+        """
+        if len(symbol) > 6:
+            return self.options.get(symbol)
+        if symbol[0] == '@':
+            return self.cryptos.get(symbol)
+        return self.stocks.get(symbol)
@@ -2,17 +2,19 @@
 import asyncio
 import atexit
 import datetime as dt
+import functools
 import json
 import logging
+import math
 import time
 import re
 import requests
 import sys
 import urllib
 from datetime import timedelta
-from logging import debug
+from logging import debug, warning
 from warnings import warn
-from typing import Any, Callable, Dict, List 
+from typing import Any, Callable, Dict, List, Tuple
 
 # External libraries
 import numpy as np
@@ -20,8 +22,97 @@ import pandas as pd
 import pytz
 
 # Submodule imports
+import harvest.calendar
 import harvest.load
+from harvest.aggregator import interval_to_ns
 
+class Scheduler:
+    """Waits for the boundaries of an interval, e.g. every 5 minutes on the minutes
+    divisible by 5, by sleeping until the next one instead of polling the clock.
+
+    Each boundary is calculated from the wall clock rather than by adding up sleeps, 
+    so time spent handling data or waking up late does not accumulate. If a boundary
+    is missed entirely, for example because handling took longer than the interval, 
+    it is skipped.
+
+    If a calendar is given, boundaries that end a bar during which the market was 
+    closed are skipped as well, so the scheduler sleeps through nights, weekends, and holidays.
+    """
+
+    def __init__(self, interval: str, offset: float=0.0, clock: Callable[[], float]=time.time, 
+        calendar: harvest.calendar.Calendar=None) -> None:
+        """
+        :interval: Interval between boundaries, such as '5MIN'
+        :offset: Seconds to wait after each boundary, e.g. to give the broker time 
+            to publish the bar that just closed
+        :clock: Returns the current time as a unix timestamp
+        :calendar: Calendar of the market, or None if every boundary should be waited for
+        """
+        self.period = interval_to_ns(interval) / 10**9
+        self.offset = offset
+        self.clock = clock
+        self.calendar = calendar
+        self.last = None    # The last boundary that was waited for
+
+    def next(self, now: float=None) -> float:
+        """Returns the next boundary after now, including the offset, as a unix timestamp."""
+        if now is None:
+            now = self.clock()
+        target = (math.floor((now - self.offset) / self.period) + 1) * self.period + self.offset
+        # Never return the same boundary twice, even if the clock is set back
+        if self.last is not None and target < self.last + self.period:
+            target = self.last + self.period
+        if self.calendar is not None:
+            start = target - self.offset - self.period
+            if not self.calendar.is_open(pd.Timestamp(start, unit='s')):
+                opens = self.calendar.next_open(pd.Timestamp(start, unit='s'))
+                if opens is not None:
+                    target = opens.value / 10**9 + self.period + self.offset
+        return target
+
+    def wait(self) -> float:
+        """Sleeps until the next boundary, and returns it."""
+        target = self._start()
+        while True:
+            remaining = target - self.clock()
+            if remaining <= 0:
+                return target
+            time.sleep(remaining)
+
+    async def wait_async(self) -> float:
+        """Same as wait(), but awaits on the asyncio event loop instead of blocking."""
+        target = self._start()
+        while True:
+            remaining = target - self.clock()
+            if remaining <= 0:
+                return target
+            await asyncio.sleep(remaining)
+
+    def _start(self) -> float:
+        target = self.next()
+        if self.last is not None and target - self.last > self.period:
+            skipped = round((target - self.last) / self.period) - 1
+            warning(f"Skipped {skipped} interval(s), handling took too long")
+        self.last = target
+        return target
+
+# OCC symbols of the same few contracts are converted over and over, 
+# so the conversions are cached
+@functools.lru_cache(maxsize=4096)
+def _data_to_occ(symbol: str, date: dt.datetime, option_type: str, price: float) -> str:
+    occ = symbol+((6-len(symbol))*' ')
+    occ = occ+date.strftime('%y%m%d')
+    occ = occ+'C' if option_type == 'call' else occ+'P'
+    occ = occ+f'{int(price*1000):08}'
+    return occ
+
+@functools.lru_cache(maxsize=4096)
+def _occ_to_data(symbol: str) -> Tuple[str, dt.datetime, str, float]:
+    sym = symbol[0:6].replace(' ', '')
+    date =  dt.datetime.strptime(symbol[6:12], '%y%m%d')
+    option_type = 'call' if symbol[12] == 'C' else 'put'
+    price = float(symbol[13:])/1000
+    return sym, date, option_type, price
 
 class BaseBroker:
     """Broker class communicates with various API endpoints to perform the
@@ -31,7 +122,17 @@ class BaseBroker:
     Attributes
     :fetch_interval: A string indicating the interval the broker fetches the latest asset data.  
         This should be initialized in setup_run (see below).
+    :history_batch_size: The maximum number of symbols fetch_price_history_batch can request at once.
+    :fetch_offset: Seconds after each fetch_interval boundary that brokers which poll
+        wait before requesting the latest data, so that the bar has been published.
+    :fetch_timeout: Seconds the Trader waits for the rest of the data of an interval after
+        the first of it arrives. Brokers whose data arrives in several parts should set this
+        to how long the slowest part usually takes.
     """
+
+    history_batch_size = 1
+    fetch_offset = 0.0
+    fetch_timeout = 1.0
     
     def __init__(self, path: str=None):
         """Here, the broker should perform any authentications neccesary to 
@@ -84,9 +185,40 @@ class BaseBroker:
         """
         pass
 
+    async def run_async(self):
+        """Runs the streamer in the Trader's event loop. By default, run() is called in 
+        a separate thread, and data is handed over to the loop by _dispatch(). 
+        Brokers that poll for data should override this with a coroutine that does not
+        block the loop, see _run_scheduled_async().
+        """
+        await asyncio.get_running_loop().run_in_executor(None, self.run)
+
     def refresh_cred(self):
         pass
 
+    def _run_scheduled(self, func: Callable[[], Any]) -> None:
+        """Calls func at every fetch_interval boundary, offset by fetch_offset seconds.
+        Brokers that poll for data can use this in run(). If only stocks are watched,
+        boundaries while the market is closed are skipped.
+        """
+        scheduler = self._scheduler()
+        while True:
+            scheduler.wait()
+            func()
+
+    async def _run_scheduled_async(self, func: Callable[[], Any]) -> None:
+        """Same as _run_scheduled(), but awaits the coroutine function func in the event loop."""
+        scheduler = self._scheduler()
+        while True:
+            await scheduler.wait_async()
+            await func()
+
+    def _scheduler(self) -> Scheduler:
+        calendar = None
+        if all(s[0] != '@' for s in self.watch):
+            calendar = harvest.calendar.NYSE
+        return Scheduler(self.fetch_interval, self.fetch_offset, calendar=calendar)
+
     def _handler(self) -> Dict[str, pd.DataFrame]:
         """This function should be called at the specified interval, and return data.
         For brokers that use streaming, this often means specifying this function as a callback.
@@ -109,14 +241,35 @@ class BaseBroker:
         def wrapper(*args, **kwargs):
             self = args[0]
             df = func(*args, **kwargs) 
+            self._dispatch(df, self._now())
+        return wrapper
 
-            now = time.mktime(time.gmtime())
-            now = dt.datetime.fromtimestamp(now)
-            now = now.replace(second=0, microsecond=0)
-            now = pytz.utc.localize(now)
+    def _now(self) -> dt.datetime:
+        """Returns the current time in UTC, rounded down to the minute."""
+        now = time.mktime(time.gmtime())
+        now = dt.datetime.fromtimestamp(now)
+        now = now.replace(second=0, microsecond=0)
+        return pytz.utc.localize(now)
 
-            self.trader.loop.run_until_complete(self.handler(df, now))
-        return wrapper
+    def _dispatch(self, df_dict: Dict[str, pd.DataFrame], now: dt.datetime) -> None:
+        """Passes data to the Trader's handler. This can be called several times with 
+        the same timestamp, each time with data of some of the symbols, and the Trader
+        will wait until data of all symbols has arrived.
+
+        This can be called from the Trader's event loop, or from any other thread,
+        in which case the data is handed over to the loop without waiting for it.
+        """
+        loop = self.trader.loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            loop.create_task(self.handler(df_dict, now))
+        elif loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.handler(df_dict, now), loop)
+        else:
+            loop.run_until_complete(self.handler(df_dict, now))
 
     def exit(self):
         """This function is called after every invocation of algo's handler. 
@@ -133,6 +286,7 @@ class BaseBroker:
         :returns: The returned value of func if func runs properly. Raises an Exception if func fails.
         """
         def wrapper(*args, **kwargs):
+            self = args[0]
             tries = 3
             while tries > 0:
                 try:
@@ -163,6 +317,30 @@ class BaseBroker:
         """
         raise Exception("This endpoint is not supported in this broker")
     
+    def fetch_price_history_batch(self,
+        last: dt.datetime, 
+        today: dt.datetime, 
+        interval: str='5MIN',
+        symbols: List[str]=[]) -> Dict[str, pd.DataFrame]:
+        """Returns historical price data for several assets. Brokers whose API can return 
+        data of several assets in a single request should override this, and set
+        history_batch_size to the number of assets allowed per request. 
+
+        :symbols: The stocks/cryptos to get data for.
+        :returns: A dictionary mapping each symbol to a pandas dataframe, same format as _handler()
+        """
+        return {s: self.fetch_price_history(last, today, interval, s) for s in symbols}
+
+    def history_window(self, interval: str) -> dt.timedelta:
+        """Returns how far back the price history of interval usually goes, when all of it is
+        requested. When price history is saved, the Trader loads this much of it into the queue, 
+        counting back from the last saved candle. Brokers that return more or less history 
+        than this should override it.
+        """
+        if interval == '1DAY':
+            return dt.timedelta(days=5 * 365)
+        return dt.timedelta(days=7)
+
     def fetch_latest_stock_price(self):
         """Returns the latest prices for all stocks in self.watch
 
@@ -576,16 +754,67 @@ class BaseBroker:
     def data_to_occ(self, symbol: str, date: dt.datetime, option_type: str, price: float):
         """Converts data into a OCC format string 
         """
-        occ = symbol+((6-len(symbol))*' ')
-        occ = occ+date.strftime('%y%m%d')
-        occ = occ+'C' if option_type == 'call' else occ+'P'
-        occ = occ+f'{int(price*1000):08}'
-
-        return occ
+        return _data_to_occ(symbol, date, option_type, price)
     
     def occ_to_data(self, symbol: str):
-        sym = symbol[0:6].replace(' ', '')
-        date =  dt.datetime.strptime(symbol[6:12], '%y%m%d')
-        option_type = 'call' if symbol[12] == 'C' else 'put'
-        price = float(symbol[13:])/1000
-        return sym, date, option_type, price
\ No newline at end of file
+        return _occ_to_data(symbol)
+
+    def data_to_occ_array(self, symbols: Any, dates: Any, option_types: Any, prices: Any) -> np.ndarray:
+        """Same as data_to_occ(), but converts whole arrays at once.
+
+        :symbols: Symbols of the underlying, or a single symbol for all options
+        :dates: Expiration dates, as datetimes or datetime64. Timezone-aware dates are 
+            converted using their local date, same as data_to_occ().
+        :option_types: 'call' or 'put' for each option
+        :prices: Strike prices
+        :returns: An array of OCC symbols
+        """
+        dates = pd.DatetimeIndex(dates)
+        if dates.tz is not None:
+            dates = dates.tz_localize(None)
+        days = dates.values.astype('datetime64[D]')
+        months = days.astype('datetime64[M]')
+        years = days.astype('datetime64[Y]')
+        yy = (years.astype(int) + 1970) % 100
+        mm = (months - years).astype(int) + 1
+        dd = (days - months).astype(int) + 1
+        date = yy * 10000 + mm * 100 + dd
+
+        prices = np.asarray(prices, dtype=float)
+        strike = (prices * 1000).astype(np.int64)
+        symbols = np.char.ljust(np.broadcast_to(np.asarray(symbols, dtype=str), strike.shape), 6)
+        types = np.where(np.asarray(option_types) == 'call', 'C', 'P')
+        occ = np.char.add(symbols, np.char.zfill(date.astype(str), 6))
+        occ = np.char.add(occ, types)
+        return np.char.add(occ, np.char.zfill(strike.astype(str), 8))
+
+    def occ_to_data_array(self, symbols: Any) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Same as occ_to_data(), but converts a whole array of OCC symbols at once.
+        Raises a ValueError if a symbol is not 21 characters long, or its date or strike are not digits.
+
+        :returns: A tuple of arrays of the underlying symbols, expiration dates (as datetime64),
+            option types, and strike prices
+        """
+        occ = np.asarray(symbols, dtype=str)
+        n = len(occ)
+        lengths = np.char.str_len(occ)
+        # Each symbol is viewed as 21 characters, and the fields are read by position
+        occ = np.ascontiguousarray(occ, dtype='U21')
+        chars = occ.view('U1').reshape(n, 21)
+        digits = occ.view(np.uint32).reshape(n, 21).astype(np.int64) - ord('0')
+        numeric = np.concatenate([digits[:, 6:12], digits[:, 13:]], axis=1)
+        invalid = (lengths != 21) | ((numeric < 0) | (numeric > 9)).any(axis=1)
+        if invalid.any():
+            raise ValueError(f"Invalid OCC symbols: {list(occ[invalid][:5])}")
+
+        sym = np.char.replace(np.ascontiguousarray(chars[:, :6]).view('U6').reshape(n), ' ', '')
+        yy = digits[:, 6] * 10 + digits[:, 7]
+        mm = digits[:, 8] * 10 + digits[:, 9]
+        dd = digits[:, 10] * 10 + digits[:, 11]
+        # Same as strptime's %y, which maps 69-99 to the 1900s
+        years = np.where(yy < 69, yy + 2000, yy + 1900)
+        months = (years - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (mm - 1)
+        dates = months.astype('datetime64[D]') + (dd - 1)
+        types = np.where(chars[:, 12] == 'C', 'call', 'put')
+        prices = (digits[:, 13:] * 10 ** np.arange(7, -1, -1)).sum(axis=1) / 1000
+        return sym, dates.astype('datetime64[ns]'), types, prices
@@ -1,5 +1,6 @@
 # Builtins
 import datetime as dt
+import itertools
 import random
 import re
 from typing import Any, Dict, List, Tuple
@@ -11,7 +12,9 @@ import pandas as pd
 import yaml
 
 # Submodule imports
+import harvest.book as book
 import harvest.broker._base as base
+import harvest.calendar as calendar
 
 class DummyBroker(base.BaseBroker):
     """DummyBroker, as its name implies, is a dummy broker class that can 
@@ -20,10 +23,11 @@ class DummyBroker(base.BaseBroker):
     """
 
     def __init__(self, account_path: str=None):
-        self.stocks = []
-        self.options = []
-        self.cryptos = []
-        self.orders = []
+        self.book = book.Book()
+        self.stocks = self.book.stocks
+        self.options = self.book.options
+        self.cryptos = self.book.cryptos
+        self.orders = self.book.orders
 
         self.equity = 100000.0
         self.cash = 100000.0
@@ -41,10 +45,10 @@ class DummyBroker(base.BaseBroker):
                 self.multiplier = account['multiplier']
 
                 for stock in account['stocks']:
-                    self.stocks.append(stock)
+                    self.stocks.add(stock)
 
                 for crypto in account['cryptos']:
-                    self.cryptos.append(crypto)
+                    self.cryptos.add(crypto)
 
         super().__init__()
 
@@ -129,14 +133,11 @@ class DummyBroker(base.BaseBroker):
         }
 
         results = pd.DataFrame(data=d).set_index('date')
-        open_time = dt.time(hour=13, minute=30)
-        close_time = dt.time(hour=20)
 
         results.index = times
         results.index.rename('date', inplace=True)
 
-        results = results.loc[(open_time < results.index.time) & (results.index.time < close_time)]
-        results = results[(results.index.dayofweek != 5) & (results.index.dayofweek != 6)]
+        results = results[calendar.get_calendar(symbol).is_open(results.index)]
 
         results.columns = pd.MultiIndex.from_product([[symbol], results.columns])
 
@@ -161,13 +162,13 @@ class DummyBroker(base.BaseBroker):
         return results
     
     def fetch_stock_positions(self) -> List[Dict[str, Any]]:
-        return self.stocks
+        return list(self.stocks)
 
     def fetch_option_positions(self) -> List[Dict[str, Any]]:
-        return self.options
+        return list(self.options)
 
     def fetch_crypto_positions(self) -> List[Dict[str, Any]]:
-        return self.cryptos
+        return list(self.cryptos)
     
     def update_option_positions(self, positions) -> List[Dict[str, Any]]:
         for r in self.options:
@@ -192,7 +193,7 @@ class DummyBroker(base.BaseBroker):
         }
     
     def fetch_stock_order_status(self, id: int) -> Dict[str, Any]:
-        ret = next(r for r in self.orders if r['id'] == id)
+        ret = self.orders[id]
         sym = ret['symbol']
 
         if self.trader is None:
@@ -209,11 +210,11 @@ class DummyBroker(base.BaseBroker):
             else:
                 lst = self.stocks
 
-            pos = next((r for r in lst if r['symbol'] == sym), None)
+            pos = lst.get(sym)
             if ret['side'] == 'buy':
                 # If asset already exists, buy more. If not, add a new entry
                 if pos == None:
-                    lst.append({
+                    lst.add({
                         'symbol': sym,
                         'avg_price': price,
                         'quantity': qty
@@ -230,15 +231,13 @@ class DummyBroker(base.BaseBroker):
 
                 pos['quantity'] = pos['quantity'] - qty
                 if pos['quantity'] < 1e-8:
-                    lst.remove(pos)
+                    lst.remove(sym)
                 self.cash += price * qty 
                 self.buying_power += price * qty 
             
             self.equity = self._calc_equity()
             
-            ret_1 = ret.copy()
-            self.orders.remove(ret)
-            ret = ret_1
+            ret = self.orders.remove(id)
 
         debug(f"Returning status: {ret}")
         debug(f"Positions:\n{self.stocks}\n=========\n{self.cryptos}")
@@ -248,7 +247,7 @@ class DummyBroker(base.BaseBroker):
 
     def _calc_equity(self):
         e = 0
-        for asset in self.stocks + self.cryptos + self.options:
+        for asset in itertools.chain(self.stocks, self.cryptos, self.options):
             add = asset['avg_price'] * asset['quantity']
             if 'multiplier' in asset:
                 add = add * asset['multiplier']
@@ -257,7 +256,7 @@ class DummyBroker(base.BaseBroker):
         return e
 
     def fetch_option_order_status(self, id: int) -> Dict[str, Any]:
-        ret = next(r for r in self.orders if r['id'] == id)
+        ret = self.orders[id]
         sym = ret['symbol']
         occ_sym = ret['occ_symbol']
 
@@ -270,12 +269,12 @@ class DummyBroker(base.BaseBroker):
        
         # If order has been filled, simulate asset buy/sell
         if ret['status'] == 'filled':
-            pos = next((r for r in self.options if r['occ_symbol'] == occ_sym), None)
+            pos = self.options.get(occ_sym)
             if ret['side'] == 'buy':
                 # If asset already exists, buy more. If not, add a new entry
                 if pos == None:
                     sym, date, option_type, price = self.occ_to_data(occ_sym)
-                    self.options.append({
+                    self.options.add({
                         'symbol': sym,
                         'occ_symbol': ret['occ_symbol'],
                         'avg_price': price,
@@ -299,14 +298,12 @@ class DummyBroker(base.BaseBroker):
                 self.cash += price*qty*pos['multiplier'] 
                 self.buying_power += price*qty*pos['multiplier'] 
                 if pos['quantity'] < 1e-8:
-                    self.options.remove(pos)
+                    self.options.remove(occ_sym)
                 
             
             self.equity = self._calc_equity()
             
-            ret_1 = ret.copy()
-            self.orders.remove(ret)
-            ret = ret_1
+            ret = self.orders.remove(id)
 
         debug(f"Returning status: {ret}")
         debug(f"Positions:\n{self.stocks}\n=========\n{self.cryptos}")
@@ -318,7 +315,7 @@ class DummyBroker(base.BaseBroker):
         return self.fetch_stock_order_status(id)
     
     def fetch_order_queue(self) -> List[Dict[str, Any]]:
-        return self.orders
+        return list(self.orders)
 
     def fetch_chain_info(self, symbol: str):
         pass
@@ -369,7 +366,7 @@ class DummyBroker(base.BaseBroker):
                 'side': side
             }
 
-        self.orders.append(data)
+        self.orders.add(data)
         self.id += 1
         ret = {
             'type': data['type'],
@@ -394,7 +391,7 @@ class DummyBroker(base.BaseBroker):
             'occ_symbol': self.data_to_occ(symbol, exp_date, type, strike)
         }
       
-        self.orders.append(data)
+        self.orders.add(data)
         self.id += 1
         ret = {
             'type': data['type'],
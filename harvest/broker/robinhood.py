@@ -1,11 +1,13 @@
 # Builtins
+import asyncio
 import datetime as dt
 from datetime import timedelta
 import logging
 import re
 import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from logging import critical, error, info, warning, debug
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
 import time
 from pathlib import Path
 from getpass import getpass
@@ -20,12 +22,41 @@ import pytz
 
 # Submodule imports
 import harvest.broker._base as base
+import harvest.cache
+import harvest.calendar
+from harvest.aggregator import interval_to_ns
 
 class RobinhoodBroker(base.BaseBroker):
 
     interval_list = ['1MIN', '5MIN', '15MIN', '30MIN']
+    history_batch_size = 75 # Robinhood returns historicals of up to 75 stocks per request
+    fetch_timeout = 0.0     # Prices of all symbols are passed on together, so nothing more arrives later
+
+    def __init__(self, path=None, max_in_flight: int=8, fetch_offset: float=1.0, instrument_path: str=None,
+        chain_ttl: float=None, chain_path: str=None, deadline: float=10.0):
+        """
+        :max_in_flight: Maximum number of requests for the latest prices that are sent at 
+            the same time
+        :fetch_offset: Seconds to wait after each interval before requesting the latest prices
+        :instrument_path: File to save instrument data to, so it is only requested once 
+            across restarts. If None (the default), instrument data is only cached in memory.
+        :chain_ttl: Seconds option chains are cached for. If None, chains are cached 
+            until the next session opens.
+        :chain_path: Directory to save option chains to, so they survive restarts.
+            If None, chains are only cached in memory.
+        :deadline: Seconds to wait for the latest prices of all symbols. Prices are passed on 
+            to the Trader once all of them have arrived, or when this runs out, in which case 
+            the Trader fills in the missing symbols with their last candle.
+        """
+        self.max_in_flight = max_in_flight
+        self.fetch_offset = fetch_offset
+        self.deadline = deadline
+        self.pool = ThreadPoolExecutor(max_workers=max_in_flight)
+        # Maps instrument URLs to symbols, and option IDs to their contract data
+        self.instruments = harvest.cache.FileCache(instrument_path)
+        self.option_quotes = {}     # Quotes of options fetched during the current tick, keyed by OCC symbol
+        self.chains = harvest.cache.TTLCache(chain_ttl, self._chain_expiry if chain_ttl is None else None, chain_path)
 
-    def __init__(self, path=None):
         if path == None:
             path = './secret.yaml'
         
@@ -160,47 +191,72 @@ class RobinhoodBroker(base.BaseBroker):
         else:
             self.interval_fmt = '5minute'
             fetch_interval = '5MIN'
-        
-        self.option_cache = {}
 
         super().setup_run(watch, interval, fetch_interval)
          
     def run(self):
-        self.cur_sec = -1
-        self.cur_min = -1
-        val = int(re.sub("[^0-9]", "", self.fetch_interval))
         # RH does not support per minute intervals, so instead 15second intervals are used
         # Note that 1MIN is only supported for crypto
         
         print("Running...")
-        
-        if self.interval == '1MIN':
-            while 1:
-                cur = dt.datetime.now()
-                seconds = cur.second
-                if seconds == 1 and seconds != self.cur_sec:
-                    self._handler()
-                self.cur_sec = seconds
-        else:
-            while 1:
-                cur = dt.datetime.now()
-                minutes = cur.minute
-                if minutes % val == 0 and minutes != self.cur_min:
-                    self._handler()
-                self.cur_min = minutes
+        self._run_scheduled(self._handler)
+
+    async def run_async(self):
+        print("Running...")
+        await self._run_scheduled_async(self._handler_async)
 
     def exit(self):
-        self.option_cache = {}
+        # Option chains are kept until they expire, only quotes are cleared every tick
+        self.option_quotes = {}
 
-    @base.BaseBroker._handler_wrap
     def _handler(self):
-        df_dict = {}
-        df_dict.update( self.fetch_latest_stock_price() )
-        df_dict.update( self.fetch_latest_crypto_price())
-      
-        return df_dict
+        """Fetches the latest prices of all stocks and cryptos concurrently, and passes 
+        them on to the Trader together once all have arrived or the deadline runs out.
+        """
+        now = self._now()
+        futures = [self.pool.submit(self._fetch_latest_batch, b) for b in self._latest_batches(self._poll_symbols(now))]
+        batch = self._collect_latest(*wait(futures, timeout=self.deadline))
+        if len(batch) > 0:
+            self._dispatch(batch, now)
+
+    async def _handler_async(self):
+        """Same as _handler(), but runs in the Trader's event loop. Requests are sent from
+        the thread pool, so the loop keeps running while they are waited for.
+        """
+        now = self._now()
+        loop = asyncio.get_running_loop()
+        futures = [loop.run_in_executor(self.pool, self._fetch_latest_batch, b) for b in self._latest_batches(self._poll_symbols(now))]
+        if len(futures) == 0:
+            return
+        batch = self._collect_latest(*await asyncio.wait(futures, timeout=self.deadline))
+        if len(batch) > 0:
+            await self.handler(batch, now)
+
+    def _collect_latest(self, done: Set[Any], pending: Set[Any]) -> Dict[str, pd.DataFrame]:
+        """Combines the prices of the requests that are done. Requests that failed or are still
+        pending only lose their own symbols, which the Trader fills in with their last candle.
+        """
+        if len(pending) > 0:
+            warning(f"{len(pending)} request(s) for the latest prices took longer than {self.deadline} seconds")
+            for f in pending:
+                f.cancel()
+        batch = {}
+        for f in done:
+            try:
+                results = f.result()
+            except Exception as e:
+                error(f"Failed to fetch latest prices: {e}")
+                continue
+            batch.update((sym, df) for sym, df in results if df is not None)
+        return batch
+
+    def _poll_symbols(self, now: dt.datetime) -> List[str]:
+        """Returns the symbols to fetch. Stocks are skipped if the market was closed during the bar that just ended."""
+        start = now - timedelta(seconds=interval_to_ns(self.fetch_interval) / 10**9)
+        stocks = self.watch_stock if harvest.calendar.NYSE.is_open(start) else []
+        return stocks + self.watch_crypto
     
-    @base.BaseBroker._exception_handler
+    # Not wrapped in the exception handler, as fetch_price_history_batch() already retries
     def fetch_price_history( self,
         last: dt.datetime, 
         today: dt.datetime, 
@@ -208,17 +264,54 @@ class RobinhoodBroker(base.BaseBroker):
         symbol: str = None,
         count: int = 200):
 
-        df = pd.DataFrame()
+        return self.fetch_price_history_batch(last, today, interval, [symbol], count)[symbol]
 
+    @base.BaseBroker._exception_handler
+    def fetch_price_history_batch( self,
+        last: dt.datetime, 
+        today: dt.datetime, 
+        interval: str='1MIN',
+        symbols: List[str] = [],
+        count: int = 200):
+        """Stocks are requested in batches of history_batch_size symbols. Cryptos can only
+        be requested one at a time, so they are requested concurrently instead. 
+        """
+        results = {s: pd.DataFrame() for s in symbols}
+        params = self._history_params(last, today, interval, symbols)
+        if params is None:
+            return results
+        inter, span = params
+
+        cryptos = [s for s in symbols if s[0] == '@']
+        futures = [self.pool.submit(rh.get_crypto_historicals, s[1:], interval=inter, span=span) for s in cryptos]
+        stocks = [s for s in symbols if s[0] != '@']
+        ret = {}
+        for k in range(0, len(stocks), self.history_batch_size):
+            ret.update(self._stock_historicals(stocks[k:k + self.history_batch_size], inter, span))
+        for s, f in zip(cryptos, futures):
+            ret[s] = f.result()
+
+        for s, r in ret.items():
+            if r == None or 'error' in r or (type(r) == list and len(r) == 0):
+                continue
+            df = pd.DataFrame.from_dict(r)
+            df = self._format_df(df, [s], interval, False)
+            results[s] = df.iloc[-count:]
+        return results
+
+    def _history_params(self, last: dt.datetime, today: dt.datetime, interval: str, symbols: List[str]) -> Tuple[str, str]:
+        """Returns the interval and span to request historicals with, 
+        or None if no data should be requested.
+        """
         if last >= today:
-            return df
+            return None
         
         if interval == '15SEC': # Not used
-            if not symbol[0] == '@':
+            if any(not s[0] == '@' for s in symbols):
                 raise Exception('15SEC interval is only allowed for crypto')
             inter = '15second'
         elif interval == '1MIN':
-            if not symbol[0] == '@':
+            if any(not s[0] == '@' for s in symbols):
                 raise Exception('MIN interval is only allowed for crypto')
             inter = '15second'
         elif interval == '5MIN':
@@ -230,13 +323,13 @@ class RobinhoodBroker(base.BaseBroker):
         elif interval == '1DAY': 
             inter = 'day'
         else:
-            return df
+            return None
         
         delta = today - last 
         delta = delta.total_seconds()
         delta = delta / 3600
         if interval == 'DAY' and delta < 24:
-            return df
+            return None
         if delta < 1 or interval == '15SEC' or interval == '1MIN':
             span = 'hour'
         elif delta >=1 and delta < 24 or interval == '5MIN' or interval == '15MIN' or interval == '30MIN':
@@ -247,66 +340,85 @@ class RobinhoodBroker(base.BaseBroker):
             span = 'year'
         else:
             span='5year'
-        
-        if symbol[0] == '@':
-            ret = rh.get_crypto_historicals(
-                symbol[1:], 
-                interval=inter, 
-                span=span
-                )
-        else:
-            ret = rh.get_stock_historicals(
-                symbol, 
-                interval=inter, 
-                span=span
-                )
-        
-        df = pd.DataFrame.from_dict(ret)
-        df = self._format_df(df, [symbol], interval, False)
-        return df.iloc[-count:]
+        return inter, span
+
+    def _stock_historicals(self, symbols: List[str], interval: str, span: str) -> Dict[str, List[Dict[str, Any]]]:
+        """Requests historicals of several stocks in a single call, and splits 
+        the response by symbol.
+        """
+        ret = rh.get_stock_historicals(symbols, interval=interval, span=span)
+        grouped = {}
+        for r in ret or []:
+            if isinstance(r, dict) and 'symbol' in r:
+                grouped.setdefault(r['symbol'], []).append(r)
+        return grouped
 
     @base.BaseBroker._exception_handler
     def fetch_latest_stock_price(self):
         df={}
-        for s in self.watch_stock:
-            ret = rh.get_stock_historicals(
-                s,
-                interval=self.interval_fmt, 
-                span='day', 
-                )
-            if 'error' in ret or ret == None or (type(ret) == list and len(ret) == 0):
-                continue
-            df_tmp = pd.DataFrame.from_dict(ret)
-            df_tmp = self._format_df(df_tmp, [s], self.interval, True)
-            df[s] = df_tmp
-        
+        for s, df_tmp in self._fetch_latest_prices(self.watch_stock):
+            if df_tmp is not None:
+                df[s] = df_tmp
         return df        
 
     @base.BaseBroker._exception_handler
     def fetch_latest_crypto_price(self):
         df={}
-        for s in self.watch_crypto_fmt:
-            ret = rh.get_crypto_historicals(
-                s, 
+        for s, df_tmp in self._fetch_latest_prices(self.watch_crypto):
+            if df_tmp is not None:
+                df[s] = df_tmp
+        return df
+
+    def _fetch_latest_prices(self, symbols: List[str]) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """Requests the latest prices of symbols concurrently, using at most max_in_flight
+        requests at a time. Stocks are requested in batches of history_batch_size symbols. 
+
+        :returns: A generator of (symbol, dataframe) pairs in the order the responses arrive.
+            The dataframe is None if no data was returned.
+        """
+        futures = [self.pool.submit(self._fetch_latest_batch, b) for b in self._latest_batches(symbols)]
+        for f in as_completed(futures):
+            yield from f.result()
+
+    def _latest_batches(self, symbols: List[str]) -> List[List[str]]:
+        """Splits symbols into batches of stocks that are requested together, and single cryptos."""
+        stocks = [s for s in symbols if s[0] != '@']
+        batches = [stocks[k:k + self.history_batch_size] for k in range(0, len(stocks), self.history_batch_size)]
+        batches += [[s] for s in symbols if s[0] == '@']
+        return batches
+
+    def _fetch_latest_batch(self, symbols: List[str]) -> List[Tuple[str, pd.DataFrame]]:
+        """Requests the latest prices of a batch of stocks in a single call, or of a single crypto."""
+        if symbols[0][0] == '@':
+            ret = {symbols[0]: rh.get_crypto_historicals(
+                symbols[0][1:], 
                 interval=self.interval_fmt, 
                 span='hour',
-                )
-            df_tmp = pd.DataFrame.from_dict(ret)
-            df_tmp = self._format_df(df_tmp, ['@'+s], self.interval, True)
-            df['@'+s] = df_tmp
-        
-        return df        
+                )}
+        else:
+            ret = self._stock_historicals(symbols, self.interval_fmt, 'day')
+
+        results = []
+        for s in symbols:
+            r = ret.get(s)
+            if r == None or 'error' in r or (type(r) == list and len(r) == 0):
+                results.append((s, None))
+                continue
+            df_tmp = pd.DataFrame.from_dict(r)
+            df_tmp = self._format_df(df_tmp, [s], self.interval, True)
+            results.append((s, df_tmp))
+        return results        
     
 
     @base.BaseBroker._exception_handler
     def fetch_stock_positions(self):
         ret = rh.get_open_stock_positions()
+        # 0 quantity means the order was not fulfilled yet
+        ret = [r for r in ret if float(r['quantity']) >= 0.0001]
+        symbols = self._instrument_symbols(r['instrument'] for r in ret)
         pos = []
         for r in ret:
-            # 0 quantity means the order was not fulfilled yet
-            if float(r['quantity']) < 0.0001:
-                continue
-            sym = rh.get_symbol_by_url(r['instrument'])
+            sym = symbols[r['instrument']]
             pos.append(
                 {
                     "symbol": sym,
@@ -319,11 +431,11 @@ class RobinhoodBroker(base.BaseBroker):
     @base.BaseBroker._exception_handler
     def fetch_option_positions(self):
         ret = rh.get_open_option_positions()
+        # Get option data such as expiration date
+        options = self.instruments.get_many((r['option_id'] for r in ret), self._option_instrument, self.pool)
         pos = []
-        #print(ret)
         for r in ret:
-            # Get option data such as expiration date
-            data = rh.get_option_instrument_data_by_id(r['option_id'])
+            data = options[r['option_id']]
             pos.append(
                 {
                     "symbol": r['chain_symbol'],
@@ -341,6 +453,18 @@ class RobinhoodBroker(base.BaseBroker):
     
         return pos 
     
+    def _instrument_symbols(self, urls: Iterable[str]) -> Dict[str, str]:
+        """Returns the symbol of each instrument URL. Only instruments that have 
+        never been seen before are requested.
+        """
+        return self.instruments.get_many(urls, rh.get_symbol_by_url, self.pool)
+
+    def _option_instrument(self, id: str) -> Dict[str, Any]:
+        data = rh.get_option_instrument_data_by_id(id)
+        if data is None:
+            return None
+        return {k: data[k] for k in ['expiration_date', 'strike_price', 'type']}
+
     @base.BaseBroker._exception_handler
     def fetch_crypto_positions(self, key=None):
         ret = rh.get_crypto_positions()
@@ -365,17 +489,12 @@ class RobinhoodBroker(base.BaseBroker):
     
     @base.BaseBroker._exception_handler
     def update_option_positions(self, positions: List[Any]):
+        positions = list(positions)
+        quotes = self._fetch_option_quotes([r['occ_symbol'] for r in positions])
         for r in positions:
-            sym, date, type, price = self.occ_to_data(r['occ_symbol'])
-            upd = rh.get_option_market_data(
-                sym,
-                date.strftime('%Y-%m-%d'),
-                str(price),
-                type
-            )
-            upd = upd[0][0]
-            r["current_price"] = float(upd['adjusted_mark_price'])
-            r["market_value"] = float(upd['adjusted_mark_price']) * r['quantity']
+            price = quotes[r['occ_symbol']]['price']
+            r["current_price"] = price
+            r["market_value"] = price * r['quantity']
             r["cost_basis"] = r['avg_price'] * r['quantity']
 
     @base.BaseBroker._exception_handler
@@ -436,9 +555,9 @@ class RobinhoodBroker(base.BaseBroker):
     def fetch_order_queue(self):
         queue = []
         ret = rh.get_all_open_stock_orders()
+        symbols = self._instrument_symbols(r['instrument'] for r in ret)
         for r in ret:
-            #print(r)
-            sym = rh.get_symbol_by_url(r['instrument'])
+            sym = symbols[r['instrument']]
             queue.append({
                 "type":"STOCK",
                 "symbol":sym,
@@ -472,8 +591,9 @@ class RobinhoodBroker(base.BaseBroker):
                 "legs":legs,
             } )
         ret = rh.get_all_open_crypto_orders()
+        symbols = self._instrument_symbols(r['instrument'] for r in ret)
         for r in ret:
-            sym = rh.get_symbol_by_url(r['instrument'])
+            sym = symbols[r['instrument']]
             queue.append({
                 "type":"CRYPTO",
                 "symbol":sym,
@@ -497,37 +617,52 @@ class RobinhoodBroker(base.BaseBroker):
 
     @base.BaseBroker._exception_handler
     def fetch_chain_data(self, symbol: str):
-
-        if bool(self.option_cache) and symbol in self.option_cache:
-            return self.option_cache[symbol]
+        df = self.chains.get(symbol)
+        if df is not None:
+            return df
         
         ret = rh.find_tradable_options(symbol)
-        exp_date = []
-        strike = []
-        type = []
-        id = []
-        occ = []
-        for entry in ret:
-            date = entry["expiration_date"]
-            date = dt.datetime.strptime(date, '%Y-%m-%d')
-            date = pytz.utc.localize(date)
-            exp_date.append(date)
-            price = float(entry["strike_price"])
-            strike.append(price)
-            type.append(entry["type"])
-            id.append(entry["id"])    
+        df = self._chain_df(symbol, ret)
+        self.chains.set(symbol, df)
+        return df
 
-            occ.append(self.data_to_occ(symbol, date, type[-1], price))
+    def _chain_df(self, symbol: str, ret: List[Dict[str, Any]]) -> pd.DataFrame:
+        """Builds the chain dataframe from the contracts returned by Robinhood, 
+        converting whole columns at once.
+        """
+        raw = pd.DataFrame(list(ret or []), columns=['expiration_date', 'strike_price', 'type', 'id'])
+        exp_date = pd.to_datetime(raw['expiration_date'], format='%Y-%m-%d', utc=True)
+        strike = raw['strike_price'].astype(float)
+        occ = self.data_to_occ_array(symbol, exp_date, raw['type'], strike)
 
-        df = pd.DataFrame({'occ_symbol':occ,'exp_date':exp_date,'strike':strike,'type':type,'id':id})
+        df = pd.DataFrame({'occ_symbol':occ,'exp_date':exp_date,'strike':strike,'type':raw['type'],'id':raw['id']})
         df = df.set_index('occ_symbol')
-
-        self.option_cache[symbol] = df
         return df
-    
+
+    def _chain_expiry(self, now: float) -> float:
+        """Option chains change when new contracts are listed, which happens between sessions."""
+        opens = harvest.calendar.NYSE.next_session_open(pd.Timestamp(now, unit='s'))
+        if opens is None:
+            return now + 86400
+        return opens.value / 10**9
+
     @base.BaseBroker._exception_handler
     def fetch_option_market_data(self, symbol: str):
-      
+        # Quotes of options that are held were already fetched when positions were updated
+        if symbol in self.option_quotes:
+            return self.option_quotes[symbol]
+        return self._fetch_option_quotes([symbol])[symbol]
+
+    def _fetch_option_quotes(self, symbols: List[str]) -> Dict[str, Dict[str, float]]:
+        """Requests quotes of several options concurrently. The quotes are reused by 
+        fetch_option_market_data() until exit() is called at the end of the tick.
+        """
+        futures = {s: self.pool.submit(self._fetch_option_quote, s) for s in dict.fromkeys(symbols)}
+        quotes = {s: f.result() for s, f in futures.items()}
+        self.option_quotes.update(quotes)
+        return quotes
+
+    def _fetch_option_quote(self, symbol: str) -> Dict[str, float]:
         sym, date, type, price = self.occ_to_data(symbol)
         ret = rh.get_option_market_data(
             sym,
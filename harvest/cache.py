@@ -0,0 +1,183 @@
+# Builtins
+import json
+import os
+import pickle
+import re
+import threading
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Iterable
+
+class FileCache:
+    """A dictionary that is kept in memory and saved to a JSON file, so that it persists
+    between runs. This is meant for data that never changes once it is known, such as
+    the symbol an instrument URL refers to, so entries never expire.
+
+    The file is written to a temporary path first and then renamed, so a crash while
+    saving never corrupts it. The cache can be used from several threads at once.
+    """
+
+    def __init__(self, path: str=None) -> None:
+        """
+        :path: Path of the JSON file. If None, the cache is only kept in memory.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {}
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError):
+                # A broken cache is only a performance problem, so start over
+                self.data = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.data
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def get(self, key: str, default: Any=None) -> Any:
+        return self.data.get(key, default)
+
+    def get_many(self, keys: Iterable[str], fetch: Callable[[str], Any], pool: Executor=None) -> Dict[str, Any]:
+        """Returns the values of keys. Keys that are not cached are fetched with fetch(key),
+        concurrently if a pool is given, and the file is saved once afterwards.
+        Values that are None are returned but not cached.
+        """
+        keys = list(dict.fromkeys(keys))
+        missing = [k for k in keys if k not in self.data]
+        if len(missing) > 0:
+            if pool is None:
+                values = [fetch(k) for k in missing]
+            else:
+                values = list(pool.map(fetch, missing))
+            self.update({k: v for k, v in zip(missing, values) if v is not None})
+            fetched = dict(zip(missing, values))
+        else:
+            fetched = {}
+        return {k: self.data[k] if k in self.data else fetched.get(k) for k in keys}
+
+    def update(self, values: Dict[str, Any]) -> None:
+        """Adds values to the cache, and saves it."""
+        if len(values) == 0:
+            return
+        with self.lock:
+            self.data.update(values)
+            self._save()
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+class TTLCache:
+    """A cache whose entries expire, either a fixed number of seconds after they were 
+    added, or at a time calculated when they are added (such as the next market open).
+
+    If a directory is given, each entry is also pickled to a file in it, so entries 
+    that have not expired yet survive restarts.
+    """
+
+    def __init__(self, ttl: float=None, expires: Callable[[float], float]=None, path: str=None, 
+        clock: Callable[[], float]=time.time) -> None:
+        """
+        :ttl: Seconds entries are kept for
+        :expires: Takes the current time, and returns the time entries added now expire. 
+            Used instead of ttl if given. Times are unix timestamps.
+        :path: Directory to save entries to. If None, entries are only kept in memory.
+        :clock: Returns the current time as a unix timestamp
+        """
+        if ttl is None and expires is None:
+            raise Exception("Either ttl or expires must be specified")
+        self.ttl = ttl
+        self.expires = expires
+        self.path = path
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.data = {}  # key -> (time the entry expires, value)
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def get(self, key: str, default: Any=None) -> Any:
+        """Returns the value of key, or default if it is not cached or has expired.
+        Expired entries are removed, along with their saved files.
+        """
+        entry = self.data.get(key)
+        if entry is None:
+            entry = self._load(key)
+        if entry is None:
+            return default
+        if entry[0] <= self.clock():
+            with self.lock:
+                # The entry may have been replaced since it was read
+                if self.data.get(key) is entry:
+                    del self.data[key]
+                    self._remove(key)
+            return default
+        return entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        now = self.clock()
+        expires = self.expires(now) if self.expires is not None else now + self.ttl
+        entry = (expires, value)
+        with self.lock:
+            self.data[key] = entry
+            self._save(key, entry)
+
+    def clear(self) -> None:
+        """Removes all entries, including the saved ones."""
+        with self.lock:
+            for key in list(self.data):
+                self._remove(key)
+            self.data = {}
+
+    def _file(self, key: str) -> str:
+        if self.path is None:
+            return None
+        return os.path.join(self.path, re.sub('[^A-Za-z0-9_.-]', '_', key) + '.pkl')
+
+    def _load(self, key: str) -> Any:
+        file = self._file(key)
+        if file is None or not os.path.exists(file):
+            return None
+        try:
+            with open(file, 'rb') as f:
+                entry = pickle.load(f)
+        except Exception:
+            return None
+        self.data[key] = entry
+        return entry
+
+    def _remove(self, key: str) -> None:
+        file = self._file(key)
+        if file is None:
+            return
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            # Another process may have removed it already
+            pass
+
+    def _save(self, key: str, entry: Any) -> None:
+        file = self._file(key)
+        if file is None:
+            return
+        tmp = f"{file}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump(entry, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, file)
@@ -0,0 +1,257 @@
+# Builtins
+import datetime as dt
+from typing import Any, Dict, Iterable, List
+
+# External libraries
+import numpy as np
+import pandas as pd
+
+# Market holidays and half days of the NYSE. Each line is a date, followed by the
+# time (in New York) the market closes early on that day. Dates without a time are
+# days the market is closed. Days outside of the table are assumed to be regular sessions.
+NYSE_TABLE = """
+2021-01-01
+2021-01-18
+2021-02-15
+2021-04-02
+2021-05-31
+2021-07-05
+2021-09-06
+2021-11-25
+2021-11-26,13:00
+2021-12-24
+2022-01-17
+2022-02-21
+2022-04-15
+2022-05-30
+2022-06-20
+2022-07-04
+2022-09-05
+2022-11-24
+2022-11-25,13:00
+2022-12-26
+2023-01-02
+2023-01-16
+2023-02-20
+2023-04-07
+2023-05-29
+2023-06-19
+2023-07-03,13:00
+2023-07-04
+2023-09-04
+2023-11-23
+2023-11-24,13:00
+2023-12-25
+2024-01-01
+2024-01-15
+2024-02-19
+2024-03-29
+2024-05-27
+2024-06-19
+2024-07-03,13:00
+2024-07-04
+2024-09-02
+2024-11-28
+2024-11-29,13:00
+2024-12-24,13:00
+2024-12-25
+2025-01-01
+2025-01-09
+2025-01-20
+2025-02-17
+2025-04-18
+2025-05-26
+2025-06-19
+2025-07-03,13:00
+2025-07-04
+2025-09-01
+2025-11-27
+2025-11-28,13:00
+2025-12-24,13:00
+2025-12-25
+2026-01-01
+2026-01-19
+2026-02-16
+2026-04-03
+2026-05-25
+2026-06-19
+2026-07-03
+2026-09-07
+2026-11-26
+2026-11-27,13:00
+2026-12-24,13:00
+2026-12-25
+2027-01-01
+2027-01-18
+2027-02-15
+2027-03-26
+2027-05-31
+2027-06-18
+2027-07-05
+2027-09-06
+2027-11-25
+2027-11-26,13:00
+2027-12-24
+"""
+
+def _ns(time: Any) -> Any:
+    """Converts a timestamp, or an array of timestamps, into nanoseconds since the epoch.
+    Naive timestamps are assumed to be in UTC.
+    """
+    if isinstance(time, np.ndarray) and time.dtype.kind in 'iu':
+        return time.astype('int64')
+    if isinstance(time, (pd.DatetimeIndex, np.ndarray, list)):
+        index = pd.DatetimeIndex(time)
+        if index.tz is not None:
+            index = index.tz_convert('UTC').tz_localize(None)
+        return index.values.astype('int64')
+    t = pd.Timestamp(time)
+    if t.tz is not None:
+        t = t.tz_convert('UTC').tz_localize(None)
+    return t.value
+
+def parse_table(lines: Iterable[str]) -> Dict[dt.date, dt.time]:
+    """Parses a table of holidays and half days in the format of NYSE_TABLE.
+
+    :returns: A dictionary mapping each date to the time the market closes, or None if it is closed.
+    """
+    table = {}
+    for line in lines:
+        line = line.split('#')[0].strip()
+        if line == '':
+            continue
+        parts = [p.strip() for p in line.split(',')]
+        day = dt.date.fromisoformat(parts[0])
+        close = dt.time.fromisoformat(parts[1]) if len(parts) > 1 and parts[1] != '' else None
+        table[day] = close
+    return table
+
+class Calendar:
+    """A market that is always open, such as crypto. Trading days start at midnight UTC.
+
+    All methods accept timestamps in any format pandas understands, and naive timestamps
+    are assumed to be in UTC. is_open() and day_start() also accept arrays of timestamps.
+    """
+
+    def is_open(self, time: Any) -> Any:
+        """Returns whether the market is open at time."""
+        t = _ns(time)
+        if np.ndim(t) > 0:
+            return np.ones(len(t), dtype=bool)
+        return True
+
+    def next_open(self, time: Any) -> pd.Timestamp:
+        """Returns time if the market is open, otherwise the time it opens next."""
+        return pd.Timestamp(_ns(time), tz='UTC')
+
+    def next_session_open(self, time: Any) -> pd.Timestamp:
+        """Returns the time the next session opens, after the one that is open at time."""
+        return pd.Timestamp(self.day_start(time) + 86400 * 10**9, tz='UTC')
+
+    def is_open_between(self, start: Any, end: Any) -> bool:
+        """Returns whether the market is open at any point between start and end."""
+        return _ns(start) <= _ns(end)
+
+    def is_close(self, time: Any) -> bool:
+        """Returns whether time is the end of a trading day."""
+        return _ns(time) % (86400 * 10**9) == 0
+
+    def day_start(self, time: Any) -> Any:
+        """Returns the start of the trading day that time belongs to, in nanoseconds since the epoch."""
+        t = _ns(time)
+        return t - t % (86400 * 10**9)
+
+class MarketCalendar(Calendar):
+    """A market with regular trading sessions on weekdays, except on holidays.
+
+    The open and close of every session are calculated in advance, so checking
+    whether the market is open is a binary search. Trading days start at midnight
+    in the market's timezone.
+    """
+
+    def __init__(self, tz: str, open_time: dt.time, close_time: dt.time, table: Dict[dt.date, dt.time]={},
+        start: str='2000-01-01', end: str='2040-12-31') -> None:
+        """
+        :tz: Timezone of the market
+        :open_time: Time the market opens, in the market's timezone
+        :close_time: Time the market closes on regular days
+        :table: Holidays and half days, as returned by parse_table()
+        :start: First day sessions are calculated for
+        :end: Last day sessions are calculated for
+        """
+        self.tz = tz
+        days = pd.bdate_range(start, end)
+        closed = [d for d, c in table.items() if c is None]
+        days = days[~days.isin(pd.to_datetime(closed))]
+
+        opens = days + pd.Timedelta(hours=open_time.hour, minutes=open_time.minute)
+        closes = days + pd.Timedelta(hours=close_time.hour, minutes=close_time.minute)
+        early = {pd.Timestamp(d): c for d, c in table.items() if c is not None}
+        if len(early) > 0:
+            closes = pd.DatetimeIndex([
+                d + pd.Timedelta(hours=early[d].hour, minutes=early[d].minute) if d in early else c
+                for d, c in zip(days, closes)])
+
+        self.opens = _ns(opens.tz_localize(tz))
+        self.closes = _ns(closes.tz_localize(tz))
+
+    @classmethod
+    def from_file(cls, path: str, tz: str, open_time: dt.time, close_time: dt.time, **kwargs):
+        """Creates a calendar from a file of holidays and half days, in the format of NYSE_TABLE."""
+        with open(path, 'r') as f:
+            return cls(tz, open_time, close_time, parse_table(f), **kwargs)
+
+    def _session(self, t: Any) -> Any:
+        """Returns the index of the last session that opened at or before t, or -1 if there is none."""
+        return np.searchsorted(self.opens, t, side='right') - 1
+
+    def is_open(self, time):
+        t = _ns(time)
+        i = self._session(t)
+        return (i >= 0) & (t < self.closes[np.maximum(i, 0)])
+
+    def next_open(self, time):
+        t = _ns(time)
+        if self.is_open(t):
+            return pd.Timestamp(t, tz='UTC')
+        i = np.searchsorted(self.opens, t, side='left')
+        if i >= len(self.opens):
+            return None
+        return pd.Timestamp(self.opens[i], tz='UTC')
+
+    def next_session_open(self, time):
+        i = np.searchsorted(self.opens, _ns(time), side='right')
+        if i >= len(self.opens):
+            return None
+        return pd.Timestamp(self.opens[i], tz='UTC')
+
+    def is_open_between(self, start, end):
+        start = _ns(start)
+        if self.is_open(start):
+            return True
+        nxt = self.next_open(start)
+        return nxt is not None and nxt.value <= _ns(end)
+
+    def is_close(self, time):
+        t = _ns(time)
+        i = np.searchsorted(self.closes, t, side='left')
+        return i < len(self.closes) and self.closes[i] == t
+
+    def day_start(self, time):
+        t = _ns(time)
+        index = pd.DatetimeIndex(np.atleast_1d(t).astype('datetime64[ns]')).tz_localize('UTC').tz_convert(self.tz)
+        start = _ns(index.normalize())
+        return start if np.ndim(t) > 0 else start[0]
+
+CRYPTO = Calendar()
+NYSE = MarketCalendar('America/New_York', dt.time(9, 30), dt.time(16, 0), parse_table(NYSE_TABLE.splitlines()))
+
+def get_calendar(symbol: str) -> Calendar:
+    """Returns the calendar of the market a symbol is traded in. Cryptos are prepended with '@'."""
+    if symbol[0] == '@':
+        return CRYPTO
+    return NYSE
+
+def expected_symbols(symbols: List[str], time: Any) -> List[str]:
+    """Returns the symbols whose market is open at time."""
+    return [s for s in symbols if get_calendar(s).is_open(time)]
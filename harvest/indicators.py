@@ -0,0 +1,388 @@
+# Builtins
+import abc
+import math
+from typing import Any, Iterable, Tuple
+
+# External libraries
+import numpy as np
+
+# Vectorized implementations of technical indicators.
+# These are numerically equivalent to the indicators in finta, but work directly on
+# numpy arrays. Prices can also be a 2D array, in which case each row is treated as a 
+# separate series. Rows can be padded with NaN at the start if they have different lengths.
+
+def _rolling_sums(x: np.ndarray, period: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Calculates the sum and sum of squares of each window of period prices, relative
+    to an offset close to the prices in the window.
+
+    Plain cumulative sums lose precision as they grow, and so does offsetting all prices 
+    by a single price once they drift away from it. Instead, prices are split into blocks 
+    of period prices, and each block is offset by its own first price and summed separately.
+    A window covers the start of one block and the end of the previous one, so the sums of 
+    the previous block are shifted to the offset of the current one before they are added.
+    Only nearby prices are ever summed together, so the error does not grow with the length 
+    of the series.
+
+    :returns: A tuple of the sums, sums of squares, number of valid prices in each window, and the offsets.
+    """
+    n = x.shape[-1]
+    blocks = -(-n // period)
+    padded = np.full(x.shape[:-1] + (blocks * period,), np.nan)
+    padded[..., :n] = x
+    # An empty block is added at the front, for the windows of the first block to look back into
+    shape = x.shape[:-1] + (blocks + 1, period)
+    xb = np.concatenate([np.full(x.shape[:-1] + (period,), np.nan), padded], axis=-1).reshape(shape)
+
+    valid = ~np.isnan(xb)
+    first = np.argmax(valid, axis=-1)[..., None]
+    offset = np.nan_to_num(np.take_along_axis(xb, first, axis=-1))
+    v = np.where(valid, xb - offset, 0.0)
+
+    pad = np.zeros(shape[:-1] + (1,))
+    cs = np.concatenate([pad, np.cumsum(v, axis=-1)], axis=-1)
+    cs2 = np.concatenate([pad, np.cumsum(v * v, axis=-1)], axis=-1)
+    cnt = np.concatenate([pad, np.cumsum(valid, axis=-1)], axis=-1)
+
+    # The window ending at position r of block k covers positions 0..r of block k,
+    # and positions r+1.. of block k-1
+    cur, cur_sq, cur_cnt = cs[..., 1:, 1:], cs2[..., 1:, 1:], cnt[..., 1:, 1:]
+    prev = cs[..., :-1, -1:] - cs[..., :-1, 1:]
+    prev_sq = cs2[..., :-1, -1:] - cs2[..., :-1, 1:]
+    prev_cnt = cnt[..., :-1, -1:] - cnt[..., :-1, 1:]
+    shift = offset[..., :-1, :] - offset[..., 1:, :]
+    total = cur + prev + prev_cnt * shift
+    total_sq = cur_sq + prev_sq + 2 * shift * prev + prev_cnt * shift * shift
+    count = cur_cnt + prev_cnt
+    offset = np.broadcast_to(offset[..., 1:, :], total.shape)
+
+    flat = lambda a: a.reshape(x.shape[:-1] + (-1,))[..., period - 1:n]
+    return flat(total), flat(total_sq), flat(count), flat(offset)
+
+def _ewm(x: np.ndarray, alpha: float) -> np.ndarray:
+    """Exponentially weighted mean, same as pandas' ewm(alpha=alpha, adjust=True).mean().
+
+    This is the recursive filter num[t] = x[t] + (1-alpha) * num[t-1], divided by the 
+    same filter applied to a series of ones. The recursion is solved in blocks with 
+    cumulative sums, where the block length is chosen so that the weights do not overflow. 
+    NaN prices are skipped.
+    """
+    decay = 1 - alpha
+    valid = ~np.isnan(x)
+    if decay <= 0:
+        return np.where(valid, x, np.nan)
+
+    v = np.where(valid, x, 0.0)
+    w = valid.astype(float)
+    num = np.empty(x.shape)
+    den = np.empty(x.shape)
+    carry_num = np.zeros(x.shape[:-1])
+    carry_den = np.zeros(x.shape[:-1])
+
+    n = x.shape[-1]
+    block = max(1, int(np.log(1e100) / -np.log(decay)))
+    for start in range(0, n, block):
+        end = min(start + block, n)
+        j = np.arange(end - start)
+        grow = decay ** -j
+        shrink = decay ** j
+        num[..., start:end] = shrink * (decay * carry_num[..., None] + np.cumsum(v[..., start:end] * grow, axis=-1))
+        den[..., start:end] = shrink * (decay * carry_den[..., None] + np.cumsum(w[..., start:end] * grow, axis=-1))
+        carry_num = num[..., end - 1]
+        carry_den = den[..., end - 1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return num / den
+
+def sma(prices: Any, period: int=14) -> np.ndarray:
+    """Simple moving average, calculated with cumulative sums."""
+    x = np.asarray(prices, dtype=float)
+    out = np.full(x.shape, np.nan)
+    if period > x.shape[-1]:
+        return out
+    total, _, count, offset = _rolling_sums(x, period)
+    out[..., period - 1:] = np.where(count == period, total / period + offset, np.nan)
+    return out
+
+def ema(prices: Any, period: int=14) -> np.ndarray:
+    """Exponential moving average, with span=period."""
+    x = np.asarray(prices, dtype=float)
+    return _ewm(x, 2 / (period + 1))
+
+def rsi(prices: Any, period: int=14) -> np.ndarray:
+    """Relative strength index, where gains and losses are smoothed with alpha=1/period."""
+    x = np.asarray(prices, dtype=float)
+    delta = np.full(x.shape, np.nan)
+    delta[..., 1:] = np.diff(x, axis=-1)
+    missing = np.isnan(delta)
+    up = np.where(missing, np.nan, np.maximum(delta, 0.0))
+    down = np.where(missing, np.nan, np.maximum(-delta, 0.0))
+
+    gain = _ewm(up, 1 / period)
+    loss = _ewm(down, 1 / period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 - 100 / (1 + gain / loss)
+
+def bbands(prices: Any, period: int=14, dev: float=1.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Bollinger bands around a simple moving average. The standard deviation is
+    calculated from rolling sums of prices and squared prices, see _rolling_sums().
+
+    :returns: A tuple of the upper, middle, and lower bands.
+    """
+    x = np.asarray(prices, dtype=float)
+    mid = np.full(x.shape, np.nan)
+    std = np.full(x.shape, np.nan)
+    if period > x.shape[-1]:
+        return mid, mid.copy(), mid.copy()
+
+    total, total_sq, count, offset = _rolling_sums(x, period)
+    full = count == period
+    mid[..., period - 1:] = np.where(full, total / period + offset, np.nan)
+    if period > 1:
+        var = np.maximum(total_sq - total * total / period, 0.0) / (period - 1)
+        std[..., period - 1:] = np.where(full, np.sqrt(var), np.nan)
+    return mid + dev * std, mid, mid - dev * std
+
+class Indicator(abc.ABC):
+    """Base class for technical indicators that are updated one price at a time.
+
+    An indicator keeps the prices it has seen, a small state (such as a running sum),
+    and the series of values it has calculated so far. Each update costs O(1),
+    regardless of how long the history is. The last price can be replaced, which
+    rolls the state back by one step before applying the new price.
+
+    If maxlen is set, only the last maxlen prices and values are kept. They are stored
+    in an array of twice that size, and slid back to the front once it is full, the 
+    same way the RingBuffer of the Queue is compacted.
+
+    Indicators can be subscribed to the Queue, in which case they are updated
+    every time a new candle is written.
+    """
+
+    outputs = 1     # Number of series the indicator calculates
+
+    def __init__(self, period: int, maxlen: int=None) -> None:
+        """
+        :period: Number of prices each value is calculated from
+        :maxlen: Maximum number of prices and values to keep. If None, they are never truncated.
+        """
+        self.period = period
+        self.maxlen = maxlen
+        self.reset()
+
+    def _keep(self) -> int:
+        """Number of prices kept when the arrays are compacted. Enough prices are always kept
+        for step() to look back a whole period."""
+        if self.maxlen is None:
+            return None
+        return max(self.maxlen, self.period + 1)
+
+    def reset(self, values: Iterable[float]=()) -> None:
+        """Clears the indicator, and calculates it over values."""
+        size = max(256, 2 * len(values))
+        if self.maxlen is not None:
+            size = min(size, 2 * self._keep())
+        self.n = 0      # Number of prices in self.x
+        self.seen = 0   # Number of prices seen since the indicator was reset
+        self.x = np.empty(size)
+        self.y = np.empty((self.outputs, size))
+        self.state = self.initial()
+        self.prev = self.state
+        for v in values:
+            self.update(v)
+
+    def _reserve(self) -> None:
+        """Makes room for one more price, by dropping the oldest ones if maxlen is set,
+        or by doubling the size of the arrays otherwise."""
+        keep = self._keep()
+        if keep is not None and self.n > keep:
+            self.x[:keep] = self.x[self.n - keep:self.n]
+            self.y[:, :keep] = self.y[:, self.n - keep:self.n]
+            self.n = keep
+        else:
+            self.x = np.concatenate([self.x, np.empty(self.n)])
+            self.y = np.concatenate([self.y, np.empty((self.outputs, self.n))], axis=1)
+
+    def update(self, value: float, replace: bool=False) -> None:
+        """Adds a new price.
+
+        :replace: If True, the value replaces the last price instead.
+        """
+        if replace and self.n > 0:
+            self.n -= 1
+            self.seen -= 1
+            self.state = self.prev
+        elif self.n == len(self.x):
+            self._reserve()
+
+        i = self.n
+        self.x[i] = value
+        self.prev = self.state
+        self.state, out = self.step(self.state, i)
+        self.y[:, i] = out
+        self.n += 1
+        self.seen += 1
+
+    def values(self, count: int=None) -> Any:
+        """Returns the calculated series as read-only numpy arrays.
+        The arrays are views that are only valid until the next update.
+
+        :count: If specified, only the last count values are returned.
+        """
+        first = 0 if count is None else max(self.n - count, 0)
+        y = self.y[:, first:self.n]
+        y.flags.writeable = False
+        if self.outputs == 1:
+            return y[0]
+        return tuple(y)
+
+    @classmethod
+    def create(cls, get, maxlen: int=None, **params):
+        """Creates the indicator. Indicators that are built from other indicators
+        should override this, and obtain them by calling get(cls, **params),
+        so that the same indicator can be shared by several others.
+        """
+        return cls(maxlen=maxlen, **params)
+
+    @abc.abstractmethod
+    def initial(self) -> Tuple:
+        """Returns the state of the indicator before it has seen any prices."""
+
+    @abc.abstractmethod
+    def step(self, state: Tuple, i: int) -> Tuple[Tuple, Any]:
+        """Calculates the indicator for the price at position i of self.x. 
+        Prices before it are at the positions before i, and self.seen is the 
+        number of prices that came before it since the indicator was reset.
+
+        :returns: A tuple of the new state and the calculated value(s).
+        """
+
+class SMA(Indicator):
+    """Simple moving average, same as finta's TA.SMA"""
+
+    def initial(self):
+        return (0.0,)
+
+    def step(self, state, i):
+        total = state[0] + self.x[i]
+        if self.seen >= self.period:
+            total -= self.x[i - self.period]
+        out = total / self.period if self.seen >= self.period - 1 else np.nan
+        return (total,), out
+
+class EMA(Indicator):
+    """Exponential moving average, same as finta's TA.EMA, which uses
+    pandas' ewm with span=period and adjust=True
+    """
+
+    def initial(self):
+        return (0.0, 0.0)
+
+    def step(self, state, i):
+        decay = 1 - 2 / (self.period + 1)
+        num = self.x[i] + decay * state[0]
+        den = 1.0 + decay * state[1]
+        return (num, den), num / den
+
+class RSI(Indicator):
+    """Relative strength index, same as finta's TA.RSI, which smooths gains
+    and losses using pandas' ewm with alpha=1/period and adjust=True
+    """
+
+    def initial(self):
+        return (0.0, 0.0)
+
+    def step(self, state, i):
+        if self.seen == 0:
+            return state, np.nan
+        decay = 1 - 1 / self.period
+        delta = self.x[i] - self.x[i - 1]
+        gain = max(delta, 0.0) + decay * state[0]
+        loss = max(-delta, 0.0) + decay * state[1]
+        if loss == 0:
+            out = 100.0 if gain > 0 else np.nan
+        else:
+            out = 100 - 100 / (1 + gain / loss)
+        return (gain, loss), out
+
+class StdDev(Indicator):
+    """Rolling sample standard deviation, same as pandas' rolling(period).std().
+
+    The rolling variance is calculated from running sums of prices and squared prices,
+    which are offset by a recent price to reduce the loss of precision. Once every period
+    prices, the sums are recalculated from the window, offset by the latest price, so 
+    rounding errors do not build up and prices do not drift away from the offset.
+    """
+
+    def initial(self):
+        return (0.0, 0.0, np.nan)   # Sum, sum of squares, and the offset
+
+    def step(self, state, i):
+        p = self.period
+        if p > 1 and self.seen >= p and self.seen % p == 0:
+            d = self.x[i - p + 1:i + 1] - self.x[i]
+            state = (float(d.sum()), float(d @ d), self.x[i])
+            return state, math.sqrt(max(state[1] - state[0] * state[0] / p, 0.0) / (p - 1))
+        offset = self.x[i] if self.seen == 0 else state[2]
+        v = self.x[i] - offset
+        total = state[0] + v
+        total_sq = state[1] + v * v
+        if self.seen >= p:
+            old = self.x[i - p] - offset
+            total -= old
+            total_sq -= old * old
+        state = (total, total_sq, offset)
+        if self.seen < p - 1 or p < 2:
+            return state, np.nan
+        return state, math.sqrt(max(total_sq - total * total / p, 0.0) / (p - 1))
+
+class BBands(Indicator):
+    """Bollinger bands, same as finta's TA.BBANDS with a SMA as the middle band.
+    Outputs the upper, middle, and lower band.
+
+    The bands are built from a SMA and a StdDev indicator. If they are passed in, 
+    they are assumed to be updated elsewhere (usually by the Queue) before the bands are, 
+    which allows bands with different dev to share them. Otherwise, the bands create 
+    and update their own.
+
+    The values of the sources are read from the end of their series, since shared
+    sources may have been created earlier, and keep a different number of values.
+    """
+
+    outputs = 3
+
+    def __init__(self, period: int, dev: float=1.0, sma: SMA=None, std: StdDev=None, maxlen: int=None) -> None:
+        self.dev = dev
+        self.owns_sources = sma is None or std is None
+        self.sma = SMA(period, maxlen) if self.owns_sources else sma
+        self.std = StdDev(period, maxlen) if self.owns_sources else std
+        self.lag = 0    # Number of prices the sources have seen that the bands have not yet
+        super().__init__(period, maxlen)
+
+    @classmethod
+    def create(cls, get, period: int, dev: float=1.0, maxlen: int=None):
+        return cls(period, dev, sma=get(SMA, period=period), std=get(StdDev, period=period), maxlen=maxlen)
+
+    def reset(self, values: Iterable[float]=()) -> None:
+        if self.owns_sources:
+            self.sma.reset()
+            self.std.reset()
+        else:
+            # The sources have already been reset with values
+            self.lag = len(values)
+        super().reset(values)
+
+    def update(self, value: float, replace: bool=False) -> None:
+        if self.owns_sources:
+            self.sma.update(value, replace)
+            self.std.update(value, replace)
+        elif self.lag > 0:
+            self.lag -= 1
+        super().update(value, replace)
+
+    def initial(self):
+        return ()
+
+    def step(self, state, i):
+        mid = self.sma.y[0, self.sma.n - 1 - self.lag]
+        std = self.std.y[0, self.std.n - 1 - self.lag]
+        return state, (mid + self.dev * std, mid, mid - self.dev * std)
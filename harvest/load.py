@@ -1,29 +1,69 @@
 # Builtins
 import os
+import json
+import threading
+import contextlib
+import time
 import datetime as dt
+from typing import Any, Dict, List, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where only threads of the same process are serialized
+    fcntl = None
 
 # External libraries
 import pandas as pd
-import numpy as np 
+import numpy as np
 
 # Script to collect hourly stock price data
 DB_PATH="./db"
 
+# Number of segments a day can have before they are merged into one
+COMPACT_SEGMENTS = 8
+
+# Seconds a snapshot is kept for after a newer one replaces it, so that other 
+# processes that are about to open it can still do so
+SNAPSHOT_GRACE = 3600
+
+DAY_NS = 86400 * 10**9
+
 class Load:
     """
     Load class provides an interface between the broker and the database
-    used to store the stock price. By default, data is saved as a pandas file 
-    in a local directory. There are future plans to extend the class and provide 
-    interface with other databases like PostgreSQL.    
+    used to store the stock price. By default, data is saved as numpy files
+    in a local directory. There are future plans to extend the class and provide
+    interface with other databases like PostgreSQL.
+
+    Data of each symbol and interval is kept in its own directory, as a list of
+    segments. A segment holds rows of a single day (in UTC), as a pair of .npy files:
+    the timestamps, and the values of each column. The segments are listed in the order 
+    they were written, along with the range of timestamps in each. The list is kept in 
+    a manifest.json file, followed by a segments.log file that new segments are appended to.
+
+    Saving data only writes the new rows as new segments, and appends a line to the log, 
+    so the cost does not grow with the size of the history. Files are written to a temporary 
+    path first and then renamed, and a segment only becomes visible once the log lists it, 
+    so a crash while saving never corrupts existing data. If rows with the same timestamp 
+    are saved more than once, the ones saved last are used. Once a day has accumulated 
+    too many segments, they are compacted into one, and the log is folded into the manifest.
+
+    Changes to the data of a symbol and interval are serialized with a lock file, so several 
+    processes (such as a recorder and a backtest) can use the same directory. Reading does 
+    not take the lock, except to migrate data saved by older versions.
     """
 
-    def __init__(self):
+    def __init__(self, path: str=DB_PATH):
+        self.path = path
+        self.lock = threading.Lock() # Guards self.locks
+        self.locks = {}              # (symbol, interval) -> lock that serializes changes made by threads of this process
         # if the data dir does not exists, create it
-        os.makedirs(DB_PATH, exist_ok=True)
+        os.makedirs(self.path, exist_ok=True)
 
     # get a datetime of last time database update was performed
     def get_timestamp(self, symbol, type):
-        path = f"{DB_PATH}/{symbol}/lastSave-{type}"
+        path = f"{self.path}/{symbol}/lastSave-{type}"
         if not os.path.exists(path):
             return dt.datetime(1970, 1, 1)
         ts = open(path)
@@ -32,29 +72,397 @@ class Load:
         return date
 
     def set_timestamp(self, symbol, date, type):
-        path = f"{DB_PATH}/{symbol}/lastSave-{type}"
+        path = f"{self.path}/{symbol}/lastSave-{type}"
+        os.makedirs(f"{self.path}/{symbol}", exist_ok=True)
         ts = open(path, 'w')
         ts.seek(0)
         date_str = date.strftime('%Y-%m-%d %H:%M')
         ts.write(date_str)
 
-    def append_entry(self, symbol, df, type):
-        save_path = f"{DB_PATH}/{symbol}/data-{type}" 
-        save_dir = f"{DB_PATH}/{symbol}"
-        if not os.path.isdir(save_dir):
-            os.mkdir(save_dir)
-        data = self.get_entry(symbol, type, update=False)
-        data = data.append(df)
-        data = data[~data.index.duplicated(keep='last')]
-        data.to_pickle(save_path)
-
-    def get_entry(self, symbol, interval, update=True):
-        path = f"{DB_PATH}/{symbol}/data-{interval}" 
-        save_dir = f"{DB_PATH}/{symbol}"
-        if not os.path.isdir(save_dir):
-            os.mkdir(save_dir)
+    def append_entry(self, symbol: str, df: pd.DataFrame, type: str) -> None:
+        """Saves the rows in df. Only the new rows are written.
+
+        :symbol: Symbol of the data
+        :df: A dataframe indexed by timestamp, with numeric columns
+        :type: Interval of the data
+        """
+        if df is None or df.empty:
+            return
+        self._migrate(symbol, type)
+        with self._locked(symbol, type):
+            manifest = self._read_manifest(symbol, type)
+            self._append(symbol, type, manifest, df)
+
+    def get_entry(self, symbol: str, interval: str, start: dt.datetime=None, end: dt.datetime=None) -> pd.DataFrame:
+        """Returns saved data of symbol and interval as a dataframe sorted by timestamp.
+        Only the segments that overlap the requested range are read from disk.
+        Returns an empty dataframe if nothing has been saved.
+
+        :start: If specified, only rows at or after this time are returned. Naive datetimes are assumed to be in UTC.
+        :end: If specified, only rows at or before this time are returned.
+        """
+        lo = None if start is None else self._to_ns(start)
+        hi = None if end is None else self._to_ns(end)
+        self._migrate(symbol, interval)
+        for attempt in range(2):
+            manifest = self._read_manifest(symbol, interval)
+            segments = [
+                s for s in manifest['segments']
+                if (lo is None or s['end'] >= lo) and (hi is None or s['start'] <= hi)
+            ]
+            if len(segments) == 0:
+                return pd.DataFrame()
+            try:
+                ts, data = self._read_segments(symbol, interval, segments)
+                break
+            except FileNotFoundError:
+                # Another process compacted the segments after the manifest was read
+                if attempt == 1:
+                    raise
+        first = 0 if lo is None else np.searchsorted(ts, lo, side='left')
+        last = len(ts) if hi is None else np.searchsorted(ts, hi, side='right')
+        return self._to_df(manifest, ts[first:last], data[first:last])
+
+    def get_range(self, symbol: str, interval: str) -> Tuple[pd.Timestamp, pd.Timestamp]:
+        """Returns the timestamps of the first and last saved rows, without reading any data.
+        Returns (None, None) if nothing has been saved.
+        """
+        self._migrate(symbol, interval)
+        segments = self._read_manifest(symbol, interval)['segments']
+        if len(segments) == 0:
+            return None, None
+        first = min(s['start'] for s in segments)
+        last = max(s['end'] for s in segments)
+        return pd.Timestamp(first, tz='UTC'), pd.Timestamp(last, tz='UTC')
+
+    def get_arrays(self, symbol: str, interval: str, start: dt.datetime=None, end: dt.datetime=None) -> Tuple[pd.DatetimeIndex, np.ndarray, pd.Index]:
+        """Returns saved data of symbol and interval as a read-only array that is memory-mapped 
+        from disk, so it is only paged in as it is read. The OS page cache is shared between
+        processes, so several backtests on the same data share the same physical memory.
+
+        The segments are merged into a single snapshot file the first time this is called
+        after the data has changed. The snapshot is written one day at a time, so the whole
+        history is never held in memory.
+
+        :start: If specified, only rows at or after this time are returned.
+        :end: If specified, only rows at or before this time are returned.
+        :returns: A tuple of the timestamps, a memory-mapped 2D array with a row for each timestamp, 
+            and the columns of the array.
+        """
+        self._migrate(symbol, interval)
+        manifest = self._read_manifest(symbol, interval)
+        if len(manifest['segments']) == 0:
+            return pd.DatetimeIndex([]), np.empty((0, 0)), pd.Index([])
+
+        snapshot = self._read_snapshot(symbol, interval)
+        if snapshot is None or snapshot['version'] != manifest['next']:
+            with self._locked(symbol, interval):
+                # Another process may have written the snapshot while waiting for the lock
+                manifest = self._read_manifest(symbol, interval)
+                snapshot = self._read_snapshot(symbol, interval)
+                if snapshot is None or snapshot['version'] != manifest['next']:
+                    snapshot = self._write_snapshot(symbol, interval, manifest, snapshot)
+
+        path = f"{self._dir(symbol, interval)}/{snapshot['name']}"
+        ts = np.load(f"{path}-ts.npy", mmap_mode='r')
+        data = np.load(f"{path}-data.npy", mmap_mode='r')
+        first = 0 if start is None else np.searchsorted(ts, self._to_ns(start), side='left')
+        last = len(ts) if end is None else np.searchsorted(ts, self._to_ns(end), side='right')
+
+        return self._index(manifest, ts[first:last]), data[first:last], self._columns(manifest)
+
+    def compact(self, symbol: str, interval: str) -> None:
+        """Merges the segments of each day into a single segment."""
+        self._migrate(symbol, interval)
+        with self._locked(symbol, interval):
+            manifest = self._read_manifest(symbol, interval)
+            for day in sorted(set(s['day'] for s in manifest['segments'])):
+                self._compact_day(symbol, interval, manifest, day)
+
+    ############# Helper functions #################
+
+    def _dir(self, symbol: str, interval: str) -> str:
+        return f"{self.path}/{symbol}/{interval}"
+
+    @contextlib.contextmanager
+    def _locked(self, symbol: str, interval: str):
+        """Holds the lock of symbol and interval, which serializes changes made by all threads
+        and processes. This is not reentrant.
+        """
+        os.makedirs(self._dir(symbol, interval), exist_ok=True)
+        with self.lock:
+            lock = self.locks.setdefault((symbol, interval), threading.Lock())
+        with lock, open(f"{self._dir(symbol, interval)}/lock", 'a') as f:
+            # The lock is released when the file is closed
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def _to_ns(self, time: dt.datetime) -> int:
+        time = pd.Timestamp(time)
+        if time.tz is None:
+            time = time.tz_localize('UTC')
+        return time.value
+
+    def _read_manifest(self, symbol: str, interval: str) -> Dict[str, Any]:
+        """Reads the manifest, and adds the segments listed in the log to it."""
+        # The log is read first. The manifest is only replaced before the log is cleared,
+        # so the manifest read afterwards is at least as recent as the log.
+        logged = self._read_log(symbol, interval)
+        path = f"{self._dir(symbol, interval)}/manifest.json"
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                manifest = json.load(f)
+            # Segments that are already in the manifest were numbered before its 'next'
+            for s in logged:
+                if self._number(s) >= manifest['next']:
+                    manifest['segments'].append(s)
+                    manifest['next'] = self._number(s) + 1
+            return manifest
+
+        return {'columns': None, 'multiindex': False, 'tz': None, 'next': 0, 'segments': []}
+
+    def _migrate(self, symbol: str, interval: str) -> None:
+        """Saves data that was saved as a single pickle by older versions as segments, 
+        unless segments have been saved already.
+        """
+        legacy = f"{self.path}/{symbol}/data-{interval}"
+        manifest = f"{self._dir(symbol, interval)}/manifest.json"
+        if not os.path.exists(legacy) or os.path.exists(manifest):
+            return
+        with self._locked(symbol, interval):
+            # Another thread or process may have migrated it while waiting for the lock
+            if os.path.exists(manifest):
+                return
+            df = pd.read_pickle(legacy)
+            if not df.empty:
+                self._append(symbol, interval, self._read_manifest(symbol, interval), df)
+
+    def _write_manifest(self, symbol: str, interval: str, manifest: Dict[str, Any]) -> None:
+        """Replaces the manifest, which then lists every segment, and clears the log."""
+        self._save_json(f"{self._dir(symbol, interval)}/manifest.json", manifest)
+        log = f"{self._dir(symbol, interval)}/segments.log"
+        if os.path.exists(log):
+            os.remove(log)
+
+    def _number(self, segment: Dict[str, Any]) -> int:
+        """Returns the number segments are named by, which increases in the order they are written."""
+        return int(segment['name'].rsplit('-', 1)[1])
+
+    def _read_log(self, symbol: str, interval: str) -> List[Dict[str, Any]]:
+        path = f"{self._dir(symbol, interval)}/segments.log"
         if not os.path.exists(path):
-            data = pd.DataFrame()
-            data.to_pickle(path)
-        return pd.read_pickle(path)
-    
\ No newline at end of file
+            return []
+        with open(path, 'r') as f:
+            lines = f.read().split('\n')
+        segments = []
+        for line in lines:
+            # A line that was only partly written by a crash is skipped
+            try:
+                segments.append(json.loads(line))
+            except ValueError:
+                pass
+        return segments
+
+    def _log_segment(self, symbol: str, interval: str, segment: Dict[str, Any]) -> None:
+        """Appends a segment to the log. Each entry starts with a line break, so an entry 
+        is never joined to the end of one that was only partly written.
+        """
+        path = f"{self._dir(symbol, interval)}/segments.log"
+        with open(path, 'a') as f:
+            f.write('\n' + json.dumps(segment))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _save_json(self, path: str, obj: Any) -> None:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(obj, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _save_array(self, path: str, arr: np.ndarray) -> None:
+        # The temporary file is unique to the process, in case several processes write at the same time
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, arr)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _append(self, symbol: str, interval: str, manifest: Dict[str, Any], df: pd.DataFrame) -> None:
+        os.makedirs(self._dir(symbol, interval), exist_ok=True)
+        columns = [list(c) if isinstance(c, tuple) else c for c in df.columns]
+        new = manifest['columns'] is None
+        if new:
+            manifest['columns'] = columns
+            manifest['multiindex'] = isinstance(df.columns, pd.MultiIndex)
+            manifest['tz'] = None if df.index.tz is None else str(df.index.tz)
+        elif columns != manifest['columns']:
+            if sorted(map(str, columns)) != sorted(map(str, manifest['columns'])):
+                raise Exception(f"Columns {columns} do not match the saved columns {manifest['columns']}")
+            df = df[[tuple(c) if isinstance(c, list) else c for c in manifest['columns']]]
+
+        index = df.index
+        if index.tz is not None:
+            index = index.tz_convert('UTC').tz_localize(None)
+        ts = index.values.astype('datetime64[ns]').astype('int64')
+        data = df.to_numpy(dtype=float)
+        order = np.argsort(ts, kind='stable')
+        ts, data = ts[order], data[order]
+
+        days = ts // DAY_NS
+        bounds = np.flatnonzero(np.diff(days)) + 1
+        touched = []
+        for first, last in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(ts)]])):
+            day = str(np.datetime64(int(days[first]), 'D')).replace('-', '')
+            name = f"{day}-{manifest['next']}"
+            manifest['next'] += 1
+            self._save_array(f"{self._dir(symbol, interval)}/{name}-ts.npy", ts[first:last])
+            self._save_array(f"{self._dir(symbol, interval)}/{name}-data.npy", data[first:last])
+            segment = {
+                'name': name,
+                'day': day,
+                'start': int(ts[first]),
+                'end': int(ts[last - 1]),
+                'rows': int(last - first)
+            }
+            manifest['segments'].append(segment)
+            # The new segment becomes visible once the log lists it. The layout of the 
+            # columns is only known from the manifest, so the first data writes the manifest instead.
+            if new:
+                continue
+            self._log_segment(symbol, interval, segment)
+            touched.append(day)
+
+        if new:
+            self._write_manifest(symbol, interval, manifest)
+
+        for day in touched:
+            if sum(1 for s in manifest['segments'] if s['day'] == day) > COMPACT_SEGMENTS:
+                self._compact_day(symbol, interval, manifest, day)
+
+    def _compact_day(self, symbol: str, interval: str, manifest: Dict[str, Any], day: str) -> None:
+        old = [s for s in manifest['segments'] if s['day'] == day]
+        if len(old) <= 1:
+            return
+        ts, data = self._read_segments(symbol, interval, old)
+
+        name = f"{day}-{manifest['next']}"
+        manifest['next'] += 1
+        self._save_array(f"{self._dir(symbol, interval)}/{name}-ts.npy", ts)
+        self._save_array(f"{self._dir(symbol, interval)}/{name}-data.npy", data)
+        merged = {'name': name, 'day': day, 'start': int(ts[0]), 'end': int(ts[-1]), 'rows': len(ts)}
+
+        # Replace the old segments, keeping the order of segments by when they were written
+        pos = manifest['segments'].index(old[-1])
+        manifest['segments'][pos] = merged
+        manifest['segments'] = [s for s in manifest['segments'] if not s in old]
+        self._write_manifest(symbol, interval, manifest)
+
+        for s in old:
+            for suffix in ['ts', 'data']:
+                path = f"{self._dir(symbol, interval)}/{s['name']}-{suffix}.npy"
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _read_snapshot(self, symbol: str, interval: str) -> Dict[str, Any]:
+        path = f"{self._dir(symbol, interval)}/snapshot.json"
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def _write_snapshot(self, symbol: str, interval: str, manifest: Dict[str, Any], old: Dict[str, Any]) -> Dict[str, Any]:
+        """Writes all data into a single pair of files, and records it in snapshot.json.
+
+        Snapshots that were replaced are only removed once they have been replaced for
+        SNAPSHOT_GRACE seconds, since other processes may have read a snapshot.json 
+        that names them, and not opened them yet.
+
+        :old: The snapshot being replaced, if any
+        """
+        directory = self._dir(symbol, interval)
+        snapshot = {'name': f"snapshot-{manifest['next']}", 'version': manifest['next'], 'replaced': []}
+        self._merge_to_files(symbol, interval, manifest, f"{directory}/{snapshot['name']}")
+
+        now = time.time()
+        expired = []
+        if old is not None:
+            replaced = old.get('replaced', []) + [{'name': old['name'], 'time': now}]
+            for r in replaced:
+                if r['name'] == snapshot['name']:
+                    continue
+                (expired if r['time'] + SNAPSHOT_GRACE <= now else snapshot['replaced']).append(r)
+        self._save_json(f"{directory}/snapshot.json", snapshot)
+
+        for r in expired:
+            for suffix in ['ts', 'data']:
+                try:
+                    os.remove(f"{directory}/{r['name']}-{suffix}.npy")
+                except OSError:
+                    pass
+        return snapshot
+
+    def _merge_to_files(self, symbol: str, interval: str, manifest: Dict[str, Any], path: str) -> None:
+        """Merges all segments into a pair of .npy files, in the same way as _read_segments().
+        Segments never span more than a day, so the days are merged one at a time, and 
+        written directly into memory-mapped output files.
+        """
+        days = {}
+        for s in manifest['segments']:
+            days.setdefault(s['day'], []).append(s)
+        days = [days[d] for d in sorted(days)]
+
+        # The number of rows is counted from the timestamps first, to size the files
+        directory = self._dir(symbol, interval)
+        counts = [
+            len(np.unique(np.concatenate([np.load(f"{directory}/{s['name']}-ts.npy", mmap_mode='r') for s in segments])))
+            for segments in days
+        ]
+        total = sum(counts)
+        tmp_ts = f"{path}-ts.npy.{os.getpid()}.tmp"
+        tmp_data = f"{path}-data.npy.{os.getpid()}.tmp"
+        out_ts = np.lib.format.open_memmap(tmp_ts, mode='w+', dtype='int64', shape=(total,))
+        out_data = np.lib.format.open_memmap(tmp_data, mode='w+', dtype=float, shape=(total, len(manifest['columns'])))
+        pos = 0
+        for segments, count in zip(days, counts):
+            ts, data = self._read_segments(symbol, interval, segments)
+            out_ts[pos:pos + count] = ts
+            out_data[pos:pos + count] = data
+            pos += count
+        out_ts.flush()
+        out_data.flush()
+        del out_ts, out_data
+        os.replace(tmp_ts, f"{path}-ts.npy")
+        os.replace(tmp_data, f"{path}-data.npy")
+
+    def _read_segments(self, symbol: str, interval: str, segments: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Reads segments and merges them. Returns the timestamps sorted, and the
+        corresponding rows. If a timestamp appears more than once, the row in the
+        segment listed last is used.
+        """
+        path = self._dir(symbol, interval)
+        ts = np.concatenate([np.load(f"{path}/{s['name']}-ts.npy") for s in segments])
+        data = np.concatenate([np.load(f"{path}/{s['name']}-data.npy") for s in segments])
+
+        order = np.argsort(ts, kind='stable')
+        ts, data = ts[order], data[order]
+        keep = np.ones(len(ts), dtype=bool)
+        keep[:-1] = ts[1:] != ts[:-1]
+        return ts[keep], data[keep]
+
+    def _index(self, manifest: Dict[str, Any], ts: np.ndarray) -> pd.DatetimeIndex:
+        index = pd.DatetimeIndex(ts.view('datetime64[ns]'))
+        if manifest['tz'] is not None:
+            index = index.tz_localize('UTC').tz_convert(manifest['tz'])
+        return index
+
+    def _columns(self, manifest: Dict[str, Any]) -> pd.Index:
+        if manifest['multiindex']:
+            return pd.MultiIndex.from_tuples([tuple(c) for c in manifest['columns']])
+        return pd.Index(manifest['columns'])
+
+    def _to_df(self, manifest: Dict[str, Any], ts: np.ndarray, data: np.ndarray) -> pd.DataFrame:
+        return pd.DataFrame(data, index=self._index(manifest, ts), columns=self._columns(manifest))
@@ -0,0 +1,182 @@
+# Builtins
+import datetime as dt
+from typing import Any, Dict
+
+# External libraries
+import numpy as np
+import pandas as pd
+
+# Vectorized Black-Scholes pricing of European options.
+# All functions take numpy arrays (or anything that broadcasts to them), so a whole
+# option chain is priced in a single pass. Time to expiration is in years, and rates,
+# dividend yields and volatilities are annualized, e.g. 0.25 for 25%.
+
+def _erfc(x: np.ndarray) -> np.ndarray:
+    """Complementary error function, using a Chebyshev approximation with a
+    fractional error below 1.2e-7 everywhere.
+    """
+    z = np.abs(x)
+    t = 1 / (1 + 0.5 * z)
+    poly = -1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (0.09678418 + t * (-0.18628806
+        + t * (0.27886807 + t * (-1.13520398 + t * (1.48851587 + t * (-0.82215223 + t * 0.17087277))))))))
+    ans = t * np.exp(-z * z + poly)
+    return np.where(x >= 0, ans, 2 - ans)
+
+def norm_cdf(x: Any) -> np.ndarray:
+    """Cumulative distribution function of the standard normal distribution."""
+    return 0.5 * _erfc(-np.asarray(x, dtype=float) / np.sqrt(2))
+
+def norm_pdf(x: Any) -> np.ndarray:
+    """Probability density function of the standard normal distribution."""
+    x = np.asarray(x, dtype=float)
+    return np.exp(-0.5 * x * x) / np.sqrt(2 * np.pi)
+
+def _d1_d2(S, K, T, sigma, r, q):
+    S, K, T, sigma = [np.asarray(a, dtype=float) for a in (S, K, T, sigma)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vol = sigma * np.sqrt(T)
+        d1 = (np.log(S / K) + (r - q + 0.5 * sigma * sigma) * T) / vol
+    return d1, d1 - vol
+
+def price(S: Any, K: Any, T: Any, sigma: Any, is_call: Any, r: float=0.0, q: float=0.0) -> np.ndarray:
+    """Theoretical price of each option.
+
+    :S: Price of the underlying
+    :K: Strike price
+    :T: Time to expiration, in years
+    :sigma: Volatility
+    :is_call: True for calls, False for puts
+    :r: Risk-free interest rate
+    :q: Dividend yield
+    """
+    d1, d2 = _d1_d2(S, K, T, sigma, r, q)
+    S, K, T = [np.asarray(a, dtype=float) for a in (S, K, T)]
+    is_call = np.asarray(is_call, dtype=bool)
+    fwd = S * np.exp(-q * T)
+    disc = K * np.exp(-r * T)
+    call = fwd * norm_cdf(d1) - disc * norm_cdf(d2)
+    put = disc * norm_cdf(-d2) - fwd * norm_cdf(-d1)
+    # At expiration, options are worth their intrinsic value
+    intrinsic = np.where(is_call, np.maximum(S - K, 0.0), np.maximum(K - S, 0.0))
+    return np.where(T > 0, np.where(is_call, call, put), intrinsic)
+
+def greeks(S: Any, K: Any, T: Any, sigma: Any, is_call: Any, r: float=0.0, q: float=0.0) -> Dict[str, np.ndarray]:
+    """Greeks of each option. Parameters are the same as price().
+
+    :returns: A dictionary with the following keys:
+        - delta: Change in price per $1 change in the underlying
+        - gamma: Change in delta per $1 change in the underlying
+        - theta: Change in price per calendar day
+        - vega: Change in price per 1 percentage point change in volatility
+    """
+    d1, d2 = _d1_d2(S, K, T, sigma, r, q)
+    S, K, T, sigma = [np.asarray(a, dtype=float) for a in (S, K, T, sigma)]
+    is_call = np.asarray(is_call, dtype=bool)
+    div = np.exp(-q * T)
+    disc = np.exp(-r * T)
+    pdf = norm_pdf(d1)
+    sqrt_t = np.sqrt(T)
+
+    delta = np.where(is_call, div * norm_cdf(d1), -div * norm_cdf(-d1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gamma = div * pdf / (S * sigma * sqrt_t)
+        decay = -S * div * pdf * sigma / (2 * sqrt_t)
+    theta = np.where(is_call,
+        decay - r * K * disc * norm_cdf(d2) + q * S * div * norm_cdf(d1),
+        decay + r * K * disc * norm_cdf(-d2) - q * S * div * norm_cdf(-d1))
+    vega = S * div * pdf * sqrt_t
+    # At expiration, options only have an intrinsic value, which changes one for one 
+    # with the underlying if they are in the money
+    expired = T <= 0
+    itm = np.where(is_call, np.where(S > K, 1.0, 0.0), np.where(S < K, -1.0, 0.0))
+    return {
+        'delta': np.where(expired, itm, delta),
+        'gamma': np.where(expired, 0.0, gamma),
+        'theta': np.where(expired, 0.0, theta / 365),
+        'vega': np.where(expired, 0.0, vega / 100),
+    }
+
+def implied_volatility(prices: Any, S: Any, K: Any, T: Any, is_call: Any, r: float=0.0, q: float=0.0,
+    tol: float=1e-6, max_iter: int=100) -> np.ndarray:
+    """Volatility at which the theoretical price of each option equals its market price.
+
+    All options are solved together with Newton's method. Each option keeps a bracket
+    around the solution, and falls back to bisection whenever a Newton step would leave
+    it, so the iteration always converges. Prices outside of the bounds allowed by
+    arbitrage have no solution, and result in NaN.
+
+    :prices: Market prices of the options. Other parameters are the same as price().
+    :tol: Options are solved once the price is within tol of the market price
+    """
+    prices, S, K, T = np.broadcast_arrays(*[np.asarray(a, dtype=float) for a in (prices, S, K, T)])
+    is_call = np.broadcast_to(np.asarray(is_call, dtype=bool), prices.shape)
+
+    fwd = S * np.exp(-q * T)
+    disc = K * np.exp(-r * T)
+    lower = np.where(is_call, np.maximum(fwd - disc, 0.0), np.maximum(disc - fwd, 0.0))
+    upper = np.where(is_call, fwd, disc)
+    valid = (T > 0) & (prices > lower) & (prices < upper)
+
+    lo = np.full(prices.shape, 1e-6)
+    hi = np.full(prices.shape, 10.0)
+    sigma = np.full(prices.shape, 0.5)
+    for _ in range(max_iter):
+        diff = price(S, K, T, sigma, is_call, r, q) - prices
+        done = ~valid | (np.abs(diff) < tol)
+        if done.all():
+            break
+        # Price increases with volatility, so the sign of diff tells which side the solution is on
+        hi = np.where(diff > 0, sigma, hi)
+        lo = np.where(diff < 0, sigma, lo)
+        vega = greeks(S, K, T, sigma, is_call, r, q)['vega'] * 100
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = sigma - diff / vega
+        bisect = ~np.isfinite(step) | (step <= lo) | (step >= hi)
+        sigma = np.where(done, sigma, np.where(bisect, (lo + hi) / 2, step))
+    return np.where(valid, sigma, np.nan)
+
+def years_to_expiration(exp_date: Any, now: dt.datetime) -> np.ndarray:
+    """Time from now until each expiration date, in years. Options are assumed to
+    expire at 4PM in New York on their expiration date.
+
+    :exp_date: Expiration dates, as in the exp_date column of BaseBroker.fetch_chain_data()
+    :now: The current time. Naive times are assumed to be in UTC.
+    """
+    dates = pd.DatetimeIndex(exp_date)
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    expires = (dates.normalize() + pd.Timedelta(hours=16)).tz_localize('America/New_York')
+    now = pd.Timestamp(now)
+    if now.tz is None:
+        now = now.tz_localize('UTC')
+    seconds = (expires - now).total_seconds().to_numpy()
+    return np.maximum(seconds, 0.0) / (365 * 86400)
+
+def chain_greeks(chain: pd.DataFrame, underlying: float, now: dt.datetime, sigma: Any=None, prices: Any=None,
+    r: float=0.0, q: float=0.0) -> pd.DataFrame:
+    """Prices every option in a chain, and calculates its greeks.
+
+    :chain: An option chain, as returned by BaseBroker.fetch_chain_data()
+    :underlying: Price of the underlying
+    :now: The current time
+    :sigma: Volatility to price the options with. Either a single value, or one per option.
+    :prices: Market prices of the options, one per option. If given, the implied volatility
+        of each option is calculated from it, and used instead of sigma.
+    :returns: A copy of chain with the columns price, iv, delta, gamma, theta, and vega added
+    """
+    if sigma is None and prices is None:
+        raise Exception("Either sigma or prices must be specified")
+    T = years_to_expiration(chain['exp_date'], now)
+    K = chain['strike'].to_numpy(dtype=float)
+    is_call = (chain['type'] == 'call').to_numpy()
+    if prices is not None:
+        iv = implied_volatility(np.asarray(prices, dtype=float), underlying, K, T, is_call, r, q)
+    else:
+        iv = np.broadcast_to(np.asarray(sigma, dtype=float), K.shape)
+
+    df = chain.copy()
+    df['price'] = price(underlying, K, T, iv, is_call, r, q)
+    df['iv'] = iv
+    for name, values in greeks(underlying, K, T, iv, is_call, r, q).items():
+        df[name] = values
+    return df
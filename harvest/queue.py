@@ -1,49 +1,384 @@
 # Builtins
 import datetime as dt
-from typing import List
+import itertools
+from typing import List, Tuple
 
 # External libraries
+import numpy as np
 import pandas as pd
 
+# Each write to any buffer gets a unique version number
+_versions = itertools.count()
+
+class RingBuffer:
+    """Preallocated, array-backed storage for the candles of a single symbol and interval.
+
+    Rows live in the contiguous window [start, end) of a 2D float array, so reading
+    the history is a slice rather than a copy. Appends write into the free space
+    after the window, and the array only grows (by doubling) or compacts when it
+    runs out of room, which makes appends O(1) amortized. If maxlen is set, the oldest
+    rows are dropped once the buffer holds more than maxlen rows.
+
+    For backtesting, the buffer can instead be preloaded with the entire dataset
+    using load(). The window then acts as a cursor over the preloaded rows, and
+    is moved forward with seek() without copying any data.
+
+    Listeners, such as indicators, can be attached to a column. They are notified of 
+    every row that is written, so they can be updated incrementally.
+    """
+
+    def __init__(self, capacity: int=256, maxlen: int=None, listeners: list=None) -> None:
+        self.capacity = capacity
+        self.maxlen = maxlen
+        self.listeners = [] if listeners is None else listeners  # List of (column, listener) pairs
+        self.start = 0
+        self.end = 0
+
+        # Layout of the stored data. These are set when the first dataframe is written.
+        self.columns = None     # Name of each column in data
+        self.symbol = None      # First level of the MultiIndex columns, if any
+        self.tz = None          # Timezone of the index, if any
+        self.name = None        # Name of the index
+
+        self.index = None
+        self.data = None
+
+        self.limit = None       # Number of preloaded rows, if the buffer is used for replay
+        self.version = next(_versions)  # Changes every time the buffer is written to
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def _layout(self, index: pd.Index, columns: pd.Index) -> None:
+        """Takes the column layout and index type from a dataframe's index and columns."""
+        if isinstance(columns, pd.MultiIndex):
+            self.symbol = columns.get_level_values(0)[0]
+            self.columns = list(columns.get_level_values(1))
+        else:
+            self.symbol = None
+            self.columns = list(columns)
+        self.tz = getattr(index, 'tz', None)
+        self.name = index.name
+
+    def _adopt(self, df: pd.DataFrame) -> None:
+        """Takes the column layout and index type from df, and allocates the arrays."""
+        self._layout(df.index, df.columns)
+        self.index = np.empty(self.capacity, dtype=df.index.values.dtype)
+        self.data = np.empty((self.capacity, len(self.columns)), dtype=float)
+
+    def _to_arrays(self, df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        if self.symbol is not None:
+            df = df[self.symbol]
+        return df.index.values, df[self.columns].to_numpy(dtype=float)
+
+    def _reserve(self, n: int) -> None:
+        """Makes sure there is room for n more rows after the window."""
+        if self.end + n <= self.capacity:
+            return
+        count = len(self)
+        if count + n <= self.capacity // 2:
+            # Plenty of space was freed at the front, so slide the window back
+            self.index[:count] = self.index[self.start:self.end]
+            self.data[:count] = self.data[self.start:self.end]
+        else:
+            self.capacity = max(self.capacity * 2, count + n)
+            index = np.empty(self.capacity, dtype=self.index.dtype)
+            data = np.empty((self.capacity, self.data.shape[1]), dtype=float)
+            index[:count] = self.index[self.start:self.end]
+            data[:count] = self.data[self.start:self.end]
+            self.index = index
+            self.data = data
+        self.start = 0
+        self.end = count
+
+    def _notify(self, pos: int, replace: bool=False) -> None:
+        self.version = next(_versions)
+        for ref, listener in self.listeners:
+            listener.update(self.data[pos, self.columns.index(ref)], replace)
+
+    def _notify_reset(self) -> None:
+        self.version = next(_versions)
+        for ref, listener in self.listeners:
+            listener.reset(self.column(ref))
+
+    def _trim(self) -> None:
+        if self.maxlen is not None and len(self) > self.maxlen:
+            self.start = self.end - self.maxlen
+
+    def set(self, df: pd.DataFrame) -> None:
+        """Replaces the contents of the buffer with df."""
+        self.start = 0
+        self.end = 0
+        self.limit = None
+        if df.empty and len(df.columns) == 0:
+            self.columns = None
+            self._notify_reset()
+            return
+        self.capacity = max(self.capacity, 2 * len(df.index))
+        self._adopt(df)
+        index, data = self._to_arrays(df)
+        self.index[:len(index)] = index
+        self.data[:len(index)] = data
+        self.end = len(index)
+        self._trim()
+        self._notify_reset()
+
+    def load(self, df: pd.DataFrame) -> None:
+        """Preloads df for replay. The window is initially empty."""
+        self.capacity = len(df.index)
+        self._adopt(df)
+        index, data = self._to_arrays(df)
+        self.index[:] = index
+        self.data[:] = data
+        self._replay()
+
+    def load_arrays(self, index: pd.DatetimeIndex, data: np.ndarray, columns: pd.Index) -> None:
+        """Same as load(), but uses data as the storage of the buffer without copying it. 
+        This allows data to be a read-only array, such as a memory-mapped file.
+
+        :index: Timestamps of the rows
+        :data: A 2D array with a row for each timestamp
+        :columns: The columns of data, in the same format as the columns of a dataframe
+        """
+        self._layout(index, columns)
+        self.index = index.values
+        self.data = data
+        self.capacity = len(index)
+        self._replay()
+
+    def _replay(self) -> None:
+        self.start = 0
+        self.end = 0
+        self.limit = self.capacity
+        self._notify_reset()
+
+    def seek(self, end: int, row: np.ndarray=None) -> None:
+        """Moves the end of the window to end, which is only allowed for preloaded buffers.
+
+        :row: If specified, the last row in the window is overwritten with row.
+            This is used to replay candles that are updated as time passes.
+        """
+        if self.limit is None or end > self.limit:
+            raise Exception(f"Cannot seek to {end}, buffer has {self.limit} preloaded rows")
+        prev = self.end
+        self.end = end
+        self.start = 0 if self.maxlen is None else max(0, end - self.maxlen)
+        if row is not None:
+            self.data[end - 1] = row
+
+        if end == prev + 1:
+            self._notify(end - 1)
+        elif end == prev and row is not None:
+            self._notify(end - 1, True)
+        elif end != prev:
+            self._notify_reset()
+
+    def append(self, df: pd.DataFrame, replace: bool=False) -> None:
+        """Appends the rows of df to the buffer.
+
+        :replace: If True, rows with a timestamp that is already in the buffer
+            overwrite the existing row instead of being appended.
+        """
+        if df.empty:
+            return
+        if self.columns is None:
+            self.set(df)
+            return
+        index, data = self._to_arrays(df)
+        self.append_arrays(index, data, replace)
+
+    def append_arrays(self, index: np.ndarray, data: np.ndarray, replace: bool=False) -> None:
+        self._check_writable()
+        n = len(index)
+        if n == 0:
+            return
+        if replace and len(self) > 0 and index[0] <= self.index[self.end - 1]:
+            # Some rows may already exist, so handle them one by one
+            for i in range(n):
+                self.append_row(index[i], data[i], True)
+            return
+        self._reserve(n)
+        self.index[self.end:self.end + n] = index
+        self.data[self.end:self.end + n] = data
+        self.end += n
+        for pos in range(self.end - n, self.end):
+            self._notify(pos)
+        self._trim()
+
+    def append_row(self, timestamp, row: np.ndarray, replace: bool=False) -> None:
+        """Appends a single row. If replace is True and a row with the same
+        timestamp exists, it is overwritten in place.
+        """
+        self._check_writable()
+        if replace and len(self) > 0:
+            last = self.index[self.end - 1]
+            if timestamp == last:
+                self.data[self.end - 1] = row
+                self._notify(self.end - 1, True)
+                return
+            if timestamp < last:
+                window = self.index[self.start:self.end]
+                pos = self.start + np.searchsorted(window, timestamp)
+                if pos < self.end and self.index[pos] == timestamp:
+                    self.data[pos] = row
+                    self._notify_reset()
+                    return
+        self._reserve(1)
+        self.index[self.end] = timestamp
+        self.data[self.end] = row
+        self.end += 1
+        self._notify(self.end - 1)
+        self._trim()
+
+    def _check_writable(self) -> None:
+        if self.limit is not None:
+            raise Exception("Cannot append to a buffer that is being replayed")
+
+    def column(self, ref: str) -> np.ndarray:
+        """Returns a read-only view of a single column. The view is only valid
+        until the next write to the buffer.
+        """
+        if self.columns is None:
+            return np.empty(0)
+        view = self.data[self.start:self.end, self.columns.index(ref)]
+        view.flags.writeable = False
+        return view
+
+    def last(self, ref: str) -> float:
+        return float(self.data[self.end - 1, self.columns.index(ref)])
+
+    def timestamp(self, pos: int=-1):
+        """Returns the timestamp of the row at pos, relative to the window."""
+        ts = pd.Timestamp(self.index[self.end + pos if pos < 0 else self.start + pos])
+        if self.tz is not None:
+            ts = ts.tz_localize('UTC').tz_convert(self.tz)
+        return ts
+
+    def to_df(self, start: int=None, copy: bool=True) -> pd.DataFrame:
+        """Builds a dataframe from the buffer, in the same format it was written in.
+
+        :start: If specified, only rows from this position (relative to the window) onwards are included.
+        :copy: If False, the dataframe is a read-only view of the buffer, which is only valid 
+            until the next write to the buffer.
+        """
+        if self.columns is None:
+            return pd.DataFrame()
+        first = self.start if start is None else self.start + (start if start >= 0 else len(self) + start)
+        index = pd.Index(self.index[first:self.end], name=self.name)
+        if self.tz is not None:
+            index = pd.DatetimeIndex(index).tz_localize('UTC').tz_convert(self.tz)
+        if self.symbol is None:
+            columns = self.columns
+        else:
+            columns = pd.MultiIndex.from_product([[self.symbol], self.columns])
+        if copy:
+            data = self.data[first:self.end].copy()
+        else:
+            data = self.data[first:self.end]
+            data.flags.writeable = False
+        return pd.DataFrame(data, index=index, columns=columns, copy=False)
+
+
 class Queue:
-    """The Queue is used by the Trader to keep track of stock and crpyto prices. 
-    The Trader makes sure that the queue has the lastest prices.  
+    """The Queue is used by the Trader to keep track of stock and crpyto prices.
+    The Trader makes sure that the queue has the lastest prices.
+
+    Prices of each symbol and interval are stored in a RingBuffer.
+    The getters that return dataframes build them from the buffer, and are kept
+    for compatibility. Performance critical code should use get_symbol_interval_array.
     """
 
-    def __init__(self) -> None:
-        self.queue = {} 
+    def __init__(self, maxlen: int=None) -> None:
+        """:maxlen: Maximum number of candles to keep for each symbol and interval.
+            If None, the history is never truncated.
+        """
+        self.queue = {}
+        self.maxlen = maxlen
+        self.listeners = {}     # (symbol, interval) -> list of (column, listener) pairs
+
+    def _buffer(self, symbol: str, interval: str) -> RingBuffer:
+        return RingBuffer(maxlen=self.maxlen, listeners=self.listeners.setdefault((symbol, interval), []))
 
     def init_symbol(self, symbol: str, interval: str) -> None:
         if not symbol in self.queue:
             self.queue[symbol] = {}
-        self.queue[symbol][interval] = pd.DataFrame()
+        self.queue[symbol][interval] = self._buffer(symbol, interval)
+        for ref, listener in self.listeners[(symbol, interval)]:
+            listener.reset()
         self.queue[symbol][interval + '-update'] = dt.datetime(1970, 1, 1)
 
     def set_symbol_interval(self, symbol: str, interval: str, df: pd.DataFrame) -> None:
-        self.queue[symbol][interval] = df
+        if not interval in self.queue[symbol]:
+            self.queue[symbol][interval] = self._buffer(symbol, interval)
+        self.queue[symbol][interval].set(df)
 
     def set_symbol_interval_update(self, symbol: str, interval: str, timestamp: dt.datetime) -> None:
         self.queue[symbol][interval + '-update'] = timestamp
-    
+
     def append_symbol_interval(self, symbol: str, interval: str, df: pd.DataFrame, chk_duplicate: bool=False) -> None:
-        if self.queue[symbol][interval].empty:
-            self.queue[symbol][interval] = df 
-        else:
-            self.queue[symbol][interval] = self.queue[symbol][interval].append(df)
-            if chk_duplicate:
-                self.queue[symbol][interval] = self.queue[symbol][interval][~self.queue[symbol][interval].index.duplicated(keep='last')]
+        self.queue[symbol][interval].append(df, chk_duplicate)
+
+    def load_symbol_interval(self, symbol: str, interval: str, df: pd.DataFrame) -> None:
+        """Preloads df to be replayed with seek_symbol_interval. Used for backtesting."""
+        if not interval in self.queue[symbol]:
+            self.queue[symbol][interval] = self._buffer(symbol, interval)
+        self.queue[symbol][interval].load(df)
+
+    def load_symbol_interval_arrays(self, symbol: str, interval: str, index: pd.DatetimeIndex, data: np.ndarray, columns: pd.Index) -> None:
+        """Preloads data to be replayed with seek_symbol_interval, without copying it."""
+        if not interval in self.queue[symbol]:
+            self.queue[symbol][interval] = self._buffer(symbol, interval)
+        self.queue[symbol][interval].load_arrays(index, data, columns)
+
+    def seek_symbol_interval(self, symbol: str, interval: str, end: int, row: np.ndarray=None) -> None:
+        """Moves the end of a preloaded queue, so that it contains the first end rows."""
+        self.queue[symbol][interval].seek(end, row)
+
+    def subscribe(self, symbol: str, interval: str, ref: str, listener) -> None:
+        """Attaches a listener to a column of a queue. The listener is reset with the
+        prices currently in the queue, and updated every time a candle is written.
+
+        :listener: An object with the following methods:
+            - reset(values): Called with all prices when the contents of the queue are replaced.
+            - update(value, replace): Called with the new price when a candle is written.
+                replace is True if the last candle was overwritten.
+        """
+        self.listeners.setdefault((symbol, interval), []).append((ref, listener))
+        buf = self.queue.get(symbol, {}).get(interval)
+        listener.reset(buf.column(ref) if buf is not None else ())
+
+    def unsubscribe(self, symbol: str, interval: str, listener) -> None:
+        """Detaches a listener that was attached with subscribe()."""
+        listeners = self.listeners.get((symbol, interval), [])
+        listeners[:] = [(ref, l) for ref, l in listeners if l is not listener]
+
+    def get_symbol_interval(self, symbol: str, interval: str, copy: bool=True) -> pd.DataFrame:
+        """:copy: If False, returns a read-only view that is only valid until the queue is next updated."""
+        return self.queue[symbol][interval].to_df(copy=copy)
 
-    def get_symbol_interval(self, symbol: str, interval: str) -> pd.DataFrame:
-        return self.queue[symbol][interval]
-    
     def get_symbol_interval_prices(self, symbol: str, interval: str, ref: str) -> List[float]:
-        return self.queue[symbol][interval][symbol][ref].tolist()
+        return self.queue[symbol][interval].column(ref).tolist()
+
+    def get_symbol_interval_array(self, symbol: str, interval: str, ref: str) -> np.ndarray:
+        """Returns the prices as a read-only numpy view, without copying.
+        The view is only valid until the queue is next updated.
+        """
+        return self.queue[symbol][interval].column(ref)
+
+    def get_symbol_interval_version(self, symbol: str, interval: str) -> int:
+        """Returns a number that changes every time the queue is updated, including 
+        when the last candle is overwritten.
+        """
+        return self.queue[symbol][interval].version
 
     def get_symbol_interval_update(self, symbol: str, interval: str) -> dt.datetime:
         return self.queue[symbol][interval + '-update']
 
     def get_last_symbol_interval(self, symbol, interval) -> pd.DataFrame:
-        return self.get_symbol_interval(symbol, interval).iloc[[-1]]
-    
+        return self.queue[symbol][interval].to_df(-1)
+
     def get_last_symbol_interval_price(self, symbol, interval, ref) -> float:
-        return float(self.get_symbol_interval_prices(symbol, interval, ref)[-1])
+        return self.queue[symbol][interval].last(ref)
+
+    def get_last_symbol_interval_timestamp(self, symbol, interval) -> dt.datetime:
+        return self.queue[symbol][interval].timestamp(-1)
@@ -0,0 +1,118 @@
+# Builtins
+import atexit
+import collections
+import threading
+import time
+from logging import warning, debug
+from typing import Dict, List
+
+# External libraries
+import pandas as pd
+
+class Recorder:
+    """Saves the candles received by the Trader to a harvest.load.Load database,
+    so they can later be used for backtesting.
+
+    Candles are buffered in memory by record(), which returns immediately, and are
+    written to disk by a background thread. The buffer is flushed once it holds
+    max_rows candles, or flush_interval seconds after the last flush, whichever
+    comes first. If the disk cannot keep up and the buffer grows past max_pending
+    candles, the oldest candles are dropped so that memory use stays bounded.
+    Anything still buffered is flushed when the program exits.
+    """
+
+    def __init__(self, db, interval: str, max_rows: int=1000, flush_interval: float=60, max_pending: int=100000) -> None:
+        """
+        :db: The harvest.load.Load to write to
+        :interval: Interval of the candles that are recorded
+        """
+        self.db = db
+        self.interval = interval
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self.pending = collections.deque()  # (symbol, dataframe) pairs, oldest first
+        self.rows = 0           # Number of candles in pending
+        self.closed = False
+        self.cond = threading.Condition()
+        self.write_lock = threading.Lock() # Makes sure batches are written in the order they were taken
+
+        self.thread = threading.Thread(target=self._run, name='harvest-recorder', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def record(self, df_dict: Dict[str, pd.DataFrame]) -> None:
+        """Buffers the candles in df_dict, in the same format as passed to Trader.handler_main()."""
+        if df_dict is None:
+            return
+        with self.cond:
+            if self.closed:
+                return
+            for sym, df in df_dict.items():
+                if df is None or df.empty:
+                    continue
+                self.pending.append((sym, df))
+                self.rows += len(df.index)
+
+            dropped = 0
+            while self.rows > self.max_pending and len(self.pending) > 1:
+                sym, df = self.pending.popleft()
+                self.rows -= len(df.index)
+                dropped += len(df.index)
+            if dropped > 0:
+                warning(f"Recorder is falling behind, dropped {dropped} candles")
+
+            if self.rows >= self.max_rows:
+                self.cond.notify()
+
+    def flush(self) -> None:
+        """Writes all buffered candles, blocking until they are saved."""
+        with self.write_lock:
+            with self.cond:
+                batch = self._take()
+            self._write(batch)
+
+    def close(self) -> None:
+        """Stops the background thread after flushing the buffer."""
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
+        self.flush()
+
+    def _take(self) -> List:
+        batch = self.pending
+        self.pending = collections.deque()
+        self.rows = 0
+        return batch
+
+    def _run(self) -> None:
+        last = time.monotonic()
+        while True:
+            with self.cond:
+                while not self.closed and self.rows < self.max_rows:
+                    remaining = self.flush_interval - (time.monotonic() - last)
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                if self.closed:
+                    return
+            self.flush()
+            last = time.monotonic()
+
+    def _write(self, batch: List) -> None:
+        """Writes a batch, with a single append for each symbol."""
+        frames = {}
+        for sym, df in batch:
+            frames.setdefault(sym, []).append(df)
+        for sym, dfs in frames.items():
+            df = pd.concat(dfs) if len(dfs) > 1 else dfs[0]
+            try:
+                self.db.append_entry(sym, df, self.interval)
+            except Exception as e:
+                warning(f"Failed to record {sym} candles: {e}")
+        if len(frames) > 0:
+            debug(f"Recorded candles of {len(frames)} symbols")
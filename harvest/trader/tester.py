@@ -15,10 +15,11 @@ from typing import Any, Dict, List, Tuple
 # External libraries
 import numpy as np
 import pandas as pd
-from tqdm import tqdm
 
 # Submodule imports
+import harvest.aggregator as aggregator
 import harvest.algo as algo
+import harvest.book as book
 import harvest.load as load
 import harvest.queue as queue
 import harvest.trader.trader as trader
@@ -44,13 +45,12 @@ class TestTrader(trader.Trader):
 
         self.watch = []             # List of stocks to watch
         self.queue = queue.Queue()  # local cache of historic price
+        self.aggregator = aggregator.Aggregator(self.queue) # Aggregates prices in the queue as they arrive
+        self.db = None              # Backtests do not save price history
+        self.recorder = None
         self.account = {}           # Local cash of account info 
 
-        self.stock_positions = []   # Local cache of current stock positions
-        self.option_positions = []  # Local cache of current options positions
-        self.crypto_positions = []  # Local cache of current crypto positions
-
-        self.order_queue = []       # Queue of unfilled orders 
+        self.book = book.Book()     # Local cache of current positions and unfilled orders
 
     def read_price_history(self, interval: str, path: str, date_format: str='%Y-%m-%d %H:%M:%S'):
         """Function to read backtesting data from a local file. 
@@ -84,11 +84,31 @@ class TestTrader(trader.Trader):
                 self.queue.set_symbol_interval_update(sym, i, last)
         
 
-    def run(self, interval: str='5MIN', aggregations: List[Any]=[], source: str='LOCAL', path: str="./data"):
+    def read_saved_history(self, interval: str, path: str) -> Dict[str, Tuple[pd.DatetimeIndex, np.ndarray, pd.Index]]:
+        """Function to read backtesting data saved by harvest.load.Load. 
+        The data is memory-mapped rather than read into memory, and is replayed directly
+        from the mapped arrays. 
+
+        :interval: The interval of the data
+        :path: Path to the directory of the database
+        :returns: A dictionary mapping each symbol to the tuple returned by Load.get_arrays()
+        """
+        db = load.Load(path)
+        mapped = {}
+        for sym in self.watch:
+            self.queue.init_symbol(sym, interval)
+            mapped[sym] = db.get_arrays(sym, interval)
+            if len(mapped[sym][0]) == 0:
+                raise Exception(f"No {interval} data of {sym} was found in {path}")
+        return mapped
+
+    def run(self, interval: str='5MIN', aggregations: List[Any]=[], source: str='LOCAL', path: str=None):
         """Runs backtesting. 
 
         :source: 'LOCAL' if backtesting data is in a local file, 'FETCH' if the streamer should 
-            be used to download latest data. 
+            be used to download latest data, 'DB' if the data was saved with harvest.load.Load.
+        :path: The directory of the local files, './data' by default, or the directory of 
+            the database if source is 'DB', harvest.load.DB_PATH by default.
         """
 
         self.interval = interval
@@ -100,15 +120,15 @@ class TestTrader(trader.Trader):
         self.fetch_interval = interval
      
         self._setup_account()
-        
-        self.df = {}
 
         # Load data into queue
-        # TODO cache data
+        mapped = None
         if source == "FETCH":
             self._queue_init(interval)
+        elif source == "DB":
+            mapped = self.read_saved_history(interval, load.DB_PATH if path is None else path)
         else:
-            self.read_price_history(interval, path)
+            self.read_price_history(interval, "./data" if path is None else path)
         
         conv = {
             "1MIN": 1,
@@ -119,35 +139,34 @@ class TestTrader(trader.Trader):
             "1DAY": 1440
         }
 
+        # Preload all data into the queue. During the test, each queue is a cursor 
+        # over the preloaded data, which is moved forward one candle at a time.
+        # Aggregated queues hold one row per aggregated candle, and the last row
+        # is overwritten with the partially aggregated candle as of the current candle. 
+        # Data from the database is replayed from the memory-mapped arrays.
+        self.replay = {}
+        if mapped is None:
+            timestamps = self.queue.get_symbol_interval(self.watch[0], interval).index
+        else:
+            timestamps = mapped[self.watch[0]][0]
         for sym in self.watch:
-            df = self.queue.get_symbol_interval(sym, interval)
-            rows = len(df.index)
+            if mapped is None:
+                df = self.queue.get_symbol_interval(sym, interval)
+            else:
+                df = pd.DataFrame(mapped[sym][1], index=mapped[sym][0], columns=mapped[sym][2], copy=False)
             print(f"Formatting {sym} data...")
+            self.replay[sym] = {}
             for agg in self.aggregations:
-                print(f"Formatting {agg} ...")
-                self.queue.set_symbol_interval(sym, '+'+agg, pd.DataFrame())
                 points = int(conv[agg]/conv[interval])
-                for i in tqdm(range(rows)):
-                    df_tmp = df.iloc[0:i+1]                    
-                    df_tmp = df_tmp.iloc[-points:] 
-                    agg_df = self.aggregate_df(df_tmp, agg)
-                   
-                    self.queue.append_symbol_interval(sym, '+'+agg, agg_df.iloc[[-1]])
-        
-        # Move all data to a cached dataframe,
-        # and reset all queues. 
-        for i in [self.interval] + self.aggregations:
-            if i != self.interval:
-                i = '+'+i
-            self.df[i] = {}
-            for s in self.watch:
-                df_tmp = self.queue.get_symbol_interval(s, i)
-                self.df[i][s] = df_tmp.copy() 
-
-        for i in [self.interval] + self.aggregations:
-            for s in self.watch:
-                self.queue.init_symbol(s, i) 
-            
+                df_tmp = aggregator.rolling_candles(df, agg, points)
+                candles = df_tmp[~df_tmp.index.duplicated(keep='last')]
+                pos = np.searchsorted(candles.index.values, df_tmp.index.values)
+                self.queue.load_symbol_interval(sym, agg, candles)
+                self.replay[sym][agg] = (pos, df_tmp[sym][self.queue.queue[sym][agg].columns].to_numpy())
+            if mapped is None:
+                self.queue.load_symbol_interval(sym, interval, df)
+            else:
+                self.queue.load_symbol_interval_arrays(sym, interval, *mapped[sym])
 
         self.load_watch = True
 
@@ -162,22 +181,17 @@ class TestTrader(trader.Trader):
         # pr = cProfile.Profile()
         # pr.enable()
         
-        rows = len(self.df[interval][self.watch[0]].index)
-        for i in range(rows):
-            df_dict = {}
-            for s in self.watch:
-                df_dict[s] = self.df[interval][s].iloc[[i]]
-            # Add data to queue
-            self.timestamp = self.df[interval][self.watch[0]].index[i]
+        for i in range(len(timestamps)):
+            self.timestamp = timestamps[i]
             update = self._update_order_queue()
-            self._update_stats(df_dict, new=update, option_update=True)
+            # Add data to queue
             for s in self.watch:
-                df = self.df[interval][s].iloc[[i]]
-                self.queue.append_symbol_interval(s, interval, df)
+                self.queue.seek_symbol_interval(s, interval, i+1)
                 # Add data to aggregation queue
                 for agg in self.aggregations:
-                    df = self.df['+'+agg][s].iloc[[i]]
-                    self.queue.append_symbol_interval(s, agg, df, True)
+                    pos, candles = self.replay[s][agg]
+                    self.queue.seek_symbol_interval(s, agg, pos[i]+1, candles[i])
+            self._update_stats(None, new=update, option_update=True)
         
             self.algo.handler({})
  
@@ -6,12 +6,15 @@ import requests
 import urllib
 import re
 import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 import sys
+import itertools
 import threading
 import logging
 from logging import warning, debug
 import time
+from typing import Dict, List, Tuple
 
 # External libraries
 import numpy as np
@@ -19,8 +22,13 @@ import pandas as pd
 import pytz
 
 # Submodule imports
+import harvest.aggregator as aggregator
 import harvest.algo as algo
+import harvest.book as book
+import harvest.calendar as calendar
+import harvest.load as load
 import harvest.queue as queue
+import harvest.recorder as recorder
 from harvest.broker.dummy import DummyBroker
 
 class Trader:
@@ -36,10 +44,21 @@ class Trader:
 
     interval_list = ['1MIN', '5MIN', '15MIN', '30MIN', '1HR', '1DAY']
 
-    def __init__(self, streamer=None, broker=None):      
+    def __init__(self, streamer=None, broker=None, db_path: str=None, record: bool=False, workers: int=8, 
+        timeout: float=None):      
         """Initializes the Trader. 
         :streamer:
         :broker:
+        :timeout: Seconds to wait for the data of all symbols to arrive, after the first of it has. 
+            Symbols whose data has not arrived by then are passed on with their last candle.
+            If None, the streamer's fetch_timeout is used.
+        :workers: Maximum number of symbols whose price history is fetched at the same time. 
+            Lower this if the broker limits the rate of API calls.
+        :db_path: Directory where price history is saved, so that only new data needs to be 
+            fetched when the Trader is restarted, e.g. harvest.load.DB_PATH. 
+            If None (the default), price history is not saved.
+        :record: If True, every candle received from the streamer is saved to db_path in 
+            the background, so it can be used for backtesting later.
         """
         if streamer == None:
             warning("Streamer not specified, using DummyBroker")
@@ -64,18 +83,57 @@ class Trader:
 
         self.watch = []             # List of stocks to watch
         self.queue = queue.Queue()  # local cache of historic price
+        self.aggregator = aggregator.Aggregator(self.queue) # Aggregates prices in the queue as they arrive
+        self.db = None if db_path is None else load.Load(db_path) # Saved price history
+        self.record = record and self.db is not None
+        self.recorder = None        # Saves streamed candles to db in the background, if record is True
+        self.workers = workers
         self.account = {}           # Local cash of account info 
 
-        self.stock_positions = []   # Local cache of current stock positions
-        self.option_positions = []  # Local cache of current options positions
-        self.crypto_positions = []  # Local cache of current crypto positions
+        self.book = book.Book()     # Local cache of current positions and unfilled orders
 
-        self.order_queue = []       # Queue of unfilled orders 
-
-        self.block_lock = threading.Lock() # Lock for streams that recieve data asynchronously
+        self.loop = None            # Event loop the streamer and handler run in
+        self.main_lock = None       # Lets handler_main() process one timestamp at a time, created along with the loop
+        self.timeout_period = self.streamer.fetch_timeout if timeout is None else timeout
+        self.released = None        # The last timestamp whose data was passed on to handler_main()
 
         self.algo = None
 
+    # Positions and orders in the book, for backwards compatibility.
+    # Each is an Index that can be iterated over like a list.
+
+    @property
+    def stock_positions(self) -> book.Index:
+        return self.book.stocks
+
+    @stock_positions.setter
+    def stock_positions(self, positions):
+        self.book.stocks.set(positions)
+
+    @property
+    def option_positions(self) -> book.Index:
+        return self.book.options
+
+    @option_positions.setter
+    def option_positions(self, positions):
+        self.book.options.set(positions)
+
+    @property
+    def crypto_positions(self) -> book.Index:
+        return self.book.cryptos
+
+    @crypto_positions.setter
+    def crypto_positions(self, positions):
+        self.book.cryptos.set(positions)
+
+    @property
+    def order_queue(self) -> book.Index:
+        return self.book.orders
+
+    @order_queue.setter
+    def order_queue(self, orders):
+        self.book.orders.set(orders)
+
     def run( self, load_watch=True, interval='5MIN',aggregations=[]): 
         """Entry point to start the system. 
         
@@ -110,13 +168,13 @@ class Trader:
         self._setup_stats()
 
         if load_watch:
-            for s in self.stock_positions:
+            for s in self.book.stocks:
                 self.watch.append(s['symbol'])
-            for s in self.option_positions:
+            for s in self.book.options:
                 self.watch.append(s['symbol'])
-            for s in self.crypto_positions:
+            for s in self.book.cryptos:
                 self.watch.append(s['symbol'])
-            for s in self.order_queue:
+            for s in self.book.orders:
                 self.watch.append(s['symbol'])     
 
         if len(self.watch) == 0:
@@ -136,6 +194,9 @@ class Trader:
         self.fetch_interval = self.streamer.fetch_interval
         debug(f"Interval: {interval}\nFetch interval: {self.fetch_interval}")
 
+        if self.record:
+            self.recorder = recorder.Recorder(self.db, self.fetch_interval)
+
         if interval != self.fetch_interval:
             self.aggregations.append(interval)
         debug(f"Aggregations: {self.aggregations}")
@@ -156,16 +217,19 @@ class Trader:
         self.block_queue = {}
         self.needed = self.watch.copy()
         
-        self.loop = asyncio.get_event_loop()
-
-        self.streamer.run()
-
-    async def timeout(self):
+        # The streamer, the handler, and the timeout all run in this loop until the program exits
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.main_lock = asyncio.Lock()
+        self.loop.run_until_complete(self.streamer.run_async())
+
+    async def timeout(self, timestamp):
+        """Passes on the data of timestamp if the rest of it has not arrived in time."""
         try:
             debug("Begin timer")
-            await asyncio.sleep(1)
+            await asyncio.sleep(self.timeout_period)
             debug("Force flush")
-            self.handler(None, True)
+            await self.handler(None, timestamp, True)
         except asyncio.CancelledError:
             debug("Timeout cancelled")
 
@@ -190,39 +254,53 @@ class Trader:
         -   After a certain timeout period, the handler will forward the data 
         """
         debug(f"Handler received: \n{df_dict}")
-        
-        self.block_lock.acquire()
 
-        self.timestamp_prev = self.timestamp
-        self.timestamp = timestamp
+        # Data of an earlier timestamp is dropped
+        if timestamp < self.timestamp:
+            debug(f"Dropping late data of {timestamp}")
+            return
+
+        # Data of a timestamp that has already been passed on, because it timed out, is added 
+        # to the queue in place of the last candles the missing symbols were filled in with, 
+        # but the algo is not run again
+        if timestamp == self.released:
+            if df_dict:
+                debug(f"Merging late data of {timestamp}")
+                async with self.main_lock:
+                    self._queue_update(df_dict, timestamp)
+            return
+
+        waiting = any(self.blocker.values())
 
         # If flush=True, forcefully push all data in block_queue onto handler_main
         if flush:
-            # For missing data, repeat the existing one
-            for n in self.needed:
-                self.block_queue[n] = self.queue.get_last_symbol_interval(n, self.base_inverval)
-            self.needed = self.watch.copy()
-            for k, v in self.blocker.items():
-                self.blocker[k] = False
-            self.handler_main(self.block_queue)
-            self.block_queue = {}
-            self.block_lock.release()
+            if waiting and timestamp == self.timestamp:
+                await self._release(fill=True)
             return
 
+        # If data of a new timestamp arrives before all data of the previous one,
+        # the previous data is passed on first
+        if waiting and timestamp > self.timestamp:
+            self.task.cancel()
+            await self._release(fill=True)
+
+        # Data of the same timestamp can arrive in several parts
+        if timestamp != self.timestamp:
+            self.timestamp_prev = self.timestamp
+            self.timestamp = timestamp
+
         # If this is a first df to arrive for a given timestamp, 
-        # start the timeout counter
+        # start the timeout counter. Symbols whose market is closed are not waited for.
         if all(not v for v in self.blocker.values()):
-            self.task = self.loop.create_task(self.timeout())
+            self.needed = self._expected_symbols(timestamp)
+            self.task = asyncio.get_running_loop().create_task(self.timeout(timestamp))
 
         symbols = [k for k, v in df_dict.items()]
         debug(f"Got data for: {symbols}")
         self.needed = list(set(self.needed) - set(symbols))
         debug(f"Still need data for: {self.needed}")
  
-        if not bool(self.block_queue):
-            self.block_queue = df_dict 
-        else:
-            self.block_queue.update(df_dict)
+        self.block_queue.update(df_dict)
         for t in symbols:    
             self.blocker[t] = True
         
@@ -231,28 +309,52 @@ class Trader:
             debug("All data received")
             debug(self.block_queue)
             self.task.cancel()
-            self.needed = self.watch.copy()
-            for k, v in self.blocker.items():
-                self.blocker[k] = False
-            self.handler_main(self.block_queue)
-            self.block_queue = {}
-            self.block_lock.release()
-            return 
-        
-        self.block_lock.release()
+            await self._release()
+
+    async def _release(self, fill: bool=False) -> None:
+        """Passes the data received for the current timestamp on to handler_main.
+        If handler_main is still busy with the previous timestamp, this waits for it to finish.
+
+        :fill: If True, the last candle of each symbol whose data has not arrived is repeated.
+        """
+        if fill:
+            for n in self.needed:
+                self.block_queue[n] = self.queue.get_last_symbol_interval(n, self.fetch_interval)
+        df_dict = self.block_queue
+        self.block_queue = {}
+        self.released = self.timestamp
+        self.needed = self.watch.copy()
+        for k in self.blocker:
+            self.blocker[k] = False
+        async with self.main_lock:
+            await self.handler_main(df_dict)
+
+    def _expected_symbols(self, timestamp: dt.datetime) -> List[str]:
+        """Returns the symbols that data is expected for at timestamp, which are those 
+        whose market was open during the bar that ended at timestamp.
+        """
+        start = timestamp - dt.timedelta(seconds=aggregator.interval_to_ns(self.fetch_interval) / 10**9)
+        return calendar.expected_symbols(self.watch, start)
+
+    async def handler_main(self, df_dict):
+        # Calls to the broker block, so they are run in a separate thread 
+        # to let the loop receive data in the meantime
+        loop = asyncio.get_running_loop()
 
-    def handler_main(self, df_dict):
+        # Recording only buffers the candles, they are written to disk in the background
+        if self.recorder is not None:
+            self.recorder.record(df_dict)
 
         new_day = False
         # Init queue on a new day 
         if self.timestamp.date() > self.timestamp_prev.date():
             debug("Initializing queue...")
-            self._queue_init(self.fetch_interval) 
+            await loop.run_in_executor(None, self._queue_init, self.fetch_interval)
             new_day = True
         
         # Periodically refresh access tokens
         if new_day or (self.timestamp.hour == 3 and self.timestamp.minute == 0):
-            self.streamer.refresh_cred()
+            await loop.run_in_executor(None, self.streamer.refresh_cred)
         
         # Update the queue. If not new data is received, skip.
         is_new = self._queue_update(df_dict, self.timestamp)
@@ -262,8 +364,8 @@ class Trader:
 
         # If an order was processed, fetch the latest position info
         # otherwise, calculate current positions locally
-        update = self._update_order_queue()
-        self._update_stats(df_dict, new=update, option_update=True)
+        update = await loop.run_in_executor(None, self._update_order_queue)
+        await loop.run_in_executor(None, self._update_stats, df_dict, update, True)
         
         if not self.is_freq(self.timestamp):
             return
@@ -272,7 +374,7 @@ class Trader:
             'new_day':new_day
         }
 
-        self.algo.handler(meta)
+        await loop.run_in_executor(None, self.algo.handler, meta)
         self.broker.exit()
         self.streamer.exit()
 
@@ -297,11 +399,10 @@ class Trader:
                 return False
         
         if self.interval == '1DAY':
-            #TODO use market close time 
-            if minutes == 0 and hours == 16:
-                return True 
-            else:
-                return False
+            # Stocks are handled when their market closes, cryptos at the start of each day
+            if any(s[0] != '@' for s in self.watch):
+                return calendar.NYSE.is_close(time)
+            return calendar.CRYPTO.is_close(time)
 
         val = int(re.sub("[^0-9]", "", self.interval))
         val_fetch = int(re.sub("[^0-9]", "", self.fetch_interval))
@@ -317,27 +418,93 @@ class Trader:
         """
 
         today = pytz.utc.localize(dt.datetime.utcnow().replace(microsecond=0, second=0))  # Current timestamp in UTC
-        for sym in self.watch:
-            self.queue.init_symbol(sym, interval)
-            last = pytz.utc.localize(dt.datetime(1970, 1, 1))
-            df = self.streamer.fetch_price_history(last, today, interval, sym)
-            self.queue.set_symbol_interval(sym, interval, df)
-            self.queue.set_symbol_interval_update(sym, interval, df.index[-1])
-           
-            # Many brokers have seperate API for intraday data, so make an API call
-            # instead of aggregating interday data
-            if '1DAY' in self.aggregations:
-                df = self.streamer.fetch_price_history(last, today, '1DAY', sym)
-                self.queue.set_symbol_interval(sym, '1DAY', df)
-                self.queue.set_symbol_interval_update(sym, '1DAY', df.index[-1])
-
-            df = self.queue.get_symbol_interval(sym, interval)
-            for i in self.aggregations:
-                if i == '1DAY':
-                    continue
-                df_tmp = self.aggregate_df(df, i)
-                self.queue.set_symbol_interval(sym, i, df_tmp)
-                self.queue.set_symbol_interval_update(sym, i, df_tmp.index[-1])
+
+        intervals = [interval]
+        # Many brokers have seperate API for intraday data, so make an API call
+        # instead of aggregating interday data
+        if '1DAY' in self.aggregations:
+            intervals.append('1DAY')
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            # Symbols that need data from the same time onwards are requested together, 
+            # in batches as large as the streamer supports. Batches are fetched concurrently.
+            size = max(1, self.streamer.history_batch_size)
+            calls = []
+            for i in intervals:
+                groups = {}
+                for sym in self.watch:
+                    last = self._history_start(sym, i)
+                    # Nothing new can be fetched if the market has been closed since the last saved candle
+                    if not calendar.get_calendar(sym).is_open_between(last, today):
+                        continue
+                    groups.setdefault(last, []).append(sym)
+                for last, symbols in groups.items():
+                    for k in range(0, len(symbols), size):
+                        batch = symbols[k:k + size]
+                        calls.append((i, pool.submit(self.streamer.fetch_price_history_batch, last, today, i, batch)))
+            fetched = {(sym, i): df for i, f in calls for sym, df in f.result().items()}
+
+            # Symbols are saved and aggregated concurrently, and then written 
+            # into the queue one at a time, as the queue is not thread-safe
+            futures = {sym: pool.submit(self._prepare_symbol, sym, interval, intervals, fetched) for sym in self.watch}
+            for sym in self.watch:
+                frames = futures[sym].result()
+                self.queue.init_symbol(sym, interval)
+                for i, df in frames.items():
+                    self.queue.set_symbol_interval(sym, i, df)
+                    self.queue.set_symbol_interval_update(sym, i, df.index[-1])
+                self.aggregator.init_symbol(sym, interval, self.aggregations)
+
+    def _prepare_symbol(self, symbol: str, interval: str, intervals: List[str], fetched: Dict[Tuple[str, str], pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+        """Combines the fetched price history of symbol with the saved history, and aggregates it.
+
+        :intervals: The intervals that were fetched
+        :fetched: A dictionary mapping (symbol, interval) to the fetched data
+        :returns: A dictionary mapping interval and each aggregation to a dataframe
+        """
+        frames = {}
+        for i in intervals:
+            frames[i] = self._merge_history(symbol, i, fetched.get((symbol, i), pd.DataFrame()))
+
+        for i in self.aggregations:
+            if i == '1DAY':
+                continue
+            frames[i] = self.aggregate_df(frames[interval], i)
+        return frames
+
+    def _history_start(self, symbol: str, interval: str) -> dt.datetime:
+        """Returns the time from which the price history of symbol needs to be fetched.
+        If price history is saved, this is the time of the last saved candle, which is 
+        fetched again as it may have been incomplete when it was saved.
+        """
+        last = pytz.utc.localize(dt.datetime(1970, 1, 1))
+        if self.db is None:
+            return last
+        _, latest = self.db.get_range(symbol, interval)
+        return last if latest is None else latest
+
+    def _merge_history(self, symbol: str, interval: str, df: pd.DataFrame) -> pd.DataFrame:
+        """Saves the fetched candles in df, and returns them along with the recent saved candles.
+        Only as much saved history as the streamer normally returns is loaded, so the size of 
+        the queue does not grow with the size of the database.
+        """
+        if self.db is None:
+            return df
+        _, latest = self.db.get_range(symbol, interval)
+        if latest is None:
+            saved = pd.DataFrame()
+        else:
+            saved = self.db.get_entry(symbol, interval, start=latest - self.streamer.history_window(interval))
+            # Brokers may return more than was requested, but only candles 
+            # from the last saved one onwards are new
+            df = df[df.index >= latest]
+        if not df.empty:
+            self.db.append_entry(symbol, df, interval)
+            self.db.set_timestamp(symbol, df.index[-1], interval)
+        if saved.empty:
+            return df
+        df = pd.concat([saved, df])
+        return df[~df.index.duplicated(keep='last')].sort_index()
 
     def aggregate_df(self, df, inter):
         sym = list(df.columns.levels[0])[0]
@@ -369,6 +536,9 @@ class Trader:
         is_new = False
 
         for sym in self.watch:
+            # Symbols whose market is closed may be missing
+            if not sym in df_dict:
+                continue
             old_timestamp = self.queue.get_symbol_interval_update(sym, interval)
             new_timestamp = df_dict[sym].index[-1]
             if new_timestamp <= old_timestamp:
@@ -378,18 +548,8 @@ class Trader:
             self.queue.append_symbol_interval(sym, interval, df_dict[sym], True)
             self.queue.set_symbol_interval_update(sym, interval, new_timestamp) 
 
-            df_base = self.queue.get_symbol_interval(sym, interval) 
-            
-            for inter in self.aggregations:
-                # Locally aggregate data to reduce network latency
-                old_agg = self.queue.get_symbol_interval(sym, inter).index[-1]
-
-                df_tmp = df_base.loc[old_agg:]
-                df_tmp = self.aggregate_df(df_tmp, inter)
-                df_tmp = df_tmp[df_tmp[sym]['open'].notna()]
-              
-                self.queue.append_symbol_interval(sym, inter, df_tmp, True)
-                self.queue.set_symbol_interval_update(sym, interval, df_tmp.index[-1]) 
+            # Locally aggregate data to reduce network latency
+            self.aggregator.update(sym, df_dict[sym])
         
         return is_new
 
@@ -397,10 +557,15 @@ class Trader:
         """Check to see if outstanding orders have been accpted or rejected
         and update the order queue accordingly.
         """
-        debug(f"Updating order queue: {self.order_queue}")
-        for i, order in enumerate(self.order_queue):
+        orders = self.book.orders
+        if len(orders) == 0:
+            return False
+
+        debug(f"Updating order queue: {orders}")
+        order_filled = False
+        for order in list(orders):
             if 'type' not in order:
-                raise Exception(f"key error in {order}\nof {self.order_queue}")
+                raise Exception(f"key error in {order}\nof {orders}")
             if order['type'] == 'STOCK':
                 stat = self.broker.fetch_stock_order_status(order["id"])
             elif order['type'] == 'OPTION':
@@ -408,17 +573,14 @@ class Trader:
             elif order['type'] == 'CRYPTO':
                 stat = self.broker.fetch_crypto_order_status(order["id"])
             debug(f"Updating status of order {order['id']}")
-            self.order_queue[i] = stat
-
-        debug(f"Updated order queue: {self.order_queue}")
-        new_order = []
-        order_filled = False
-        for order in self.order_queue:
-            if order['status'] == 'filled':
-                order_filled = True  
+            # Orders are updated in place, and removed once filled
+            if stat['status'] == 'filled':
+                orders.remove(order['id'])
+                order_filled = True
             else:
-                new_order.append(order)
-        self.order_queue = new_order
+                orders.add(stat)
+
+        debug(f"Updated order queue: {orders}")
 
         # if an order was processed, update the positions and account info
         return order_filled
@@ -432,28 +594,28 @@ class Trader:
         # meaning total equity cannot be calculated locally
         if new or not self.load_watch:
             pos = self.broker.fetch_stock_positions()
-            self.stock_positions = [p for p in pos if p['symbol'] in self.watch]
+            self.book.stocks.set(p for p in pos if p['symbol'] in self.watch)
             pos = self.broker.fetch_option_positions()
-            self.option_positions = [p for p in pos if p['symbol'] in self.watch]
+            self.book.options.set(p for p in pos if p['symbol'] in self.watch)
             pos = self.broker.fetch_crypto_positions()
-            self.crypto_positions = [p for p in pos if p['symbol'] in self.watch]
+            self.book.cryptos.set(p for p in pos if p['symbol'] in self.watch)
             ret = self.broker.fetch_account()
             self.account = ret
 
         if option_update:
-            self.broker.update_option_positions(self.option_positions)
+            self.broker.update_option_positions(self.book.options)
         
-        debug(f"Stock positions: {self.stock_positions}")
-        debug(f"Option positions: {self.option_positions}")
-        debug(f"Crypto positions: {self.crypto_positions}")
+        debug(f"Stock positions: {self.book.stocks}")
+        debug(f"Option positions: {self.book.options}")
+        debug(f"Crypto positions: {self.book.cryptos}")
 
         if new or not self.load_watch:
             return 
         else:
             net_value = 0
-            for p in self.stock_positions + self.crypto_positions:
+            for p in itertools.chain(self.book.stocks, self.book.cryptos):
                 key = p['symbol']
-                price = df_dict[key][key]['close'][0]
+                price = self.queue.get_last_symbol_interval_price(key, self.fetch_interval, 'close')
                 p['current_price'] = price 
                 value = price * p['quantity']
                 p['market_value'] = value
@@ -467,21 +629,21 @@ class Trader:
         """
         # Get any pending orders 
         ret = self.broker.fetch_order_queue()
-        self.order_queue = ret
+        self.book.orders.set(ret)
 
         # Get positions
         pos = self.broker.fetch_stock_positions()
-        self.stock_positions = pos
+        self.book.stocks.set(pos)
         pos = self.broker.fetch_option_positions()
-        self.option_positions = pos
+        self.book.options.set(pos)
         pos = self.broker.fetch_crypto_positions()
-        self.crypto_positions = pos
+        self.book.cryptos.set(pos)
 
         # Get account stats
         ret = self.broker.fetch_account()
         self.account = ret
         # Update option stats
-        self.broker.update_option_positions(self.option_positions)
+        self.broker.update_option_positions(self.book.options)
 
     def fetch_chain_info(self, *args, **kwargs):
         return self.streamer.fetch_chain_info(*args, **kwargs)
@@ -507,8 +669,8 @@ class Trader:
         ret = self.broker.buy(symbol, quantity, in_force, extended)
         if ret == None:
             raise Exception("BUY failed")
-        self.order_queue.append(ret)
-        debug(f"BUY order queue: {self.order_queue}")
+        self.book.orders.add(ret)
+        debug(f"BUY order queue: {self.book.orders}")
         return ret
     
     def await_buy(self, symbol: str=None, quantity: int=0, in_force: str='gtc', extended: bool=False):
@@ -519,8 +681,8 @@ class Trader:
         ret = self.broker.sell(symbol, quantity, in_force, extended)
         if ret == None:
             raise Exception("SELL failed")
-        self.order_queue.append(ret)
-        debug(f"SELL order queue: {self.order_queue}")
+        self.book.orders.add(ret)
+        debug(f"SELL order queue: {self.book.orders}")
         return ret
     
     def await_sell(self, symbol: str=None, quantity: int=0, in_force: str='gtc', extended: bool=False):
@@ -531,16 +693,16 @@ class Trader:
         ret = self.broker.buy_option(symbol, quantity, in_force)
         if ret == None:
             raise Exception("BUY failed")
-        self.order_queue.append(ret)
-        debug(f"BUY order queue: {self.order_queue}")
+        self.book.orders.add(ret)
+        debug(f"BUY order queue: {self.book.orders}")
         return ret
 
     def sell_option(self, symbol: str=None, quantity: int=0, in_force: str='gtc'):
         ret = self.broker.sell_option(symbol, quantity, in_force)
         if ret == None:
             raise Exception("SELL failed")
-        self.order_queue.append(ret)
-        debug(f"SELL order queue: {self.order_queue}")
+        self.book.orders.add(ret)
+        debug(f"SELL order queue: {self.book.orders}")
         return ret
     
     def set_algo(self, algo):
@@ -8,10 +8,8 @@ setup(
     license='MIT',
     install_requires=[
         'pandas',
-        'finta',
         'yahoo-earnings-calendar',
         'pyyaml',
-        'tqdm',
         'pytz'
     ],
     extras_require={
@@ -0,0 +1,91 @@
+# Builtins
+import unittest
+
+# Submodule imports
+from harvest import aggregator, queue, trader
+from harvest.broker.dummy import DummyBroker
+
+# External libraries
+import numpy as np
+import pandas as pd
+
+def make_df(sym, periods, freq='5T'):
+    index = pd.date_range('2021-01-04 14:30', periods=periods, freq=freq, tz='UTC')
+    # Leave a gap to make sure empty buckets are handled
+    index = index.delete(slice(20, 30))
+    rng = np.random.default_rng(0)
+    close = 100 + np.cumsum(rng.normal(0, 1, len(index)))
+    df = pd.DataFrame({
+        'open': close + rng.normal(0, 0.3, len(index)),
+        'high': close + 1,
+        'low': close - 1,
+        'close': close,
+        'volume': rng.integers(1, 1000, len(index)).astype(float)
+    }, index=index)
+    df.columns = pd.MultiIndex.from_product([[sym], df.columns])
+    return df
+
+class TestAggregator(unittest.TestCase):
+    def test_interval_to_ns(self):
+        self.assertEqual(aggregator.interval_to_ns('5MIN'), 300 * 10**9)
+        self.assertEqual(aggregator.interval_to_ns('1HR'), 3600 * 10**9)
+        self.assertEqual(aggregator.interval_to_ns('1DAY'), 86400 * 10**9)
+
+    def test_matches_aggregate_df(self):
+        t = trader.TestTrader(DummyBroker())
+        df = make_df('A', 100)
+        
+        q = queue.Queue()
+        q.init_symbol('A', '5MIN')
+        q.set_symbol_interval('A', '5MIN', df.iloc[:7])
+        agg = aggregator.Aggregator(q)
+        for inter in ['15MIN', '30MIN', '1HR']:
+            q.set_symbol_interval('A', inter, t.aggregate_df(df.iloc[:7], inter))
+        agg.init_symbol('A', '5MIN', ['15MIN', '30MIN', '1HR'])
+
+        for i in range(7, len(df.index)):
+            q.append_symbol_interval('A', '5MIN', df.iloc[[i]], True)
+            agg.update('A', df.iloc[[i]])
+
+            # Send an updated version of the same candle
+            df.iloc[i, 3] += 0.5
+            q.append_symbol_interval('A', '5MIN', df.iloc[[i]], True)
+            agg.update('A', df.iloc[[i]])
+        
+        for inter in ['15MIN', '30MIN', '1HR']:
+            expected = t.aggregate_df(df, inter).dropna()
+            result = q.get_symbol_interval('A', inter)[expected.columns]
+            pd.testing.assert_frame_equal(result, expected, check_freq=False, check_names=False)
+
+    def test_daily(self):
+        # Daily candles start at midnight UTC, same as those of brokers and aggregate_df,
+        # so the candle of the current day is replaced instead of added again
+        t = trader.TestTrader(DummyBroker())
+        df = make_df('A', 100, '1H')
+        q = queue.Queue()
+        q.init_symbol('A', '1HR')
+        q.set_symbol_interval('A', '1HR', df.iloc[:12])
+        q.set_symbol_interval('A', '1DAY', t.aggregate_df(df.iloc[:12], '1DAY'))
+        agg = aggregator.Aggregator(q)
+        agg.init_symbol('A', '1HR', ['1DAY'])
+        for i in range(12, len(df.index)):
+            q.append_symbol_interval('A', '1HR', df.iloc[[i]], True)
+            agg.update('A', df.iloc[[i]])
+
+        expected = t.aggregate_df(df, '1DAY').dropna()
+        result = q.get_symbol_interval('A', '1DAY')[expected.columns]
+        pd.testing.assert_frame_equal(result, expected, check_freq=False, check_names=False)
+
+    def test_rolling_candles(self):
+        t = trader.TestTrader(DummyBroker())
+        df = make_df('A', 60)
+        for inter, points in [('15MIN', 3), ('1HR', 12), ('1HR', 5)]:
+            result = aggregator.rolling_candles(df, inter, points)
+            self.assertEqual(len(result.index), len(df.index))
+            for i in range(len(df.index)):
+                expected = t.aggregate_df(df.iloc[0:i+1].iloc[-points:], inter).iloc[-1]
+                self.assertEqual(result.index[i], expected.name)
+                np.testing.assert_allclose(result.iloc[i].to_numpy(), expected.to_numpy())
+
+if __name__ == '__main__':
+    unittest.main()
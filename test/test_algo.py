@@ -1,7 +1,13 @@
 # Builtins
 import unittest
 
+# External libraries
+import numpy as np
+import pandas as pd
+
+from harvest import options, trader
 from harvest.algo import BaseAlgo 
+from harvest.broker.dummy import DummyBroker
 
 prices = [10, 12, 11, 9, 8, 10, 11, 12, 13, 15, 14, 16, 13, 14]
 
@@ -43,5 +49,39 @@ class TestAlgo(unittest.TestCase):
         self.assertAlmostEqual(upper[-1], expected_middle + std, places=5)
         self.assertAlmostEqual(lower[-1], expected_middle - std, places=5)
 
+    def test_chain_greeks(self):
+        exp = pd.Timestamp('2021-02-19', tz='UTC')
+        chain = pd.DataFrame({
+            'occ_symbol': ['A     210219C00090000', 'A     210219P00110000', 'A     210120C00090000'],
+            'exp_date': [exp, exp, pd.Timestamp('2021-01-20', tz='UTC')],
+            'strike': [90.0, 110.0, 90.0],
+            'type': ['call', 'put', 'call'],
+            'id': ['1', '2', '3'],
+        }).set_index('occ_symbol')
+
+        class Broker(DummyBroker):
+            def fetch_chain_data(self, symbol):
+                return chain
+
+        t = trader.Trader(Broker(), db_path=None)
+        t.timestamp = pd.Timestamp('2021-01-20 21:00', tz='UTC')
+        index = pd.date_range('2021-01-20 20:50', periods=2, freq='5T', tz='UTC')
+        df = pd.DataFrame({'open': 1.0, 'high': 2.0, 'low': 0.5, 'close': [99.0, 100.0], 'volume': 10.0}, index=index)
+        df.columns = pd.MultiIndex.from_product([['A'], df.columns])
+        t.queue.init_symbol('A', '5MIN')
+        t.queue.set_symbol_interval('A', '5MIN', df)
+        algo = BaseAlgo()
+        algo.setup(t)
+        algo.fetch_interval = '5MIN'
+
+        # The chain is priced with the latest price in the queue, at the time of the trader
+        result = algo.get_chain_greeks('A', sigma=0.3)
+        pd.testing.assert_frame_equal(result, options.chain_greeks(chain, 100.0, t.timestamp, sigma=0.3))
+
+        # Options that have expired are worth their intrinsic value
+        expired = result.iloc[2]
+        self.assertEqual(expired['price'], 10.0)
+        self.assertEqual(list(expired[['delta', 'gamma', 'theta', 'vega']]), [1.0, 0.0, 0.0, 0.0])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,81 @@
+# Builtins
+import asyncio
+import datetime as dt
+import unittest
+
+# External libraries
+import numpy as np
+import pandas as pd
+
+# Submodule imports
+from harvest import calendar
+from harvest.broker._base import BaseBroker, Scheduler
+
+class TestScheduler(unittest.TestCase):
+    def test_next(self):
+        s = Scheduler('5MIN', offset=1)
+        self.assertEqual(s.next(0), 1)
+        self.assertEqual(s.next(1), 301)
+        self.assertEqual(s.next(299.5), 301)
+        self.assertEqual(s.next(301.5), 601)
+
+    def test_wait(self):
+        times = []
+        s = Scheduler('1MIN', offset=1, clock=lambda: times.pop(0))
+
+        # Each wait reads the clock once to find the boundary, and again after sleeping.
+        # Boundaries are based on the clock, so waking up late does not cause drift
+        times.extend([120.0, 121.0])
+        self.assertEqual(s.wait(), 121)
+        times.extend([121.4, 181.3])
+        self.assertEqual(asyncio.run(s.wait_async()), 181)
+
+        # Boundaries that were missed are skipped
+        times.extend([400.0, 421.0])
+        self.assertEqual(s.wait(), 421)
+
+        # The same boundary is never returned twice, even if the clock is set back
+        self.assertEqual(s.next(300.0), 481)
+
+    def test_calendar(self):
+        s = Scheduler('5MIN', offset=1, calendar=calendar.NYSE)
+        close = pd.Timestamp('2026-10-16 20:00', tz='UTC').value / 10**9
+        # The last bar of the day is fetched, then the scheduler sleeps until the first bar of the next session ends
+        self.assertEqual(s.next(close - 2), close + 1)
+        self.assertEqual(s.next(close + 1), pd.Timestamp('2026-10-19 13:35:01', tz='UTC').value / 10**9)
+
+class TestOCC(unittest.TestCase):
+    def test_occ_array(self):
+        broker = BaseBroker()
+        symbols = ['SPY', 'A', 'GOOGL']
+        dates = [dt.datetime(2021, 1, 15), dt.datetime(2022, 12, 2), dt.datetime(2030, 6, 30)]
+        types = ['call', 'put', 'call']
+        prices = [420.5, 0.5, 12345.678]
+        expected = [broker.data_to_occ(*row) for row in zip(symbols, dates, types, prices)]
+        self.assertEqual(expected[0], 'SPY   210115C00420500')
+
+        occ = broker.data_to_occ_array(symbols, dates, types, prices)
+        self.assertEqual(list(occ), expected)
+
+        sym, date, typ, price = broker.occ_to_data_array(occ)
+        self.assertEqual(list(sym), symbols)
+        self.assertEqual(list(pd.DatetimeIndex(date).to_pydatetime()), dates)
+        self.assertEqual(list(typ), types)
+        np.testing.assert_array_equal(price, [broker.occ_to_data(o)[3] for o in expected])
+
+        # Symbols that are not padded to 21 characters, or have letters where digits belong, are rejected
+        for bad in ['SPY210115C00420500', 'SPY   210115C00420500X', 'SPY   2101A5C00420500', 'SPY   210115C0042050.']:
+            with self.assertRaises(ValueError):
+                broker.occ_to_data_array(expected + [bad])
+        with self.assertRaises(ValueError):
+            broker.occ_to_data('SPY210115C00420500')
+
+    def test_occ_chain(self):
+        # Dates of a chain are timezone-aware, and a single underlying symbol is broadcast
+        broker = BaseBroker()
+        dates = pd.to_datetime(['2021-01-15', '2021-01-22'], utc=True)
+        occ = broker.data_to_occ_array('SPY', dates, ['put', 'call'], [400.0, 405.0])
+        self.assertEqual(list(occ), ['SPY   210115P00400000', 'SPY   210122C00405000'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+# Builtins
+import unittest
+
+# Submodule imports
+from harvest import book
+
+class TestBook(unittest.TestCase):
+    def test_record(self):
+        pos = book.Position({'symbol': 'A', 'quantity': 2, 'avg_price': 10.0, 'note': 'x'})
+        self.assertEqual(pos['quantity'], 2)
+        self.assertEqual(pos.quantity, 2)
+        self.assertEqual(pos['note'], 'x')
+        self.assertFalse('multiplier' in pos)
+        self.assertIsNone(pos.get('multiplier'))
+        with self.assertRaises(KeyError):
+            pos['multiplier']
+
+        pos['current_price'] = 12.0
+        self.assertEqual(pos, {'symbol': 'A', 'quantity': 2, 'avg_price': 10.0, 'note': 'x', 'current_price': 12.0})
+
+        copy = pos.copy()
+        copy['quantity'] = 3
+        self.assertEqual(pos['quantity'], 2)
+
+    def test_index(self):
+        orders = book.Index(book.Order, 'id')
+        orders.set([{'id': 1, 'symbol': 'A', 'status': 'open'}, {'id': 2, 'symbol': 'B', 'status': 'open'}])
+        self.assertEqual(len(orders), 2)
+        self.assertEqual(orders[2]['symbol'], 'B')
+
+        # Adding a record with an existing key replaces it, keeping the order
+        orders.add({'id': 1, 'symbol': 'A', 'status': 'filled'})
+        self.assertEqual([o['status'] for o in orders], ['filled', 'open'])
+
+        self.assertEqual(orders.remove(1)['symbol'], 'A')
+        self.assertIsNone(orders.remove(1))
+        self.assertFalse(1 in orders)
+
+    def test_get_position(self):
+        b = book.Book()
+        b.stocks.add({'symbol': 'A', 'quantity': 1})
+        b.cryptos.add({'symbol': '@A', 'quantity': 2})
+        b.options.add({'symbol': 'A', 'occ_symbol': 'A     210101C00010000', 'quantity': 3})
+        self.assertEqual(b.get_position('A')['quantity'], 1)
+        self.assertEqual(b.get_position('@A')['quantity'], 2)
+        self.assertEqual(b.get_position('A     210101C00010000')['quantity'], 3)
+        self.assertIsNone(b.get_position('B'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# Builtins
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+# Submodule imports
+from harvest.cache import FileCache, TTLCache
+
+class TestFileCache(unittest.TestCase):
+    def test_get_many(self):
+        calls = []
+        def fetch(url):
+            calls.append(url)
+            return url.upper()
+
+        with tempfile.TemporaryDirectory() as path:
+            file = os.path.join(path, 'instruments.json')
+            cache = FileCache(file)
+            self.assertEqual(cache.get_many(['a', 'b', 'a'], fetch), {'a': 'A', 'b': 'B'})
+            self.assertEqual(calls, ['a', 'b'])
+
+            # Only new keys are fetched, and the cache persists between runs
+            cache = FileCache(file)
+            with ThreadPoolExecutor(2) as pool:
+                self.assertEqual(cache.get_many(['a', 'c'], fetch, pool), {'a': 'A', 'c': 'C'})
+            self.assertEqual(calls, ['a', 'b', 'c'])
+            self.assertEqual(len(FileCache(file)), 3)
+
+    def test_none(self):
+        cache = FileCache()
+        self.assertEqual(cache.get_many(['a'], lambda k: None), {'a': None})
+        self.assertFalse('a' in cache)
+
+    def test_broken_file(self):
+        with tempfile.TemporaryDirectory() as path:
+            file = os.path.join(path, 'instruments.json')
+            with open(file, 'w') as f:
+                f.write('{"a": ')
+            cache = FileCache(file)
+            self.assertEqual(len(cache), 0)
+            cache.update({'a': 1})
+            self.assertEqual(FileCache(file)['a'], 1)
+
+class TestTTLCache(unittest.TestCase):
+    def test_expiry(self):
+        now = [100.0]
+        cache = TTLCache(ttl=10, clock=lambda: now[0])
+        cache.set('SPY', 1)
+        now[0] = 109.9
+        self.assertEqual(cache.get('SPY'), 1)
+        now[0] = 110
+        self.assertIsNone(cache.get('SPY'))
+        self.assertEqual(cache.data, {})
+
+        # Entries can also expire at a time calculated when they are added
+        cache = TTLCache(expires=lambda t: t - t % 50 + 50, clock=lambda: now[0])
+        cache.set('SPY', 2)
+        now[0] = 149
+        self.assertEqual(cache.get('SPY'), 2)
+        now[0] = 150
+        self.assertIsNone(cache.get('SPY'))
+
+    def test_persist(self):
+        now = [100.0]
+        with tempfile.TemporaryDirectory() as path:
+            cache = TTLCache(ttl=10, path=path, clock=lambda: now[0])
+            cache.set('SPY', {'a': 1})
+            cache = TTLCache(ttl=10, path=path, clock=lambda: now[0])
+            self.assertEqual(cache.get('SPY'), {'a': 1})
+            cache.set('QQQ', 2)
+            cache.clear()
+            self.assertEqual(os.listdir(path), [])
+
+            # Expired entries are removed from the directory when they are read
+            cache.set('SPY', 3)
+            now[0] = 200
+            self.assertIsNone(TTLCache(ttl=10, path=path, clock=lambda: now[0]).get('SPY'))
+            self.assertEqual(os.listdir(path), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+# Builtins
+import datetime as dt
+import os
+import tempfile
+import unittest
+
+# External libraries
+import numpy as np
+import pandas as pd
+
+# Submodule imports
+from harvest import calendar
+
+class TestCalendar(unittest.TestCase):
+    def test_is_open(self):
+        nyse = calendar.NYSE
+        self.assertFalse(nyse.is_open('2026-10-16 13:29'))
+        self.assertTrue(nyse.is_open('2026-10-16 13:30'))
+        self.assertTrue(nyse.is_open(pd.Timestamp('2026-10-16 15:59', tz='America/New_York')))
+        self.assertFalse(nyse.is_open('2026-10-16 20:00'))
+        # Weekend, holiday, and half day
+        self.assertFalse(nyse.is_open('2026-10-17 15:00'))
+        self.assertFalse(nyse.is_open('2026-12-25 15:00'))
+        self.assertTrue(nyse.is_open('2026-11-27 17:59'))
+        self.assertFalse(nyse.is_open('2026-11-27 18:00'))
+
+        index = pd.date_range('2026-10-16 13:00', periods=4, freq='30T', tz='UTC')
+        np.testing.assert_array_equal(nyse.is_open(index), [False, True, True, True])
+
+    def test_next_open(self):
+        nyse = calendar.NYSE
+        self.assertEqual(nyse.next_open('2026-10-16 20:00'), pd.Timestamp('2026-10-19 13:30', tz='UTC'))
+        self.assertEqual(nyse.next_open('2026-12-24 19:00'), pd.Timestamp('2026-12-28 14:30', tz='UTC'))
+        self.assertEqual(nyse.next_open('2026-10-16 14:00'), pd.Timestamp('2026-10-16 14:00', tz='UTC'))
+        self.assertTrue(nyse.is_close('2026-10-16 20:00'))
+        self.assertTrue(nyse.is_close('2026-11-27 18:00'))
+        self.assertFalse(nyse.is_close('2026-11-27 21:00'))
+        self.assertEqual(nyse.next_session_open('2026-10-16 14:00'), pd.Timestamp('2026-10-19 13:30', tz='UTC'))
+        self.assertEqual(nyse.next_session_open('2026-10-16 13:00'), pd.Timestamp('2026-10-16 13:30', tz='UTC'))
+        self.assertFalse(nyse.is_open_between('2026-10-16 20:00', '2026-10-19 13:00'))
+        self.assertTrue(nyse.is_open_between('2026-10-16 20:00', '2026-10-19 14:00'))
+
+    def test_day_start(self):
+        # Candles after 8PM in New York belong to the same trading day
+        t = pd.Timestamp('2026-10-17 01:00', tz='UTC').value
+        self.assertEqual(calendar.NYSE.day_start(t), pd.Timestamp('2026-10-16 04:00', tz='UTC').value)
+        self.assertEqual(calendar.CRYPTO.day_start(t), pd.Timestamp('2026-10-17', tz='UTC').value)
+
+    def test_crypto(self):
+        self.assertTrue(calendar.get_calendar('@BTC').is_open('2026-10-17 03:00'))
+        self.assertEqual(calendar.expected_symbols(['A', '@BTC'], '2026-10-17 03:00'), ['@BTC'])
+        self.assertEqual(calendar.expected_symbols(['A', '@BTC'], '2026-10-16 15:00'), ['A', '@BTC'])
+
+    def test_from_file(self):
+        with tempfile.TemporaryDirectory() as path:
+            file = os.path.join(path, 'holidays.csv')
+            with open(file, 'w') as f:
+                f.write('# Custom table\n2026-10-16\n2026-10-19,12:00\n')
+            cal = calendar.MarketCalendar.from_file(file, 'UTC', dt.time(9), dt.time(17), start='2026-10-01', end='2026-10-31')
+        self.assertFalse(cal.is_open('2026-10-16 10:00'))
+        self.assertTrue(cal.is_open('2026-10-19 11:59'))
+        self.assertFalse(cal.is_open('2026-10-19 12:00'))
+        self.assertTrue(cal.is_open('2026-10-20 16:59'))
+
+if __name__ == '__main__':
+    unittest.main()
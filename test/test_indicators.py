@@ -0,0 +1,175 @@
+# Builtins
+import unittest
+
+# Submodule imports
+from harvest import indicators, queue
+from harvest.algo import BaseAlgo
+
+# External libraries
+import numpy as np
+import pandas as pd
+
+prices = [10, 12, 11, 9, 8, 10, 11, 12, 13, 15, 14, 16, 13, 14, 14, 12, 15, 17, 16, 18]
+
+class TestIndicators(unittest.TestCase):
+    def check(self, ind, expected):
+        # Feed each price twice, first a wrong one that is then replaced
+        for p in prices:
+            ind.update(p * 2)
+            ind.update(p, replace=True)
+        result = ind.values()
+        if not isinstance(result, tuple):
+            result, expected = (result,), (expected,)
+        for r, e in zip(result, expected):
+            np.testing.assert_allclose(r, e, equal_nan=True)
+
+    def test_rsi(self):
+        self.check(indicators.RSI(5), BaseAlgo().rsi(prices, period=5))
+
+    def test_sma(self):
+        self.check(indicators.SMA(5), BaseAlgo().sma(prices, period=5))
+
+    def test_ema(self):
+        self.check(indicators.EMA(5), BaseAlgo().ema(prices, period=5))
+
+    def test_bbands(self):
+        self.check(indicators.BBands(5, dev=1.5), BaseAlgo().bbands(prices, period=5, dev=1.5))
+
+    def test_precision(self):
+        # A long random walk drifts far from its first price. The standard deviation is
+        # checked against one calculated directly from each window.
+        x = 100 + np.cumsum(np.random.default_rng(0).normal(0, 1, 5000))
+        for period in [2, 5, 20]:
+            expected = np.lib.stride_tricks.sliding_window_view(x, period).std(axis=-1, ddof=1)
+            upper, mid, lower = indicators.bbands(x, period)
+            np.testing.assert_allclose((upper - mid)[period - 1:], expected, rtol=1e-8)
+            std = indicators.StdDev(period)
+            for p in x:
+                std.update(p)
+            np.testing.assert_allclose(std.values()[period - 1:], expected, rtol=1e-8)
+
+    def test_maxlen(self):
+        # Only the last maxlen values are kept, and the storage does not grow
+        long = np.tile(prices, 50).astype(float)
+        for ind, func in [(indicators.SMA(5, maxlen=30), BaseAlgo().sma), (indicators.RSI(5, maxlen=30), BaseAlgo().rsi)]:
+            for p in long:
+                ind.update(p * 2)
+                ind.update(p, replace=True)
+            self.assertLessEqual(len(ind.x), 60)
+            np.testing.assert_allclose(ind.values(30), func(list(long), period=5)[-30:], equal_nan=True)
+        bands = indicators.BBands(5, dev=1.5, maxlen=30)
+        for p in long:
+            bands.update(p)
+        for r, e in zip(bands.values(30), BaseAlgo().bbands(list(long), period=5, dev=1.5)):
+            np.testing.assert_allclose(r, e[-30:])
+
+    def test_padded_rows(self):
+        x = np.full((2, len(prices)), np.nan)
+        x[0] = prices
+        x[1, 5:] = prices[5:]
+        for func in [indicators.rsi, indicators.sma, indicators.ema, lambda p, n: indicators.bbands(p, n)[0]]:
+            result = func(x, 4)
+            np.testing.assert_allclose(result[0], func(prices, 4), equal_nan=True)
+            np.testing.assert_allclose(result[1, 5:], func(prices[5:], 4), equal_nan=True)
+            self.assertTrue(np.isnan(result[1, :5]).all())
+
+    def test_subscribe(self):
+        q = queue.Queue()
+        q.init_symbol('A', '1MIN')
+        index = pd.date_range('2021-01-01 10:00', periods=len(prices), freq='1T', tz='UTC')
+        df = pd.DataFrame({'close': np.array(prices, dtype=float)}, index=index)
+
+        q.set_symbol_interval('A', '1MIN', df.iloc[:10])
+        sma = indicators.SMA(3)
+        q.subscribe('A', '1MIN', 'close', sma)
+        for i in range(10, len(prices)):
+            q.append_symbol_interval('A', '1MIN', df.iloc[[i]], True)
+        np.testing.assert_allclose(sma.values(), BaseAlgo().sma(prices, period=3), equal_nan=True)
+
+        # Replacing the contents of the queue resets the indicator
+        q.set_symbol_interval('A', '1MIN', df.iloc[:5])
+        np.testing.assert_allclose(sma.values(), BaseAlgo().sma(prices[:5], period=3), equal_nan=True)
+
+    def test_memo(self):
+        class Trader:
+            pass
+        algo = BaseAlgo()
+        algo.setup(Trader())
+        algo.trader.queue = q = queue.Queue()
+        q.init_symbol('A', '1MIN')
+        index = pd.date_range('2021-01-01 10:00', periods=len(prices), freq='1T', tz='UTC')
+        df = pd.DataFrame({'close': np.array(prices, dtype=float)}, index=index)
+        q.set_symbol_interval('A', '1MIN', df.iloc[:10])
+
+        # Bands with different dev share the SMA and standard deviation with each other and with sma()
+        upper, mid, lower = algo.bbands(symbol='A', period=5, interval='1MIN')
+        algo.bbands(symbol='A', period=5, interval='1MIN', dev=2.0)
+        sma = algo.sma(symbol='A', period=5, interval='1MIN')
+        self.assertEqual(len([k for k in algo.indicators if k[0] == 'SMA']), 1)
+        self.assertIs(sma, algo.sma(symbol='A', period=5, interval='1MIN'))
+        np.testing.assert_allclose(mid, sma, equal_nan=True)
+
+        # A new candle evicts the cached results, and so does overwriting the last one
+        q.append_symbol_interval('A', '1MIN', df.iloc[[10]], True)
+        sma = algo.sma(symbol='A', period=5, interval='1MIN')
+        np.testing.assert_allclose(sma, BaseAlgo().sma(prices[:11], period=5), equal_nan=True)
+        replaced = df.iloc[[10]] * 2
+        q.append_symbol_interval('A', '1MIN', replaced, True)
+        bands = algo.bbands(symbol='A', period=5, interval='1MIN', dev=2.0)
+        expected = BaseAlgo().bbands(prices[:10] + [prices[10] * 2], period=5, dev=2.0)
+        for r, e in zip(bands, expected):
+            np.testing.assert_allclose(r, e, equal_nan=True)
+
+    def test_memo_maxlen(self):
+        class Trader:
+            pass
+        algo = BaseAlgo()
+        algo.setup(Trader())
+        algo.trader.queue = q = queue.Queue(maxlen=8)
+        q.init_symbol('A', '1MIN')
+        index = pd.date_range('2021-01-01 10:00', periods=len(prices), freq='1T', tz='UTC')
+        df = pd.DataFrame({'close': np.array(prices, dtype=float)}, index=index)
+        q.set_symbol_interval('A', '1MIN', df.iloc[:5])
+
+        # The SMA is created before the bands, and has seen more prices than the queue holds when they are
+        algo.sma(symbol='A', period=3, interval='1MIN')
+        for i in range(5, 15):
+            q.append_symbol_interval('A', '1MIN', df.iloc[[i]], True)
+        algo.bbands(symbol='A', period=3, interval='1MIN')
+        for i in range(15, len(prices)):
+            q.append_symbol_interval('A', '1MIN', df.iloc[[i]], True)
+        bands = algo.bbands(symbol='A', period=3, interval='1MIN')
+        expected = BaseAlgo().bbands(prices[-8:], period=3)
+        for r, e in zip(bands, expected):
+            np.testing.assert_allclose(r[2:], e[2:])
+
+        # Setting the algo up again detaches its indicators from the old queue
+        algo.setup(Trader())
+        self.assertEqual(q.listeners[('A', '1MIN')], [])
+        self.assertEqual(algo.indicators, {})
+
+    def test_all(self):
+        class Trader:
+            pass
+        algo = BaseAlgo()
+        algo.setup(Trader())
+        algo.trader.queue = q = queue.Queue()
+        index = pd.date_range('2021-01-01 10:00', periods=len(prices), freq='1T', tz='UTC')
+        df = pd.DataFrame({'close': np.array(prices, dtype=float)}, index=index)
+        for sym, start in [('A', 0), ('B', 7)]:
+            algo.add_symbol(sym)
+            q.init_symbol(sym, '1MIN')
+            q.set_symbol_interval(sym, '1MIN', df.iloc[start:])
+
+        for name in ['rsi', 'sma', 'ema', 'bbands']:
+            result = getattr(algo, name + '_all')(period=4, interval='1MIN')
+            self.assertEqual(list(result), ['A', 'B'])
+            for sym, start in [('A', 0), ('B', 7)]:
+                expected = getattr(BaseAlgo(), name)(prices[start:], period=4)
+                if not isinstance(expected, tuple):
+                    result[sym], expected = (result[sym],), (expected,)
+                for r, e in zip(result[sym], expected):
+                    np.testing.assert_allclose(r, e, equal_nan=True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+# Builtins
+import multiprocessing
+import os
+import tempfile
+import threading
+import unittest
+
+# External libraries
+import numpy as np
+import pandas as pd
+
+# Submodule imports
+from harvest import load
+
+def append_hours(path, hours):
+    db = load.Load(path)
+    for h in hours:
+        db.append_entry('A', make_df(pd.Timestamp('2021-01-01') + pd.Timedelta(hours=h), 1, float(h)), '1HR')
+
+def make_df(start, periods, offset=0.0):
+    index = pd.date_range(start, periods=periods, freq='1H', tz='UTC')
+    data = np.arange(periods * 2, dtype=float).reshape(periods, 2) + offset
+    return pd.DataFrame(data, index=index, columns=pd.MultiIndex.from_product([['A'], ['close', 'volume']]))
+
+class TestLoad(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.load = load.Load(self.dir.name)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_empty(self):
+        self.assertTrue(self.load.get_entry('A', '1HR').empty)
+
+    def test_append(self):
+        df = make_df('2021-01-01 20:00', 10)
+        self.load.append_entry('A', df, '1HR')
+        pd.testing.assert_frame_equal(self.load.get_entry('A', '1HR'), df, check_freq=False)
+
+        # Rows are split by day, and only new rows are written
+        manifest = self.load._read_manifest('A', '1HR')
+        self.assertEqual([s['rows'] for s in manifest['segments']], [4, 6])
+        self.load.append_entry('A', make_df('2021-01-02 06:00', 2), '1HR')
+        manifest = self.load._read_manifest('A', '1HR')
+        self.assertEqual([s['rows'] for s in manifest['segments']], [4, 6, 2])
+
+    def test_log(self):
+        self.load.append_entry('A', make_df('2021-01-01 00:00', 2), '1HR')
+        path = f"{self.dir.name}/A/1HR/manifest.json"
+        with open(path) as f:
+            before = f.read()
+
+        # Later appends only add to the log, and leave the manifest as is
+        self.load.append_entry('A', make_df('2021-01-01 02:00', 2, 10.0), '1HR')
+        self.load.append_entry('A', make_df('2021-01-01 04:00', 2, 20.0), '1HR')
+        with open(path) as f:
+            self.assertEqual(f.read(), before)
+        manifest = self.load._read_manifest('A', '1HR')
+        self.assertEqual([s['rows'] for s in manifest['segments']], [2, 2, 2])
+
+        # An entry that was only partly written is skipped, and does not affect later ones
+        with open(f"{self.dir.name}/A/1HR/segments.log", 'a') as f:
+            f.write('\n{"name": "2021')
+        self.load.append_entry('A', make_df('2021-01-01 06:00', 2, 30.0), '1HR')
+        result = self.load.get_entry('A', '1HR')
+        self.assertEqual(len(result), 8)
+        self.assertEqual(result[('A', 'close')].iloc[-1], 32.0)
+
+        # Compacting folds the log into the manifest
+        self.load.compact('A', '1HR')
+        self.assertFalse(os.path.exists(f"{self.dir.name}/A/1HR/segments.log"))
+        pd.testing.assert_frame_equal(self.load.get_entry('A', '1HR'), result)
+
+    def test_overwrite(self):
+        self.load.append_entry('A', make_df('2021-01-01 00:00', 5), '1HR')
+        self.load.append_entry('A', make_df('2021-01-01 03:00', 5, 100.0), '1HR')
+        result = self.load.get_entry('A', '1HR')
+        self.assertEqual(len(result), 8)
+        self.assertEqual(result[('A', 'close')].iloc[2], 4.0)
+        self.assertEqual(result[('A', 'close')].iloc[3], 100.0)
+
+    def test_range(self):
+        df = make_df('2021-01-01 00:00', 72)
+        self.load.append_entry('A', df, '1HR')
+        self.assertEqual(self.load.get_range('A', '1HR'), (df.index[0], df.index[-1]))
+
+        result = self.load.get_entry('A', '1HR', start=df.index[30], end=df.index[40])
+        pd.testing.assert_frame_equal(result, df.iloc[30:41], check_freq=False)
+        result = self.load.get_entry('A', '1HR', start=df.index[50].tz_localize(None).to_pydatetime())
+        pd.testing.assert_frame_equal(result, df.iloc[50:], check_freq=False)
+
+        # Segments of days outside of the range are not read
+        os.remove(f"{self.dir.name}/A/1HR/20210101-0-data.npy")
+        result = self.load.get_entry('A', '1HR', start=df.index[24])
+        pd.testing.assert_frame_equal(result, df.iloc[24:], check_freq=False)
+        self.assertTrue(self.load.get_entry('A', '1HR', start='2021-02-01').empty)
+
+    def test_arrays(self):
+        df = make_df('2021-01-01 00:00', 72)
+        self.load.append_entry('A', df, '1HR')
+        index, data, columns = self.load.get_arrays('A', '1HR', start=df.index[10])
+        self.assertIsInstance(data, np.memmap)
+        self.assertFalse(data.flags.writeable)
+        pd.testing.assert_index_equal(index, df.index[10:], exact=False)
+        pd.testing.assert_index_equal(columns, df.columns)
+        np.testing.assert_array_equal(data, df.to_numpy()[10:])
+
+        # The snapshot is rewritten once the data changes
+        self.load.append_entry('A', make_df('2021-01-04 00:00', 1, 100.0), '1HR')
+        index, data, columns = self.load.get_arrays('A', '1HR')
+        self.assertEqual(len(index), 73)
+        self.assertEqual(data[-1, 0], 100.0)
+        snapshots = [f for f in os.listdir(f"{self.dir.name}/A/1HR") if f.startswith('snapshot-')]
+        self.assertEqual(len(snapshots), 4)
+
+        # Replaced snapshots are kept until they have been replaced for long enough
+        grace = load.SNAPSHOT_GRACE
+        load.SNAPSHOT_GRACE = 0
+        try:
+            self.load.append_entry('A', make_df('2021-01-04 01:00', 1, 200.0), '1HR')
+            index, data, columns = self.load.get_arrays('A', '1HR')
+        finally:
+            load.SNAPSHOT_GRACE = grace
+        self.assertEqual(data[-1, 0], 200.0)
+        snapshots = [f for f in os.listdir(f"{self.dir.name}/A/1HR") if f.startswith('snapshot-')]
+        self.assertEqual(len(snapshots), 2)
+
+    def test_compact(self):
+        expected = None
+        for i in range(load.COMPACT_SEGMENTS + 1):
+            df = make_df(pd.Timestamp('2021-01-01') + pd.Timedelta(hours=i), 1)
+            self.load.append_entry('A', df, '1HR')
+            expected = df if expected is None else pd.concat([expected, df])
+
+        manifest = self.load._read_manifest('A', '1HR')
+        self.assertEqual(len(manifest['segments']), 1)
+        self.assertEqual(len([f for f in os.listdir(f"{self.dir.name}/A/1HR") if f.endswith('.npy')]), 2)
+        pd.testing.assert_frame_equal(self.load.get_entry('A', '1HR'), expected, check_freq=False)
+
+    @unittest.skipIf(load.fcntl is None, "File locks are not supported")
+    def test_processes(self):
+        # Processes that append at the same time do not lose each other's segments
+        self.load.append_entry('A', make_df('2021-01-01 00:00', 1), '1HR')
+        ctx = multiprocessing.get_context('fork')
+        procs = [ctx.Process(target=append_hours, args=(self.dir.name, range(i, 41, 4))) for i in range(1, 5)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        result = self.load.get_entry('A', '1HR')
+        self.assertEqual(len(result), 41)
+        np.testing.assert_array_equal(result[('A', 'close')].to_numpy()[1:], np.arange(1, 41))
+
+    def test_threads(self):
+        # Changes to different symbols do not wait for each other
+        done = threading.Event()
+        def append():
+            self.load.append_entry('B', make_df('2021-01-01 00:00', 1), '1HR')
+            done.set()
+        with self.load._locked('A', '1HR'):
+            threading.Thread(target=append).start()
+            self.assertTrue(done.wait(10))
+
+    def test_legacy(self):
+        df = make_df('2021-01-01 00:00', 5)
+        os.makedirs(f"{self.dir.name}/A")
+        df.to_pickle(f"{self.dir.name}/A/data-1HR")
+        self.assertEqual(self.load.get_range('A', '1HR'), (df.index[0], df.index[-1]))
+        pd.testing.assert_frame_equal(self.load.get_entry('A', '1HR'), df, check_freq=False)
+
+        # The data is only migrated once
+        self.load.append_entry('A', make_df('2021-01-01 05:00', 1, 100.0), '1HR')
+        self.assertEqual(len(self.load._read_manifest('A', '1HR')['segments']), 2)
+        self.assertEqual(len(load.Load(self.dir.name).get_entry('A', '1HR')), 6)
+
+if __name__ == '__main__':
+    unittest.main()
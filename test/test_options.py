@@ -0,0 +1,73 @@
+# Builtins
+import math
+import unittest
+
+# External libraries
+import numpy as np
+import pandas as pd
+
+# Submodule imports
+from harvest import options
+
+class TestOptions(unittest.TestCase):
+    def test_price(self):
+        # Reference value of a textbook example: S=42, K=40, T=0.5, r=10%, sigma=20%
+        call, put = options.price(42, 40, 0.5, 0.2, [True, False], 0.1)
+        self.assertAlmostEqual(call, 4.7594, places=4)
+        self.assertAlmostEqual(put, 0.8086, places=4)
+
+        # Put-call parity holds for every strike
+        K = np.linspace(50, 150, 101)
+        call = options.price(100, K, 0.25, 0.3, True, 0.05, 0.02)
+        put = options.price(100, K, 0.25, 0.3, False, 0.05, 0.02)
+        np.testing.assert_allclose(call - put, 100 * math.exp(-0.02 * 0.25) - K * math.exp(-0.05 * 0.25), atol=1e-5)
+
+    def test_greeks(self):
+        K = np.array([80.0, 100.0, 120.0])
+        g = options.greeks(100, K, 0.5, 0.25, True)
+        h = 0.01
+        up = options.price(100 + h, K, 0.5, 0.25, True)
+        down = options.price(100 - h, K, 0.5, 0.25, True)
+        np.testing.assert_allclose(g['delta'], (up - down) / (2 * h), atol=1e-4)
+        vega = (options.price(100, K, 0.5, 0.2501, True) - options.price(100, K, 0.5, 0.2499, True)) / 0.02
+        np.testing.assert_allclose(g['vega'], vega, atol=1e-4)
+        self.assertTrue((g['gamma'] > 0).all())
+        self.assertTrue((g['theta'] < 0).all())
+
+        # At expiration, only options in the money change with the underlying
+        g = options.greeks(100, [90.0, 100.0, 110.0, 90.0, 100.0, 110.0], 0.0, 0.25, [True] * 3 + [False] * 3)
+        np.testing.assert_array_equal(g['delta'], [1.0, 0.0, 0.0, 0.0, 0.0, -1.0])
+        for name in ['gamma', 'theta', 'vega']:
+            np.testing.assert_array_equal(g[name], 0.0)
+
+    def test_implied_volatility(self):
+        K = np.linspace(80, 120, 17)
+        sigma = np.linspace(0.2, 0.9, 17)
+        is_call = np.arange(17) % 2 == 0
+        prices = options.price(100, K, 0.3, sigma, is_call, 0.02)
+        iv = options.implied_volatility(prices, 100, K, 0.3, is_call, 0.02)
+        np.testing.assert_allclose(iv, sigma, atol=1e-4)
+        # Prices below the intrinsic value have no solution
+        self.assertTrue(np.isnan(options.implied_volatility(5.0, 100, 90, 0.3, True)))
+
+    def test_chain_greeks(self):
+        exp = pd.Timestamp('2021-02-19', tz='UTC')
+        chain = pd.DataFrame({
+            'occ_symbol': ['A     210219C00090000', 'A     210219P00110000'],
+            'exp_date': [exp, exp],
+            'strike': [90.0, 110.0],
+            'type': ['call', 'put'],
+            'id': ['1', '2'],
+        }).set_index('occ_symbol')
+        now = pd.Timestamp('2021-01-20 21:00', tz='UTC')
+        df = options.chain_greeks(chain, 100.0, now, sigma=0.3)
+        self.assertEqual(list(df.columns), ['exp_date', 'strike', 'type', 'id', 'price', 'iv', 'delta', 'gamma', 'theta', 'vega'])
+        self.assertAlmostEqual(options.years_to_expiration([exp], now)[0], 30 / 365)
+        self.assertTrue(df['delta'].iloc[0] > 0 and df['delta'].iloc[1] < 0)
+
+        # Implied volatilities are recovered from market prices
+        df = options.chain_greeks(chain, 100.0, now, prices=df['price'])
+        np.testing.assert_allclose(df['iv'], 0.3, atol=1e-4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,7 @@ import datetime as dt
 from harvest import queue
 
 # External libraries
+import numpy as np
 import pandas as pd
 
 class TestQueue(unittest.TestCase):
@@ -23,5 +24,77 @@ class TestQueue(unittest.TestCase):
 		q.set_symbol_interval('A', '1MIN', pd.DataFrame({'A': [0, 1, 2], 'B': [3, 4, 5]}))
 		self.assertEqual(q.get_symbol_interval('A', '1MIN').shape, (3, 2))
 
+	def test_append(self):
+		q = queue.Queue()
+		q.init_symbol('A', '1MIN')
+
+		index = pd.date_range('2021-01-01 10:00', periods=3, freq='1T', tz='UTC')
+		df = pd.DataFrame({'open': [1.0, 2.0, 3.0], 'close': [1.5, 2.5, 3.5]}, index=index)
+		df.columns = pd.MultiIndex.from_product([['A'], df.columns])
+		q.append_symbol_interval('A', '1MIN', df)
+
+		# Appending a new candle
+		new = pd.DataFrame({'open': [4.0], 'close': [4.5]}, index=index[[-1]] + dt.timedelta(minutes=1))
+		new.columns = pd.MultiIndex.from_product([['A'], new.columns])
+		q.append_symbol_interval('A', '1MIN', new, True)
+		self.assertEqual(q.get_symbol_interval_prices('A', '1MIN', 'close'), [1.5, 2.5, 3.5, 4.5])
+
+		# Overwriting the last candle
+		new['A', 'close'] = 5.0
+		q.append_symbol_interval('A', '1MIN', new, True)
+		self.assertEqual(q.get_symbol_interval_prices('A', '1MIN', 'close'), [1.5, 2.5, 3.5, 5.0])
+		self.assertEqual(q.get_last_symbol_interval_price('A', '1MIN', 'close'), 5.0)
+
+		last = q.get_last_symbol_interval('A', '1MIN')
+		self.assertEqual(last.index[0], new.index[0])
+		self.assertEqual(list(last.columns), [('A', 'open'), ('A', 'close')])
+
+	def test_maxlen(self):
+		q = queue.Queue(maxlen=10)
+		q.init_symbol('A', '1MIN')
+		index = pd.date_range('2021-01-01 10:00', periods=1000, freq='1T', tz='UTC')
+		for i in range(len(index)):
+			df = pd.DataFrame({'close': [float(i)]}, index=index[[i]])
+			q.append_symbol_interval('A', '1MIN', df)
+		self.assertEqual(q.get_symbol_interval_prices('A', '1MIN', 'close'), [float(i) for i in range(990, 1000)])
+		self.assertEqual(q.get_symbol_interval('A', '1MIN').index[0], index[990])
+
+	def test_replay(self):
+		q = queue.Queue()
+		q.init_symbol('A', '1MIN')
+		index = pd.date_range('2021-01-01 10:00', periods=5, freq='1T', tz='UTC')
+		df = pd.DataFrame({'close': [1.0, 2.0, 3.0, 4.0, 5.0]}, index=index)
+		q.load_symbol_interval('A', '1MIN', df)
+		self.assertEqual(len(q.get_symbol_interval_array('A', '1MIN', 'close')), 0)
+
+		q.seek_symbol_interval('A', '1MIN', 3)
+		self.assertEqual(list(q.get_symbol_interval_array('A', '1MIN', 'close')), [1.0, 2.0, 3.0])
+		self.assertEqual(q.get_last_symbol_interval_timestamp('A', '1MIN'), index[2])
+
+		# The last row can be overwritten while seeking
+		q.seek_symbol_interval('A', '1MIN', 4, [10.0])
+		self.assertEqual(list(q.get_symbol_interval_array('A', '1MIN', 'close')), [1.0, 2.0, 3.0, 10.0])
+
+		with self.assertRaises(Exception):
+			q.seek_symbol_interval('A', '1MIN', 6)
+		with self.assertRaises(Exception):
+			q.append_symbol_interval('A', '1MIN', df)
+
+	def test_replay_arrays(self):
+		q = queue.Queue()
+		q.init_symbol('A', '1MIN')
+		index = pd.date_range('2021-01-01 10:00', periods=5, freq='1T', tz='UTC')
+		data = np.arange(10, dtype=float).reshape(5, 2)
+		data.flags.writeable = False
+		columns = pd.MultiIndex.from_product([['A'], ['open', 'close']])
+		q.load_symbol_interval_arrays('A', '1MIN', index, data, columns)
+
+		# The arrays are used directly, without copying
+		q.seek_symbol_interval('A', '1MIN', 2)
+		self.assertTrue(np.shares_memory(q.get_symbol_interval_array('A', '1MIN', 'close'), data))
+		self.assertEqual(list(q.get_symbol_interval_array('A', '1MIN', 'close')), [1.0, 3.0])
+		self.assertEqual(q.get_last_symbol_interval_timestamp('A', '1MIN'), index[1])
+		self.assertEqual(list(q.get_symbol_interval('A', '1MIN').columns), list(columns))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
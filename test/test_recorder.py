@@ -0,0 +1,66 @@
+# Builtins
+import tempfile
+import threading
+import unittest
+
+# External libraries
+import pandas as pd
+
+# Submodule imports
+from harvest import load, recorder
+
+def make_df(sym, start, periods):
+    index = pd.date_range(start, periods=periods, freq='1T', tz='UTC')
+    df = pd.DataFrame({'close': range(periods)}, index=index, dtype=float)
+    df.columns = pd.MultiIndex.from_product([[sym], df.columns])
+    return df
+
+class TestRecorder(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.db = load.Load(self.dir.name)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_flush_on_close(self):
+        rec = recorder.Recorder(self.db, '1MIN', max_rows=1000, flush_interval=1000)
+        df = make_df('A', '2021-01-01 10:00', 10)
+        for i in range(10):
+            rec.record({'A': df.iloc[[i]], 'B': make_df('B', df.index[i], 1)})
+        self.assertTrue(self.db.get_entry('A', '1MIN').empty)
+
+        rec.close()
+        pd.testing.assert_frame_equal(self.db.get_entry('A', '1MIN'), df, check_freq=False)
+        self.assertEqual(len(self.db.get_entry('B', '1MIN')), 10)
+        # Each flush writes a single segment per symbol
+        self.assertEqual(len(self.db._read_manifest('A', '1MIN')['segments']), 1)
+
+    def test_flush_on_size(self):
+        written = threading.Event()
+        class Load(load.Load):
+            def append_entry(self, symbol, df, type):
+                super().append_entry(symbol, df, type)
+                written.set()
+
+        db = Load(self.dir.name)
+        rec = recorder.Recorder(db, '1MIN', max_rows=5, flush_interval=1000)
+        df = make_df('A', '2021-01-01 10:00', 5)
+        rec.record({'A': df})
+        # The background thread writes the candles without waiting for the flush interval
+        self.assertTrue(written.wait(30))
+        pd.testing.assert_frame_equal(db.get_entry('A', '1MIN'), df, check_freq=False)
+        rec.close()
+
+    def test_bounded(self):
+        rec = recorder.Recorder(self.db, '1MIN', max_rows=1000, flush_interval=1000, max_pending=3)
+        df = make_df('A', '2021-01-01 10:00', 10)
+        with self.assertLogs(level='WARNING'):
+            for i in range(10):
+                rec.record({'A': df.iloc[[i]]})
+        self.assertEqual(rec.rows, 3)
+        rec.close()
+        pd.testing.assert_frame_equal(self.db.get_entry('A', '1MIN'), df.iloc[7:], check_freq=False)
+
+if __name__ == '__main__':
+    unittest.main()
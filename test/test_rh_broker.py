@@ -1,12 +1,127 @@
+# Builtins
+import asyncio
+import sys
+import tempfile
+import time
+import types
 import unittest
-from harvest import trader, broker, algo 
+from unittest import mock
+
+# Submodule imports
+from harvest import trader, broker, algo
+
+# The Robinhood API client is replaced with a mock, so the broker can be tested without an account
+rh = mock.MagicMock()
+robin_stocks = types.ModuleType('robin_stocks')
+robin_stocks.robinhood = rh
+with mock.patch.dict(sys.modules, {'robin_stocks': robin_stocks, 'robin_stocks.robinhood': rh, 'pyotp': mock.MagicMock()}):
+    from harvest.broker import robinhood
+
+def market_data(sym, date, price, type):
+    return [[{'adjusted_mark_price': price, 'ask_price': '2.0', 'bid_price': '1.0'}]]
 
 class TestRHBroker(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        path = f"{self.dir.name}/secret.yaml"
+        with open(path, 'w') as f:
+            f.write("robin_mfa: a\nrobin_username: b\nrobin_password: c\n")
+        self.broker = robinhood.RobinhoodBroker(path)
+
+    def tearDown(self):
+        self.broker.pool.shutdown()
+        self.dir.cleanup()
+
     def test_trade(self):
         """
         Test that it can buy and sell crypto
         """
         pass
 
+    def test_instruments(self):
+        # Instruments are only saved to a file if one is given
+        self.assertIsNone(self.broker.instruments.path)
+
+    def test_failed_request(self):
+        received = []
+
+        async def handler(df_dict, timestamp):
+            received.append(df_dict)
+
+        def fetch(symbols):
+            if symbols == ['@BTC']:
+                raise Exception("Connection lost")
+            return [(s, s) for s in symbols]
+
+        # A failed request does not stop the prices of the other batches from being passed on
+        self.broker.handler = handler
+        self.broker.history_batch_size = 2
+        with mock.patch.object(self.broker, '_poll_symbols', return_value=['A', 'B', 'C', '@BTC']), \
+            mock.patch.object(self.broker, '_fetch_latest_batch', side_effect=fetch):
+            asyncio.run(self.broker._handler_async())
+        self.assertEqual(sorted(k for d in received for k in d), ['A', 'B', 'C'])
+
+    def test_deadline(self):
+        received = []
+
+        async def handler(df_dict, timestamp):
+            received.append(df_dict)
+
+        latency = {'A': 0.01, 'C': 0.05, '@BTC': 1.0}
+        def fetch(symbols):
+            time.sleep(latency[symbols[0]])
+            return [(s, s) for s in symbols]
+
+        # Prices are passed on once per tick, without waiting for requests that miss the deadline
+        self.broker.handler = handler
+        self.broker.history_batch_size = 2
+        self.broker.deadline = 0.3
+        with mock.patch.object(self.broker, '_poll_symbols', return_value=['A', 'B', 'C', '@BTC']), \
+            mock.patch.object(self.broker, '_fetch_latest_batch', side_effect=fetch):
+            start = time.time()
+            asyncio.run(self.broker._handler_async())
+            self.assertLess(time.time() - start, 0.9)
+        self.assertEqual(len(received), 1)
+        self.assertEqual(sorted(received[0]), ['A', 'B', 'C'])
+
+        # The same goes for the streamer when it runs in its own thread
+        with mock.patch.object(self.broker, '_poll_symbols', return_value=['A', 'B', 'C', '@BTC']), \
+            mock.patch.object(self.broker, '_fetch_latest_batch', side_effect=fetch), \
+            mock.patch.object(self.broker, '_dispatch') as dispatch:
+            self.broker._handler()
+        self.assertEqual(dispatch.call_count, 1)
+        self.assertEqual(sorted(dispatch.call_args.args[0]), ['A', 'B', 'C'])
+
+    def test_retries(self):
+        # A request that keeps failing is only retried by the batch request, not once more on top of it
+        with mock.patch.object(self.broker, '_history_params', side_effect=Exception("Connection lost")) as params:
+            with self.assertRaises(Exception):
+                self.broker.fetch_price_history(None, None, '5MIN', 'A')
+        self.assertEqual(params.call_count, 3)
+
+    def test_option_quotes(self):
+        positions = [
+            {'occ_symbol': 'SPY   210115C00420500', 'avg_price': 1.0, 'quantity': 2},
+            {'occ_symbol': 'SPY   210115P00400000', 'avg_price': 1.0, 'quantity': 1},
+            {'occ_symbol': 'SPY   210115C00420500', 'avg_price': 1.0, 'quantity': 1},
+        ]
+        with mock.patch.object(robinhood.rh, 'get_option_market_data', side_effect=market_data) as get:
+            # Each contract is requested once, even if it is held in several positions
+            self.broker.update_option_positions(positions)
+            self.assertEqual(sorted(c.args[2] for c in get.call_args_list), ['400.0', '420.5'])
+            self.assertEqual(positions[0]['current_price'], 420.5)
+            self.assertEqual(positions[0]['market_value'], 841.0)
+
+            # Quotes of held options are reused for the rest of the tick
+            quote = self.broker.fetch_option_market_data('SPY   210115P00400000')
+            self.assertEqual(quote, {'price': 400.0, 'ask': 2.0, 'bid': 1.0})
+            self.assertEqual(get.call_count, 2)
+
+            # Exiting the tick clears the quotes, so they are requested again
+            self.broker.exit()
+            self.assertEqual(self.broker.option_quotes, {})
+            self.broker.fetch_option_market_data('SPY   210115P00400000')
+            self.assertEqual(get.call_count, 3)
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -1,7 +1,13 @@
 # Builtins
+import asyncio
+import tempfile
+import threading
 import unittest
 import datetime as dt
 
+# External libraries
+import pandas as pd
+
 # Submodule imports
 from harvest import trader
 from harvest.broker.dummy import DummyBroker
@@ -13,7 +19,197 @@ class TestTrader(unittest.TestCase):
 		t.add_symbol('A')
 		self.assertEqual(t.watch[0], 'A')
 
+	def test_fetch_history(self):
+		index = pd.date_range('2021-01-01 10:00', periods=10, freq='5T', tz='UTC')
+		history = pd.DataFrame({'open': 1.0, 'high': 2.0, 'low': 0.5, 'close': range(10), 'volume': 10.0}, index=index, dtype=float)
+		history.columns = pd.MultiIndex.from_product([['A'], history.columns])
+		calls = []
+		available = [index[5]]
+
+		class Streamer(DummyBroker):
+			def fetch_price_history(self, last, today, interval='5MIN', symbol=None):
+				calls.append(last)
+				return history.loc[last:available[0]]
+
+		with tempfile.TemporaryDirectory() as path:
+			t = trader.Trader(Streamer(), db_path=path)
+			t.watch = ['A']
+			t.aggregations = []
+			t._queue_init('5MIN')
+			pd.testing.assert_frame_equal(t.queue.get_symbol_interval('A', '5MIN'), history.iloc[:6], check_freq=False)
+
+			# On restart, only candles from the last saved one onwards are fetched
+			available[0] = index[-1]
+			t = trader.Trader(Streamer(), db_path=path)
+			t.watch = ['A']
+			t.aggregations = []
+			t._queue_init('5MIN')
+			self.assertEqual(calls[-1], index[5])
+			pd.testing.assert_frame_equal(t.queue.get_symbol_interval('A', '5MIN'), history, check_freq=False)
+			self.assertEqual(len(t.db.get_entry('A', '5MIN')), 10)
+
+			# Only the history window of the streamer is loaded from the saved history,
+			# and candles the streamer returns from before the last saved one are not saved again
+			class Windowed(Streamer):
+				def history_window(self, interval):
+					return dt.timedelta(minutes=15)
+
+				def fetch_price_history(self, last, today, interval='5MIN', symbol=None):
+					calls.append(last)
+					return history
+			t = trader.Trader(Windowed(), db_path=path)
+			t.watch = ['A']
+			t.aggregations = []
+			segments = len(t.db._read_manifest('A', '5MIN')['segments'])
+			t._queue_init('5MIN')
+			pd.testing.assert_frame_equal(t.queue.get_symbol_interval('A', '5MIN'), history.iloc[6:], check_freq=False)
+			manifest = t.db._read_manifest('A', '5MIN')
+			self.assertEqual(manifest['segments'][-1]['rows'], 1)
+			self.assertEqual(len(manifest['segments']), segments + 1)
+
+		# Price history is only saved if a path is given
+		self.assertIsNone(trader.Trader(Streamer()).db)
+
+	def test_history_batch(self):
+		batches = []
+
+		class Streamer(DummyBroker):
+			history_batch_size = 2
+
+			def fetch_price_history(self, last, today, interval='5MIN', symbol=None):
+				index = pd.date_range('2021-01-01 10:00', periods=3, freq='5T', tz='UTC')
+				df = pd.DataFrame({'open': 1.0, 'high': 2.0, 'low': 0.5, 'close': 1.5, 'volume': 10.0}, index=index)
+				df.columns = pd.MultiIndex.from_product([[symbol], df.columns])
+				return df
+
+			def fetch_price_history_batch(self, last, today, interval='5MIN', symbols=[]):
+				batches.append(list(symbols))
+				return super().fetch_price_history_batch(last, today, interval, symbols)
+
+		t = trader.Trader(Streamer(), db_path=None)
+		t.watch = ['A', 'B', 'C', 'D', 'E']
+		t.aggregations = []
+		t._queue_init('5MIN')
+		self.assertEqual(batches, [['A', 'B'], ['C', 'D'], ['E']])
+		for sym in t.watch:
+			self.assertFalse(t.queue.get_symbol_interval(sym, '5MIN').empty)
+
+	def test_handler_timeout(self):
+		index = pd.date_range('2021-01-04 15:00', periods=3, freq='5T', tz='UTC')
+		def candle(sym, i):
+			df = pd.DataFrame({'open': 1.0, 'high': 2.0, 'low': 0.5, 'close': 1.5, 'volume': 10.0}, index=index[i:i + 1])
+			df.columns = pd.MultiIndex.from_product([[sym], df.columns])
+			return df
+
+		# The timeout defaults to how long the data of the streamer takes to arrive
+		self.assertEqual(trader.Trader(DummyBroker()).timeout_period, DummyBroker.fetch_timeout)
+		t = trader.Trader(DummyBroker(), db_path=None, timeout=0.05)
+		t.watch = ['A', '@B']
+		t.fetch_interval = '5MIN'
+		t.timestamp = index[0]
+		t.blocker = {'A': False, '@B': False}
+		t.block_queue = {}
+		t.needed = t.watch.copy()
+		for sym in t.watch:
+			t.queue.init_symbol(sym, '5MIN')
+			t.queue.set_symbol_interval(sym, '5MIN', candle(sym, 0))
+			t.queue.set_symbol_interval_update(sym, '5MIN', index[0])
+		received = []
+
+		async def handler_main(df_dict):
+			received.append(df_dict)
+		t.handler_main = handler_main
+
+		async def run():
+			t.main_lock = asyncio.Lock()
+			# Data of all symbols is passed on together
+			await t.handler({'A': candle('A', 1)}, index[1])
+			self.assertEqual(received, [])
+			await t.handler({'@B': candle('@B', 1)}, index[1])
+			self.assertEqual(sorted(received[-1]), ['@B', 'A'])
+
+			# If data is missing, the rest is passed on once the timeout runs out
+			await t.handler({'A': candle('A', 2)}, index[2])
+			self.assertEqual(len(received), 1)
+			await asyncio.sleep(0.2)
+			self.assertEqual(len(received), 2)
+			self.assertEqual(received[-1]['@B'].index[-1], index[0])
+
+			# Late data is dropped
+			await t.handler({'@B': candle('@B', 1)}, index[1])
+			self.assertEqual(len(received), 2)
+
+			# Data that misses the timeout is added to the queue, without passing the data on again
+			await t.handler({'@B': candle('@B', 2)}, index[2])
+			self.assertEqual(len(received), 2)
+			self.assertEqual(t.queue.get_symbol_interval_update('@B', '5MIN'), index[2])
+			await asyncio.sleep(0.2)
+			self.assertEqual(len(received), 2)
+
+		asyncio.run(run())
+
+	def test_handler_main(self):
+		index = pd.date_range('2021-01-04 15:00', periods=2, freq='5T', tz='UTC')
+		threads = []
+
+		class Broker(DummyBroker):
+			def fetch_account(self):
+				threads.append(threading.current_thread())
+				return super().fetch_account()
+
+		t = trader.Trader(Broker(), db_path=None)
+		t.watch = ['A']
+		t.fetch_interval = t.interval = '5MIN'
+		t.load_watch = False
+		t.timestamp_prev = t.timestamp = index[1]
+		t.queue.init_symbol('A', '5MIN')
+		t.queue.set_symbol_interval('A', '5MIN', pd.DataFrame())
+		t.queue.set_symbol_interval_update('A', '5MIN', index[0])
+		called = []
+
+		class Algo:
+			def handler(self, meta):
+				called.append(meta)
+		t.algo = Algo()
+
+		# Calls to the broker do not run in the thread of the event loop
+		df = pd.DataFrame({'open': 1.0, 'high': 2.0, 'low': 0.5, 'close': 1.5, 'volume': 10.0}, index=index[1:])
+		df.columns = pd.MultiIndex.from_product([['A'], df.columns])
+		asyncio.run(t.handler_main({'A': df}))
+		self.assertEqual(len(threads), 1)
+		self.assertIsNot(threads[0], threading.current_thread())
+		self.assertEqual(called, [{'new_day': False}])
+
+	def test_queue_init(self):
+		# Each request waits until as many are running as there are workers, which only
+		# happens if they run at the same time
+		barrier = threading.Barrier(3)
+		lock = threading.Lock()
+		active = []
+		peak = []
+
+		class Streamer(DummyBroker):
+			def fetch_price_history(self, last, today, interval='5MIN', symbol=None):
+				with lock:
+					active.append(symbol)
+					peak.append(len(active))
+				barrier.wait(timeout=10)
+				index = pd.date_range('2021-01-01 10:00', periods=12, freq='5T', tz='UTC')
+				df = pd.DataFrame({'open': 1.0, 'high': 2.0, 'low': 0.5, 'close': 1.5, 'volume': 10.0}, index=index)
+				df.columns = pd.MultiIndex.from_product([[symbol], df.columns])
+				with lock:
+					active.remove(symbol)
+				return df
 
+		t = trader.Trader(Streamer(), db_path=None, workers=3)
+		t.watch = ['A', 'B', 'C', 'D', 'E', 'F']
+		t.aggregations = ['30MIN']
+		t._queue_init('5MIN')
+		self.assertEqual(max(peak), 3)
+		for sym in t.watch:
+			self.assertEqual(len(t.queue.get_symbol_interval(sym, '5MIN')), 12)
+			df = t.queue.get_symbol_interval(sym, '30MIN')
+			self.assertEqual(list(df[sym]['volume']), [60.0, 60.0])
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file